@@ -1,12 +1,42 @@
 from django.contrib import admin
-from .models import UserProfile
+from .models import ProfilingTarget, RevokedToken, ShardAssignment, UserProfile
 
 # Register your models here.
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'starting_balance', 'created_at', 'updated_at']
+    list_select_related = ['user']
     list_filter = ['created_at', 'updated_at']
     search_fields = ['user__username', 'user__email']
     readonly_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
+
+
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+    list_display = ['user', 'token_type', 'jti', 'revoked_at', 'expires_at']
+    list_select_related = ['user']
+    list_filter = ['token_type', 'revoked_at']
+    search_fields = ['user__username', 'jti']
+    readonly_fields = ['revoked_at']
+    ordering = ['-revoked_at']
+
+
+@admin.register(ShardAssignment)
+class ShardAssignmentAdmin(admin.ModelAdmin):
+    list_display = ['user', 'database', 'assigned_at']
+    list_select_related = ['user']
+    list_filter = ['database']
+    search_fields = ['user__username']
+    readonly_fields = ['assigned_at']
+    ordering = ['-assigned_at']
+
+
+@admin.register(ProfilingTarget)
+class ProfilingTargetAdmin(admin.ModelAdmin):
+    list_display = ['user', 'remaining', 'expires_at', 'armed_by', 'armed_at']
+    list_select_related = ['user', 'armed_by']
+    search_fields = ['user__username']
+    readonly_fields = ['armed_at']
+    ordering = ['-armed_at']
@@ -0,0 +1,269 @@
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from budget_api.sharding import sharding_enabled
+from .models import RevokedToken, UserProfile
+from .tokens import InvalidToken, read_token, user_from_claims
+
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10000,  # Size of the in-process LRU
+    'TTL': 60,  # Seconds an entry is served from the in-process LRU
+    'SHARED_CACHE_ALIAS': None,  # Django cache shared by all processes, e.g. 'default'
+    'SHARED_TTL': 300,  # Seconds an entry is kept in the shared cache
+}
+
+
+def _fields(instance):
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+
+
+def _from_fields(model, values):
+    return model.from_db('default', list(values), list(values.values()))
+
+
+def snapshot(token):
+    """Plain copy of a token, its user and the user's profile"""
+    try:
+        profile = _fields(token.user.profile)
+    except UserProfile.DoesNotExist:
+        profile = None
+    return {'token': _fields(token), 'user': _fields(token.user), 'profile': profile}
+
+
+def restore(data):
+    """Build fresh token, user and profile instances from a snapshot without querying"""
+    user = _from_fields(User, data['user'])
+    if data['profile'] is not None:
+        user.profile = _from_fields(UserProfile, data['profile'])
+    token = _from_fields(Token, data['token'])
+    token.user = user
+    return token
+
+
+class TokenCache:
+    """
+    Token key -> user and profile snapshot cache.
+
+    Entries live in a bounded in-process LRU for TTL seconds and, when a
+    shared cache alias is configured, in that Django cache for SHARED_TTL
+    seconds so other processes can reuse them. Invalidation clears both,
+    but other processes' LRUs can serve an entry for up to TTL seconds
+    after a change; stats() reports the oldest entry age actually served.
+    """
+
+    def __init__(self, options=None):
+        options = {**DEFAULTS, **(options or {})}
+        self.max_entries = options['MAX_ENTRIES']
+        self.ttl = options['TTL']
+        self.shared_ttl = options['SHARED_TTL']
+        self.shared = caches[options['SHARED_CACHE_ALIAS']] if options['SHARED_CACHE_ALIAS'] else None
+        self.entries = OrderedDict()  # key -> (snapshot, cached_at)
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(
+            ['hits', 'shared_hits', 'misses', 'expired', 'evictions', 'invalidations'], 0
+        )
+        self.max_served_age = 0.0
+
+    @staticmethod
+    def shared_key(key):
+        return f'auth-token:{key}'
+
+    def get(self, key):
+        """Return a fresh Token instance for key, or None on a miss"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                data, cached_at = entry
+                age = now - cached_at
+                if age < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    self.max_served_age = max(self.max_served_age, age)
+                    return restore(data)
+                del self.entries[key]
+                self.counters['expired'] += 1
+
+        data = self.shared.get(self.shared_key(key)) if self.shared else None
+        if data is None:
+            with self.lock:
+                self.counters['misses'] += 1
+            return None
+
+        with self.lock:
+            self.counters['shared_hits'] += 1
+        self._store_local(key, data)
+        return restore(data)
+
+    def set(self, key, token):
+        data = snapshot(token)
+        self._store_local(key, data)
+        if self.shared:
+            self.shared.set(self.shared_key(key), data, self.shared_ttl)
+
+    def _store_local(self, key, data):
+        with self.lock:
+            self.entries[key] = (data, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def invalidate(self, *keys):
+        """Forget the given token keys in this process and the shared cache"""
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+            self.counters['invalidations'] += len(keys)
+        if self.shared and keys:
+            self.shared.delete_many([self.shared_key(key) for key in keys])
+
+    def invalidate_user(self, user_id):
+        """Forget every token of a user"""
+        with self.lock:
+            keys = [key for key, (data, _) in self.entries.items() if data['user']['id'] == user_id]
+        if self.shared:
+            keys = set(keys) | set(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+        self.invalidate(*keys)
+
+    def clear(self):
+        """Empty the in-process LRU; shared entries expire on their own"""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['shared_hits'] + self.counters['misses']
+            return {
+                **self.counters,
+                'size': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'shared': self.shared is not None,
+                'hit_rate': (self.counters['hits'] + self.counters['shared_hits']) / lookups if lookups else 0.0,
+                'max_served_age': self.max_served_age,
+            }
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    """The process-wide token cache, configured from settings.AUTH_TOKEN_CACHE"""
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenCache(getattr(settings, 'AUTH_TOKEN_CACHE', None))
+    return _token_cache
+
+
+@receiver(setting_changed)
+def reset_token_cache(setting, **kwargs):
+    """Rebuild the token cache when its settings change (e.g. in tests)"""
+    global _token_cache
+    if setting == 'AUTH_TOKEN_CACHE':
+        _token_cache = None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the token's user and profile.
+
+    A cache hit needs no database queries. Entries are invalidated on
+    logout/token deletion and on any User or UserProfile save.
+    """
+
+    @staticmethod
+    def token_queryset(key):
+        queryset = Token.objects.filter(key=key)
+        if sharding_enabled():
+            # The profile lives on the user's shard, out of reach of a join
+            return queryset.select_related('user').prefetch_related('user__profile')
+        return queryset.select_related('user__profile')
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        token = cache.get(key)
+        if token is None:
+            token = self.remember(key, self.token_queryset(key).first())
+        return self.check(token)
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views; the database is only read on a cache miss"""
+        key = self.get_key(request)
+        if key is None:
+            return None
+        cache = get_token_cache()
+        token = cache.get(key)
+        if token is None:
+            token = self.remember(key, await self.token_queryset(key).afirst())
+        return self.check(token)
+
+    def get_key(self, request):
+        """The token key of the Authorization header, or None for other schemes"""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+
+    @staticmethod
+    def remember(key, token):
+        """Cache a token loaded from the database"""
+        if token is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        if token.user.is_active:
+            get_token_cache().set(key, token)
+        return token
+
+    @staticmethod
+    def check(token):
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return (token.user, token)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authentication with signed access tokens: "Authorization: Bearer <token>".
+
+    The signature and expiry are verified without a database lookup and
+    revocation is checked against the in-memory denylist. request.user only
+    has its id and username loaded; request.auth holds the token claims.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+
+        try:
+            claims = read_token(auth[1].decode(), RevokedToken.TokenType.ACCESS)
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        except InvalidToken as e:
+            raise exceptions.AuthenticationFailed(str(e))
+        return (user_from_claims(claims), claims)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views; the denylist may reload from the database"""
+        return await sync_to_async(self.authenticate)(request)
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 09:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_shardassignment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilingTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('remaining', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('armed_at', models.DateTimeField(auto_now=True)),
+                ('armed_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profiling_target', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Profiling Target',
+                'verbose_name_plural': 'Profiling Targets',
+            },
+        ),
+    ]
@@ -1,7 +1,22 @@
-from django.db import models
+import time
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from budget_api.sharding import (
+    UserShardedManager, atomic_for, clear_shard_assignments, ensure_user_stub, reserve_id_range, shard_for,
+)
+
+# Categories every new user starts with, unless settings.DEFAULT_CATEGORIES says otherwise
+DEFAULT_CATEGORIES = [
+    {'name': 'Car', 'type': 'expense'},
+    {'name': 'Food', 'type': 'expense'},
+    {'name': 'Clothes', 'type': 'expense'},
+    {'name': 'Salary', 'type': 'income'},
+]
 
 # Create your models here.
 
@@ -12,42 +27,164 @@ class UserProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = UserShardedManager()
+    
     class Meta:
         verbose_name = "User Profile"
         verbose_name_plural = "User Profiles"
     
     def __str__(self):
         return f"{self.user.username} - Starting Balance: ${self.starting_balance}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+    
+    def has_changed(self):
+        """Whether a field differs from the values last loaded from or saved to the database"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(getattr(self, name) != value for name, value in loaded.items())
+
+
+class RevokedToken(models.Model):
+    """Revoked signed access or refresh token, kept until it would have expired"""
+
+    class TokenType(models.TextChoices):
+        ACCESS = 'access', 'Access'
+        REFRESH = 'refresh', 'Refresh'
+
+    jti = models.CharField(max_length=32, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='revoked_tokens')
+    token_type = models.CharField(max_length=10, choices=TokenType.choices)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Revoked Token"
+        verbose_name_plural = "Revoked Tokens"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.token_type} {self.jti}"
+
+
+class ShardAssignment(models.Model):
+    """Database holding a user's sharded rows, overriding the hash-based placement"""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='shard_assignment')
+    database = models.CharField(max_length=100)
+    assigned_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Shard Assignment"
+        verbose_name_plural = "Shard Assignments"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.database}"
+
+
+class ProfilingTarget(models.Model):
+    """Staff request to profile the next requests of a user (see budget_api.profiling)"""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profiling_target')
+    remaining = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    armed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    armed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Profiling Target"
+        verbose_name_plural = "Profiling Targets"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.remaining}"
 
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Create UserProfile and default categories when a new User is created"""
-    if created:
-        # Create user profile
+    if not created:
+        return
+    
+    # Import Category model here to avoid circular imports
+    from api.models import Category, DataVersion
+    
+    default_categories = getattr(settings, 'DEFAULT_CATEGORIES', DEFAULT_CATEGORIES)
+    with atomic_for(instance):
+        # The user's rows on another shard reference a local copy of the user
+        ensure_user_stub(instance)
+        # Versions start from the clock, newer than any cache entry of a reused id
+        DataVersion.objects.create(user=instance, version=time.time_ns(), changed_at=timezone.now())
         UserProfile.objects.create(user=instance)
-        
-        # Import Category model here to avoid circular imports
-        from api.models import Category
-        
-        # Create default categories
-        default_categories = [
-            {'name': 'Car', 'type': 'expense'},
-            {'name': 'Food', 'type': 'expense'},
-            {'name': 'Clothes', 'type': 'expense'},
-            {'name': 'Salary', 'type': 'income'},
-        ]
-        
-        for category_data in default_categories:
-            Category.objects.create(
-                user=instance,
-                name=category_data['name'],
-                type=category_data['type']
-            )
+        # One INSERT; nothing of a new user is cached yet
+        Category.objects.bulk_create([
+            Category(user=instance, name=category_data['name'], type=category_data['type'])
+            for category_data in default_categories
+        ])
+
+
+@receiver(post_save, sender=User)
+def save_user_profile(sender, instance, created, **kwargs):
+    """Save the user's loaded profile along with the User if it was changed"""
+    # A profile that was never loaded through this user cannot have been changed through it
+    if created or not User.profile.related.is_cached(instance):
+        return
+    profile = User.profile.related.get_cached_value(instance)
+    if profile is not None and profile.has_changed():
+        profile.save()
+
+
+@receiver(pre_delete, sender=User)
+def remember_user_shard(sender, instance, using, **kwargs):
+    """Note the shard of a deleted user before the cascade removes their ShardAssignment"""
+    instance._shard = shard_for(instance) if using == DEFAULT_DB_ALIAS else None
+
+
+@receiver(post_delete, sender=User)
+def delete_user_shard_rows(sender, instance, using, **kwargs):
+    """Cascade a user deletion to their shard by deleting the user's stub there"""
+    shard = getattr(instance, '_shard', None)
+    if shard is not None and shard != using:
+        User.objects.using(shard).filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=ShardAssignment)
+@receiver(post_delete, sender=ShardAssignment)
+def reload_shard_assignments(sender, **kwargs):
+    """Route a moved user to their new shard right away in this process"""
+    clear_shard_assignments()
+
+
+@receiver(post_migrate)
+def reserve_shard_id_range(sender, using, **kwargs):
+    """Keep ids unique across shards so users can move between them"""
+    reserve_id_range(using)
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Save UserProfile when User is saved"""
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """Drop cached authentication of a changed user (e.g. deactivated or new password)"""
+    from .authentication import get_token_cache
+    get_token_cache().invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_tokens(sender, instance, **kwargs):
+    """Drop cached authentication holding a stale profile"""
+    from .authentication import get_token_cache
+    get_token_cache().invalidate_user(instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Drop cached authentication of a deleted token (logout)"""
+    from .authentication import get_token_cache
+    get_token_cache().invalidate(instance.key)
@@ -1,11 +1,21 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 import json
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+from django.core import signing
+from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from api.models import Category
+from .authentication import TokenCache, get_token_cache
+from .models import RevokedToken, UserProfile
+from .tokens import get_denylist, issue_token, revoke_token
 
 
 class AccountsTestCase(APITestCase):
@@ -261,6 +271,9 @@ class AuthInfoTestCase(AccountsTestCase):
         self.assertIn('login', response.data['endpoints'])
         self.assertIn('logout', response.data['endpoints'])
         self.assertIn('profile', response.data['endpoints'])
+        self.assertIn('token', response.data['endpoints'])
+        self.assertIn('token_refresh', response.data['endpoints'])
+        self.assertIn('token_revoke', response.data['endpoints'])
 
 
 class SerializerTestCase(TestCase):
@@ -434,3 +447,247 @@ class UserProfileTestCase(TestCase):
         
         # Categories should be different between users
         self.assertEqual(len(user1_category_ids.intersection(user2_category_ids)), 0)
+    
+    def test_signup_inserts_categories_at_once(self):
+        """Test that signup inserts the profile, the data version and all default categories with one query each"""
+        with CaptureQueriesContext(connection) as queries:
+            User.objects.create_user(username='testuser', password='testpass123')
+        inserts = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 4)
+        self.assertFalse(any(query['sql'].startswith('UPDATE') for query in queries.captured_queries))
+    
+    @override_settings(DEFAULT_CATEGORIES=[{'name': 'Rent', 'type': 'expense'}, {'name': 'Wages', 'type': 'income'}])
+    def test_default_categories_setting(self):
+        """Test that the default categories come from settings.DEFAULT_CATEGORIES"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.assertEqual(
+            sorted(user.categories.values_list('name', 'type')), [('Rent', 'expense'), ('Wages', 'income')]
+        )
+    
+    def test_unchanged_profile_is_not_saved(self):
+        """Test that saving a user only saves their profile when it changed"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        user = User.objects.select_related('profile').get(pk=user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+        self.assertEqual(len(queries.captured_queries), 1)
+        
+        user.profile.starting_balance = Decimal('250.00')
+        user.save()
+        self.assertEqual(UserProfile.objects.get(user=user).starting_balance, Decimal('250.00'))
+
+
+class CachedTokenAuthenticationTestCase(AccountsTestCase):
+    """Test cases for the cached token authentication"""
+
+    def setUp(self):
+        super().setUp()
+        get_token_cache().clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cache_hit_needs_no_auth_queries(self):
+        """Test that a repeated request skips the token and profile lookups"""
+        self.client.get(self.profile_url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.profile_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], 'existinguser')
+        self.assertEqual(get_token_cache().stats()['hits'], 1)
+
+    def test_logout_invalidates_token(self):
+        """Test that a token stops working right after logout"""
+        self.client.get(self.profile_url)
+
+        response = self.client.post(self.logout_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(self.profile_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        """Test that saving an inactive user invalidates the cached entry"""
+        self.client.get(self.profile_url)
+
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(self.profile_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_change_is_visible(self):
+        """Test that a profile save refreshes the cached profile"""
+        self.client.get(self.profile_url)
+
+        self.user.profile.starting_balance = 250
+        self.user.profile.save()
+
+        response = self.client.get(self.profile_url)
+        self.assertEqual(response.data['user']['starting_balance'], Decimal('250.00'))
+
+    def test_cached_instances_are_not_shared(self):
+        """Test that each hit returns fresh instances"""
+        cache = TokenCache()
+        cache.set(self.token.key, Token.objects.select_related('user__profile').get(key=self.token.key))
+
+        first = cache.get(self.token.key)
+        first.user.username = 'changed'
+
+        self.assertEqual(cache.get(self.token.key).user.username, 'existinguser')
+
+    def test_lru_is_bounded(self):
+        """Test that the least recently used entry is evicted"""
+        cache = TokenCache({'MAX_ENTRIES': 1})
+        other = User.objects.create_user(username='otheruser', password='pass12345')
+        other_token = Token.objects.create(user=other)
+
+        cache.set(self.token.key, self.token)
+        cache.set(other_token.key, other_token)
+
+        self.assertIsNone(cache.get(self.token.key))
+        self.assertIsNotNone(cache.get(other_token.key))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expired_entries_are_not_served(self):
+        """Test that entries older than the TTL are reloaded"""
+        cache = TokenCache({'TTL': 0})
+        cache.set(self.token.key, self.token)
+
+        self.assertIsNone(cache.get(self.token.key))
+        self.assertEqual(cache.stats()['expired'], 1)
+
+    def test_shared_cache_invalidation(self):
+        """Test that entries in the shared cache are dropped with the user"""
+        cache = TokenCache({'SHARED_CACHE_ALIAS': 'default'})
+        cache.set(self.token.key, self.token)
+        cache.clear()
+
+        self.assertEqual(cache.get(self.token.key).user.pk, self.user.pk)
+        self.assertEqual(cache.stats()['shared_hits'], 1)
+
+        cache.invalidate_user(self.user.pk)
+        cache.clear()
+        self.assertIsNone(cache.get(self.token.key))
+
+
+class SignedTokenTestCase(AccountsTestCase):
+    """Test cases for signed access and refresh tokens"""
+
+    def setUp(self):
+        super().setUp()
+        self.token_url = reverse('token_obtain')
+        self.refresh_url = reverse('token_refresh')
+        self.revoke_url = reverse('token_revoke')
+
+    def obtain(self):
+        response = self.client.post(self.token_url, {
+            'username': 'existinguser', 'password': 'existingpass123'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_obtain_and_use_access_token(self):
+        """Test that an access token authenticates API requests"""
+        tokens = self.obtain()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+
+        response = self.client.get(reverse('api:category-list-create'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['categories']), 4)
+
+    def test_verification_needs_no_queries(self):
+        """Test that authenticating with an access token does not hit the database"""
+        tokens = self.obtain()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+        get_denylist().refresh()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.auth_info_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(response.wsgi_request.user.pk)
+
+    def test_invalid_credentials(self):
+        """Test that a wrong password gets no tokens"""
+        response = self.client.post(self.token_url, {
+            'username': 'existinguser', 'password': 'wrong'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tampered_and_wrong_type_tokens_are_rejected(self):
+        """Test that only untouched access tokens authenticate"""
+        tokens = self.obtain()
+        for token in (tokens['access'][:-2] + 'xx', tokens['refresh']):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            response = self.client.get(self.profile_url)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(SIGNED_TOKENS={'ACCESS_LIFETIME': -1})
+    def test_expired_access_token_is_rejected(self):
+        """Test that an expired access token is rejected"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_token(self.user, "access")}')
+        response = self.client.get(self.profile_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_rotates_the_refresh_token(self):
+        """Test that a refresh token can be used only once"""
+        tokens = self.obtain()
+
+        response = self.client.post(self.refresh_url, {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+
+        response = self.client.post(self.refresh_url, {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_concurrent_refresh_gets_one_pair(self):
+        """Test that a refresh losing the race to revoke its token gets no new pair"""
+        tokens = self.obtain()
+
+        def revoked_concurrently(claims, token_type):
+            # A parallel refresh with the same token revokes it first
+            RevokedToken.objects.create(
+                jti=claims['jti'], user=self.user, token_type=token_type,
+                expires_at=timezone.now() + timedelta(days=1)
+            )
+            return revoke_token(claims, token_type)
+
+        with mock.patch('accounts.views.revoke_token', revoked_concurrently):
+            response = self.client.post(self.refresh_url, {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertNotIn('access', response.data)
+
+    def test_revoke(self):
+        """Test that revoked tokens stop working and are recorded in the database"""
+        tokens = self.obtain()
+        response = self.client.post(self.revoke_url, tokens, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(RevokedToken.objects.filter(user=self.user).count(), 2)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+        self.assertEqual(self.client.get(self.profile_url).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(self.refresh_url, {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_denylist_loads_revocations_from_database(self):
+        """Test that revocations made elsewhere reach the in-memory denylist"""
+        tokens = self.obtain()
+        jti = signing.loads(tokens['access'], salt='accounts.tokens.access')['jti']
+        RevokedToken.objects.create(
+            jti=jti, user=self.user, token_type='access',
+            expires_at=timezone.now() + timedelta(minutes=5)
+        )
+
+        denylist = get_denylist()
+        denylist.refresh()
+        self.assertTrue(denylist.is_revoked(jti))
+
+    def test_logout_revokes_access_token(self):
+        """Test that logging out with an access token revokes it"""
+        tokens = self.obtain()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+
+        response = self.client.post(self.logout_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(self.profile_url).status_code, status.HTTP_401_UNAUTHORIZED)
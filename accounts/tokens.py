@@ -0,0 +1,156 @@
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import RevokedToken
+
+
+DEFAULTS = {
+    'ACCESS_LIFETIME': 300,  # Seconds
+    'REFRESH_LIFETIME': 7 * 24 * 3600,  # Seconds
+    'DENYLIST_REFRESH': 5,  # Seconds between denylist reloads from the database
+}
+
+SALTS = {
+    RevokedToken.TokenType.ACCESS: 'accounts.tokens.access',
+    RevokedToken.TokenType.REFRESH: 'accounts.tokens.refresh',
+}
+
+
+class InvalidToken(Exception):
+    """A signed token that is malformed, tampered with, expired or revoked"""
+
+
+def token_settings():
+    return {**DEFAULTS, **getattr(settings, 'SIGNED_TOKENS', {})}
+
+
+def issue_token(user, token_type):
+    """Return a signed token of token_type for user"""
+    lifetime = token_settings()['ACCESS_LIFETIME' if token_type == RevokedToken.TokenType.ACCESS else 'REFRESH_LIFETIME']
+    claims = {
+        'uid': user.pk,
+        'usr': user.get_username(),
+        'jti': secrets.token_hex(16),
+        'exp': int(time.time()) + lifetime,
+    }
+    return signing.dumps(claims, salt=SALTS[token_type], compress=True)
+
+
+def issue_token_pair(user):
+    return {
+        'access': issue_token(user, RevokedToken.TokenType.ACCESS),
+        'refresh': issue_token(user, RevokedToken.TokenType.REFRESH),
+        'access_expires_in': token_settings()['ACCESS_LIFETIME'],
+    }
+
+
+def read_token(token, token_type, check_revoked=True):
+    """
+    Verify a signed token and return its claims without touching the database.
+
+    The HMAC signature and expiry are checked locally; revocation is checked
+    against the in-memory denylist.
+    """
+    try:
+        claims = signing.loads(token, salt=SALTS[token_type])
+    except signing.BadSignature:
+        raise InvalidToken('Invalid token.')
+    if claims['exp'] <= time.time():
+        raise InvalidToken('Token has expired.')
+    if check_revoked and get_denylist().is_revoked(claims['jti']):
+        raise InvalidToken('Token has been revoked.')
+    return claims
+
+
+def user_from_claims(claims):
+    """An unsaved-looking User carrying the id and username from the claims; other fields load on access"""
+    return User.from_db('default', ['id', 'username'], [claims['uid'], claims['usr']])
+
+
+def revoke_token(claims, token_type):
+    """
+    Persist the revocation and add it to this process's denylist right away.
+
+    Returns whether this call revoked the token; False when it already was,
+    e.g. by a concurrent refresh with the same token.
+    """
+    expires_at = datetime.fromtimestamp(claims['exp'], tz=dt_timezone.utc)
+    _, created = RevokedToken.objects.get_or_create(
+        jti=claims['jti'],
+        defaults={'user_id': claims['uid'], 'token_type': token_type, 'expires_at': expires_at},
+    )
+    get_denylist().add(claims['jti'], claims['exp'])
+    return created
+
+
+class Denylist:
+    """
+    In-memory set of revoked token ids, loaded incrementally from RevokedToken.
+
+    Each reload only reads rows revoked since the previous one (with some
+    overlap for transactions that commit late) and forgets ids whose tokens
+    have expired anyway, so the set stays as small as the number of live
+    revoked tokens. Revocations made by other processes take effect within
+    refresh_interval seconds.
+    """
+
+    OVERLAP = timedelta(seconds=30)
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.expiry = {}  # jti -> exp timestamp
+        self.loaded_until = None
+        self.next_refresh = 0.0
+        self.lock = threading.Lock()
+
+    def is_revoked(self, jti):
+        if time.monotonic() >= self.next_refresh:
+            self.refresh()
+        return jti in self.expiry
+
+    def add(self, jti, exp):
+        with self.lock:
+            self.expiry[jti] = exp
+
+    def refresh(self):
+        now = timezone.now()
+        rows = RevokedToken.objects.filter(expires_at__gt=now)
+        if self.loaded_until is not None:
+            rows = rows.filter(revoked_at__gte=self.loaded_until - self.OVERLAP)
+        rows = list(rows.values_list('jti', 'expires_at'))
+
+        with self.lock:
+            for jti, expires_at in rows:
+                self.expiry[jti] = expires_at.timestamp()
+            current = now.timestamp()
+            self.expiry = {jti: exp for jti, exp in self.expiry.items() if exp > current}
+            self.loaded_until = now
+            self.next_refresh = time.monotonic() + self.refresh_interval
+
+    def __len__(self):
+        return len(self.expiry)
+
+
+_denylist = None
+
+
+def get_denylist():
+    """The process-wide denylist, configured from settings.SIGNED_TOKENS"""
+    global _denylist
+    if _denylist is None:
+        _denylist = Denylist(token_settings()['DENYLIST_REFRESH'])
+    return _denylist
+
+
+@receiver(setting_changed)
+def reset_denylist(setting, **kwargs):
+    global _denylist
+    if setting == 'SIGNED_TOKENS':
+        _denylist = None
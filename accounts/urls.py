@@ -7,4 +7,7 @@ urlpatterns = [
     path('login/', views.login, name='login'),
     path('logout/', views.logout, name='logout'),
     path('profile/', views.profile, name='profile'),
+    path('token/', views.obtain_token_pair, name='token_obtain'),
+    path('token/refresh/', views.refresh_token_pair, name='token_refresh'),
+    path('token/revoke/', views.revoke_token_pair, name='token_revoke'),
 ] 
\ No newline at end of file
@@ -5,7 +5,10 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
-from .serializers import RegisterSerializer, LoginSerializer
+from django.contrib.auth.models import User
+from .models import RevokedToken
+from .serializers import RegisterSerializer, LoginSerializer, TokenRefreshSerializer, TokenRevokeSerializer
+from .tokens import InvalidToken, issue_token_pair, read_token, revoke_token
 
 
 @api_view(['POST'])
@@ -69,6 +72,13 @@ def logout(request):
     """
     Logout user (delete authentication token)
     """
+    if isinstance(request.auth, dict):
+        # Signed access token: revoke it, the refresh token goes to token/revoke/
+        revoke_token(request.auth, RevokedToken.TokenType.ACCESS)
+        return Response({
+            'message': 'Logout successful'
+        }, status=status.HTTP_200_OK)
+
     try:
         # Delete the token for the current user
         request.user.auth_token.delete()
@@ -81,6 +91,82 @@ def logout(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def obtain_token_pair(request):
+    """
+    Login user and return a signed access and refresh token pair
+    """
+    serializer = LoginSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    user = authenticate(
+        username=serializer.validated_data['username'],
+        password=serializer.validated_data['password']
+    )
+    if not user:
+        return Response({
+            'error': 'Invalid credentials'
+        }, status=status.HTTP_401_UNAUTHORIZED)
+    return Response(issue_token_pair(user), status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def refresh_token_pair(request):
+    """
+    Exchange a refresh token for a new token pair; the old refresh token is revoked
+    """
+    serializer = TokenRefreshSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        claims = read_token(serializer.validated_data['refresh'], RevokedToken.TokenType.REFRESH)
+    except InvalidToken as e:
+        return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+
+    user = User.objects.filter(pk=claims['uid'], is_active=True).first()
+    if user is None:
+        return Response({'error': 'User inactive or deleted.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    # The database is the source of truth for refreshes: only the request
+    # that inserts the revocation gets a new pair, so a refresh token cannot
+    # be replayed by concurrent requests
+    if not revoke_token(claims, RevokedToken.TokenType.REFRESH):
+        return Response({'error': 'Token has been revoked.'}, status=status.HTTP_401_UNAUTHORIZED)
+    return Response(issue_token_pair(user), status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def revoke_token_pair(request):
+    """
+    Revoke a refresh token and, optionally, its access token
+    """
+    serializer = TokenRevokeSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    revoked = []
+    for token_type in (RevokedToken.TokenType.REFRESH, RevokedToken.TokenType.ACCESS):
+        token = serializer.validated_data.get(token_type)
+        if not token:
+            continue
+        try:
+            claims = read_token(token, token_type, check_revoked=False)
+        except InvalidToken as e:
+            return Response({'error': f'{token_type}: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        revoked.append((claims, token_type))
+
+    for claims, token_type in revoked:
+        revoke_token(claims, token_type)
+    return Response({
+        'message': 'Token revoked'
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def profile(request):
@@ -111,12 +197,18 @@ def auth_info(request):
             'register': '/api/auth/register/',
             'login': '/api/auth/login/',
             'logout': '/api/auth/logout/',
-            'profile': '/api/auth/profile/'
+            'profile': '/api/auth/profile/',
+            'token': '/api/auth/token/',
+            'token_refresh': '/api/auth/token/refresh/',
+            'token_revoke': '/api/auth/token/revoke/'
         },
         'usage': {
             'register': 'POST with username, password, email',
             'login': 'POST with username, password',
             'logout': 'POST with Authorization header',
-            'profile': 'GET with Authorization header'
+            'profile': 'GET with Authorization header',
+            'token': 'POST with username, password; use the access token as "Authorization: Bearer <access>"',
+            'token_refresh': 'POST with refresh',
+            'token_revoke': 'POST with refresh and optionally access'
         }
     }, status=status.HTTP_200_OK)
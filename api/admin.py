@@ -1,9 +1,10 @@
 from django.contrib import admin
-from .models import Category, Expense
+from .models import Category, DailyBalance, DataVersion, Expense, ExpenseImport, MonthlyBalance
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'type', 'user', 'created_at']
+    list_select_related = ['user']
     list_filter = ['type', 'created_at', 'updated_at']
     search_fields = ['name', 'user__username']
     readonly_fields = ['id', 'created_at', 'updated_at']
@@ -12,7 +13,47 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(Expense)
 class ExpenseAdmin(admin.ModelAdmin):
     list_display = ['amount', 'description', 'category', 'date', 'user', 'created_at']
+    list_select_related = ['category__user', 'user']
     list_filter = ['category', 'date', 'created_at', 'updated_at']
     search_fields = ['description', 'user__username', 'category__name']
     readonly_fields = ['id', 'created_at', 'updated_at']
     ordering = ['-date']
+
+
+@admin.register(DailyBalance)
+class DailyBalanceAdmin(admin.ModelAdmin):
+    list_display = ['date', 'user', 'income_total', 'expense_total', 'income_count', 'expense_count']
+    list_select_related = ['user']
+    list_filter = ['date']
+    search_fields = ['user__username']
+    readonly_fields = ['id', 'user', 'date', 'income_total', 'expense_total', 'income_count', 'expense_count']
+    ordering = ['-date']
+
+
+@admin.register(MonthlyBalance)
+class MonthlyBalanceAdmin(admin.ModelAdmin):
+    list_display = ['month', 'user', 'closing_net']
+    list_select_related = ['user']
+    list_filter = ['month']
+    search_fields = ['user__username']
+    readonly_fields = ['id', 'user', 'month', 'closing_net']
+    ordering = ['-month']
+
+
+@admin.register(DataVersion)
+class DataVersionAdmin(admin.ModelAdmin):
+    list_display = ['user', 'version', 'changed_at']
+    list_select_related = ['user']
+    search_fields = ['user__username']
+    readonly_fields = ['user', 'version', 'changed_at']
+    ordering = ['-changed_at']
+
+
+@admin.register(ExpenseImport)
+class ExpenseImportAdmin(admin.ModelAdmin):
+    list_display = ['source', 'user', 'status', 'rows_processed', 'rows_created', 'rows_failed', 'created_at']
+    list_select_related = ['user']
+    list_filter = ['status', 'format', 'created_at']
+    search_fields = ['source', 'user__username']
+    readonly_fields = ['id', 'created_at', 'updated_at']
+    ordering = ['-created_at']
@@ -0,0 +1,138 @@
+"""
+Async versions of the hot read endpoints, for deployments behind budget_api.asgi.
+
+DRF views are sync, so under an ASGI server every request runs in a worker
+thread. These plain Django async views authenticate with the same token
+classes and query with the async ORM methods instead. Their JSON output is
+identical to the matching DRF views. Streaming, the response cache and
+conditional GET stay on the sync endpoints.
+"""
+import functools
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from .balance import acompute_period_balance
+from .pagination import InvalidCursor, KeysetPagination
+from .serializers import ExpenseSerializer
+from .views import (
+    expense_filters, fast_category_serializer, fast_expense_serializer, filters_applied,
+    parse_period, period_balance_data, wants_expanded_category,
+)
+
+
+authenticators = [authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+
+
+def json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    """Render data exactly like DRF's JSONRenderer does"""
+    return HttpResponse(
+        JSONRenderer().render(data), status=status_code, headers=headers, content_type='application/json'
+    )
+
+
+async def authenticate(request):
+    """Return the user of the first authenticator that accepts the request, or None"""
+    for authenticator in authenticators:
+        result = await authenticator.aauthenticate(request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+def async_authenticated(view):
+    """Require a valid token like IsAuthenticated, answering 401 with DRF's error body"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return json_response(
+                {'detail': f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED
+            )
+        try:
+            user = await authenticate(request)
+        except exceptions.AuthenticationFailed as e:
+            user, detail = None, e.detail
+        else:
+            detail = exceptions.NotAuthenticated.default_detail
+        if user is None:
+            return json_response(
+                {'detail': detail},
+                status.HTTP_401_UNAUTHORIZED,
+                headers={'WWW-Authenticate': authenticators[0].authenticate_header(request)},
+            )
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@async_authenticated
+async def category_list(request):
+    """Get all categories for the authenticated user"""
+    to_representation = fast_category_serializer.row_serializer()
+    rows = fast_category_serializer.rows(request.user.categories.all(), named=True)
+    return json_response({
+        'message': 'Categories retrieved successfully',
+        'categories': [to_representation(row) async for row in rows.aiterator()]
+    })
+
+
+@async_authenticated
+async def expense_list(request):
+    """Get filtered expenses for the authenticated user, optionally keyset-paginated"""
+    params = request.GET
+    if params.get('stream'):
+        return json_response(
+            {'error': 'Streaming is only available on /api/expenses/'}, status.HTTP_400_BAD_REQUEST
+        )
+
+    expand = wants_expanded_category(params)
+    expenses = request.user.expenses.filter(**expense_filters(params)).order_by('-created_at', '-id')
+    if expand:
+        expenses = expenses.select_related('category')
+    context = {'expand_category': expand}
+
+    paginator = KeysetPagination(request)
+    if paginator.is_requested():
+        try:
+            page = [expense async for expense in paginator.page_queryset(expenses).aiterator()]
+            page, next_cursor, has_more = paginator.finish_page(page)
+        except InvalidCursor as e:
+            return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+        data = {
+            'message': 'Expenses retrieved successfully',
+            'filters_applied': filters_applied(params),
+            'pagination': {
+                'limit': paginator.get_limit(),
+                'next_cursor': next_cursor,
+                'has_more': has_more
+            },
+            'expenses': ExpenseSerializer(page, many=True, context=context).data
+        }
+        if paginator.wants_total():
+            data['total_count'] = await expenses.acount()
+        return json_response(data)
+
+    if expand:
+        expenses = [ExpenseSerializer(expense, context=context).data async for expense in expenses.aiterator()]
+    else:
+        to_representation = fast_expense_serializer.row_serializer()
+        rows = fast_expense_serializer.rows(expenses, named=True)
+        expenses = [to_representation(row) async for row in rows.aiterator()]
+    return json_response({
+        'message': 'Expenses retrieved successfully',
+        'filters_applied': filters_applied(params),
+        'total_count': len(expenses),
+        'expenses': expenses
+    })
+
+
+@async_authenticated
+async def custom_period_balance(request):
+    """Get balance and expenses for a custom date range"""
+    try:
+        start_date, end_date = parse_period(request.GET)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+    totals = await acompute_period_balance(request.user, start_date, end_date)
+    return json_response(period_balance_data(request.GET, start_date, end_date, totals))
@@ -0,0 +1,217 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.db import router, transaction
+from django.db.models import IntegerField, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from accounts.models import UserProfile
+from .ledger import lock_checkpoints, sum_or_zero, ZERO
+from .models import MonthlyBalance
+
+
+def month_start(day):
+    """First day of the month containing day"""
+    return day.replace(day=1)
+
+
+def previous_month(month):
+    """First day of the month before month"""
+    if month.month == 1:
+        return month.replace(year=month.year - 1, month=12)
+    return month.replace(month=month.month - 1)
+
+
+def next_month(month):
+    """First day of the month after month"""
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def _compute_checkpoints(user, db, last_checkpoint, until_month):
+    """
+    Fill in monthly checkpoints after last_checkpoint up to and including until_month.
+
+    Uses one grouped query over the daily rollups and one bulk insert, and
+    returns the cumulative net at the end of until_month. Rollups are read
+    from db, the database the checkpoints are written to, so a lagging read
+    replica never leaks into stored values. Months after both the latest
+    rollup and the current month are not stored: their closing net is that
+    of the last stored month, and a far-future date would otherwise insert
+    a row for every month up to it. Must run under lock_checkpoints().
+    """
+    rollups = user.daily_balances.using(db).filter(date__lt=next_month(until_month))
+    closing_net = ZERO
+    if last_checkpoint is not None:
+        rollups = rollups.filter(date__gte=next_month(last_checkpoint.month))
+        closing_net = last_checkpoint.closing_net
+
+    net_per_month = {
+        row['month']: row['income'] - row['expenses']
+        for row in rollups.annotate(month=TruncMonth('date')).values('month').annotate(
+            income=sum_or_zero('income_total'),
+            expenses=sum_or_zero('expense_total'),
+        ).order_by('month')
+    }
+    store_until = min(until_month, max([*net_per_month, month_start(timezone.localdate())]))
+    if last_checkpoint is not None:
+        month = next_month(last_checkpoint.month)
+    elif net_per_month:
+        month = min(net_per_month)
+    else:
+        month = store_until
+
+    checkpoints = []
+    while month <= store_until:
+        closing_net += net_per_month.get(month, ZERO)
+        checkpoints.append(MonthlyBalance(user=user, month=month, closing_net=closing_net))
+        month = next_month(month)
+
+    # A concurrent request may have filled the same months already
+    MonthlyBalance.objects.using(db).bulk_create(checkpoints, ignore_conflicts=True)
+    return closing_net
+
+
+def _fill_checkpoints(user, checkpoints, closing_month):
+    """
+    Compute the checkpoints missing up to closing_month.
+
+    The rollups are read and the checkpoints stored in one transaction under
+    the user's checkpoint lock, so a concurrent write cannot invalidate them
+    in between. The latest checkpoint is re-read under the lock from the
+    primary: a write may have dropped it, or a replica may lag.
+    """
+    db = router.db_for_write(MonthlyBalance, instance=user)
+    with transaction.atomic(using=db):
+        lock_checkpoints(user.pk)
+        checkpoint = checkpoints.using(db).first()
+        if checkpoint is not None and checkpoint.month == closing_month:
+            return checkpoint.closing_net
+        return _compute_checkpoints(user, db, checkpoint, closing_month)
+
+
+def _latest_checkpoint(user, closing_month):
+    return user.monthly_balances.filter(month__lte=closing_month).order_by('-month')
+
+
+def net_before_month(user, month):
+    """
+    Cumulative net of all transactions before month.
+
+    Reads the checkpoint of the previous month, lazily computing any
+    checkpoints that were invalidated or never stored.
+    """
+    closing_month = previous_month(month)
+    checkpoints = _latest_checkpoint(user, closing_month)
+    checkpoint = checkpoints.first()
+    if checkpoint is not None and checkpoint.month == closing_month:
+        return checkpoint.closing_net
+    return _fill_checkpoints(user, checkpoints, closing_month)
+
+
+async def anet_before_month(user, month):
+    """Async net_before_month(); missing checkpoints are computed in a worker thread"""
+    closing_month = previous_month(month)
+    checkpoints = _latest_checkpoint(user, closing_month)
+    checkpoint = await checkpoints.afirst()
+    if checkpoint is not None and checkpoint.month == closing_month:
+        return checkpoint.closing_net
+    return await sync_to_async(_fill_checkpoints)(user, checkpoints, closing_month)
+
+
+def _to_decimal(value):
+    # The profile default is a float until the row is read back from the database
+    return UserProfile._meta.get_field('starting_balance').to_python(value)
+
+
+def starting_balance(user):
+    """The user's starting balance as a Decimal"""
+    return _to_decimal(user.profile.starting_balance)
+
+
+async def astarting_balance(user):
+    """Async starting_balance(), reading the profile only if it is not loaded yet"""
+    if type(user).profile.related.is_cached(user):
+        return starting_balance(user)
+    value = await UserProfile.objects.for_user(user).values_list('starting_balance', flat=True).aget()
+    return _to_decimal(value)
+
+
+def balance_before(user, day):
+    """Balance at the start of day: the starting balance plus every transaction before it"""
+    first_day = month_start(day)
+    balance = starting_balance(user) + net_before_month(user, first_day)
+    if day == first_day:
+        return balance
+    partial = user.daily_balances.filter(date__gte=first_day, date__lt=day).aggregate(
+        income=sum_or_zero('income_total'),
+        expenses=sum_or_zero('expense_total'),
+    )
+    return balance + partial['income'] - partial['expenses']
+
+
+def _period_totals(user, start_date, end_date):
+    """
+    Rollup queryset and aggregates summing up the period and its partial first month.
+
+    The month's part before start_date is summed separately so the balance
+    at the start of the period comes from the same query.
+    """
+    before = Q(date__lt=start_date)
+    during = Q(date__gte=start_date)
+    rollups = user.daily_balances.filter(date__gte=month_start(start_date), date__lte=end_date)
+    return rollups, {
+        'income_before': sum_or_zero('income_total', before),
+        'expenses_before': sum_or_zero('expense_total', before),
+        'period_income': sum_or_zero('income_total', during),
+        'period_expenses': sum_or_zero('expense_total', during),
+        'income_transactions': sum_or_zero('income_count', during, IntegerField()),
+        'expense_transactions': sum_or_zero('expense_count', during, IntegerField()),
+    }
+
+
+def _period_result(opening, net_before, totals):
+    balance_at_start = opening + net_before + totals['income_before'] - totals['expenses_before']
+    period_net = totals['period_income'] - totals['period_expenses']
+
+    return {
+        'balance_at_start': balance_at_start,
+        'balance_at_end': balance_at_start + period_net,
+        'period_income': totals['period_income'],
+        'period_expenses': totals['period_expenses'],
+        'period_net': period_net,
+        'income_transactions': totals['income_transactions'],
+        'expense_transactions': totals['expense_transactions'],
+        'total_transactions': totals['income_transactions'] + totals['expense_transactions'],
+    }
+
+
+def compute_period_balance(user, start_date, end_date):
+    """
+    Compute every figure of the custom period balance.
+
+    The balance at the start of the period is the nearest monthly checkpoint
+    plus a scan of the daily rollups of the partial month, which is done by
+    the same query that sums up the period. start_date and end_date are date
+    objects (inclusive). All money values are returned as Decimal.
+    """
+    net_before = net_before_month(user, month_start(start_date))
+    rollups, aggregates = _period_totals(user, start_date, end_date)
+    totals = rollups.aggregate(**aggregates)
+    return _period_result(starting_balance(user), net_before, totals)
+
+
+async def acompute_period_balance(user, start_date, end_date):
+    """
+    Async compute_period_balance().
+
+    The checkpoint lookup, the profile read and the period aggregate do not
+    depend on each other and are awaited concurrently.
+    """
+    rollups, aggregates = _period_totals(user, start_date, end_date)
+    net_before, opening, totals = await asyncio.gather(
+        anet_before_month(user, month_start(start_date)),
+        astarting_balance(user),
+        rollups.aaggregate(**aggregates),
+    )
+    return _period_result(opening, net_before, totals)
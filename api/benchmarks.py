@@ -0,0 +1,469 @@
+"""
+Seeded sample data and one request scenario per endpoint.
+
+seed_dataset() builds the same users, categories and expenses for the same
+arguments. SCENARIOS covers every route of api.urls and accounts.urls;
+each scenario's build() prepares whatever its request needs (untimed) and
+returns the request to send. Used by the benchmark_endpoints command and
+the query budget tests.
+"""
+import random
+import statistics
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from accounts import urls as accounts_urls
+from accounts.tokens import issue_token_pair
+from budget_api.middleware import count_queries
+from budget_api.profiling import get_profile_buffer
+from . import urls as api_urls
+from .ledger import record_expenses_created
+from .models import Category, Expense, ExpenseImport
+
+
+PASSWORD = 'benchmark-password'
+FIRST_DAY = date(2022, 1, 1)
+IMPORT_ROWS = 100
+BULK_ROWS = 50
+# Bulk create and import are also run this small; their budgets hold for both sizes
+SMALL_BATCH_ROWS = 5
+
+
+def route_names():
+    """Names of every route in api.urls and accounts.urls, namespaced like reverse() expects"""
+    return [f'{api_urls.app_name}:{pattern.name}' for pattern in api_urls.urlpatterns] + [
+        pattern.name for pattern in accounts_urls.urlpatterns
+    ]
+
+
+def seed_dataset(users, expenses, years, seed=42):
+    """
+    Create users bench-0..bench-(users - 1), each with expenses spread over years.
+
+    Expenses go in with bulk_create, one batch per user, and the daily
+    rollup is filled like the bulk endpoints do. Returns the users.
+    """
+    generator = random.Random(seed)
+    days = max(int(years * 365), 1)
+    created = []
+    for index in range(users):
+        user = User.objects.create_user(username=f'bench-{index}', password=PASSWORD)
+        categories = list(user.categories.order_by('id'))
+        rows = Expense.objects.bulk_create(
+            [
+                Expense(
+                    user=user,
+                    category=generator.choice(categories),
+                    amount=Decimal(generator.randint(1, 50000)) / 100,
+                    description=f'Sample expense {i}',
+                    date=FIRST_DAY + timedelta(days=generator.randint(0, days - 1)),
+                )
+                for i in range(expenses)
+            ],
+            batch_size=1000
+        )
+        record_expenses_created(rows)
+        created.append(user)
+    return created
+
+
+class BenchmarkData:
+    """The benchmarked user and the objects the scenarios refer to"""
+
+    def __init__(self, user, years):
+        self.user = user
+        self.authorization = f'Token {Token.objects.get_or_create(user=user)[0].key}'
+        self.category = user.categories.get(name='Food')
+        self.expense = user.expenses.order_by('id').first()
+        self.expense_import = ExpenseImport.objects.create(
+            user=user, source='seed.csv', format=ExpenseImport.Format.CSV, status=ExpenseImport.Status.COMPLETED
+        )
+        self.years = years
+        # Logging out deletes the token, so it gets its own user
+        self.logout_user = User.objects.create_user(username='bench-logout', password=PASSWORD)
+        self.staff_user = User.objects.create_user(username='bench-staff', password=PASSWORD, is_staff=True)
+        self.staff_authorization = f'Token {Token.objects.create(user=self.staff_user).key}'
+        # Armed for profiling; it sends no requests, so no other scenario gets profiled
+        self.profiled_user = User.objects.create_user(username='bench-profiled', password=PASSWORD)
+        self.counter = 0
+
+    def next_number(self):
+        self.counter += 1
+        return self.counter
+
+    def headers(self):
+        return {'Authorization': self.authorization}
+
+    def period(self):
+        """A period of about five months in the middle of the data"""
+        start = FIRST_DAY + timedelta(days=int(self.years * 365) // 2)
+        return {'start_date': start.isoformat(), 'end_date': (start + timedelta(days=150)).isoformat()}
+
+
+class Scenario:
+    """One request against one route; build(data) returns the path, payload and headers"""
+
+    def __init__(self, route, method, build, status_code, variant=''):
+        self.route = route
+        self.method = method
+        self.build = build
+        self.status_code = status_code
+        self.variant = variant
+
+    @property
+    def key(self):
+        name = f'{self.method} {self.route}'
+        return f'{name} ({self.variant})' if self.variant else name
+
+    @property
+    def budget_key(self):
+        """Key of the route's entry in settings.QUERY_BUDGETS, shared by its variants"""
+        return f'{self.method} {self.route}'
+
+    def send(self, client, request):
+        """Send a request returned by build(); returns the response with any streamed body read"""
+        extra = {'format': request['format']} if 'format' in request else {}
+        response = getattr(client, self.method.lower())(
+            request['path'], request.get('data'), headers=request.get('headers', {}), **extra
+        )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def queries(self, client, data):
+        """Build and send a request; returns the number of queries it ran on every database"""
+        request = self.build(data)
+        with count_queries() as queries:
+            response = self.send(client, request)
+        assert response.status_code == self.status_code, f'{self.key} answered {response.status_code}'
+        return queries.count
+
+
+SCENARIOS = []
+
+
+def scenario(route, method='GET', status_code=200, variant=''):
+    def register(build):
+        SCENARIOS.append(Scenario(route, method, build, status_code, variant))
+        return build
+    return register
+
+
+@scenario('api:category-list-create')
+def category_list(data):
+    return {'path': reverse('api:category-list-create'), 'headers': data.headers()}
+
+
+@scenario('api:category-list-create', 'POST', 201)
+def category_create(data):
+    return {
+        'path': reverse('api:category-list-create'),
+        'data': {'name': f'Category {data.next_number()}', 'type': 'expense'},
+        'format': 'json',
+        'headers': data.headers(),
+    }
+
+
+@scenario('api:category-detail')
+def category_detail(data):
+    return {'path': reverse('api:category-detail', kwargs={'pk': data.category.pk}), 'headers': data.headers()}
+
+
+@scenario('api:category-detail', 'PUT')
+def category_update(data):
+    return {
+        'path': reverse('api:category-detail', kwargs={'pk': data.category.pk}),
+        'data': {'name': 'Food', 'type': 'expense'},
+        'format': 'json',
+        'headers': data.headers(),
+    }
+
+
+@scenario('api:category-detail', 'DELETE')
+def category_delete(data):
+    category = Category.objects.create(user=data.user, name=f'Doomed {data.next_number()}')
+    return {'path': reverse('api:category-detail', kwargs={'pk': category.pk}), 'headers': data.headers()}
+
+
+@scenario('api:category-types')
+def category_types(data):
+    return {'path': reverse('api:category-types'), 'headers': data.headers()}
+
+
+@scenario('api:expense-list-create')
+def expense_list(data):
+    return {'path': reverse('api:expense-list-create'), 'headers': data.headers()}
+
+
+@scenario('api:expense-list-create', variant='page of 50')
+def expense_page(data):
+    return {'path': reverse('api:expense-list-create'), 'data': {'limit': 50}, 'headers': data.headers()}
+
+
+@scenario('api:expense-list-create', variant='filtered, expanded')
+def expense_list_filtered(data):
+    return {
+        'path': reverse('api:expense-list-create'),
+        'data': {**data.period(), 'min_price': 100, 'expand': 'category'},
+        'headers': data.headers(),
+    }
+
+
+@scenario('api:expense-list-create', 'POST', 201)
+def expense_create(data):
+    return {
+        'path': reverse('api:expense-list-create'),
+        'data': {
+            'amount': '12.50', 'category': data.category.pk,
+            'description': f'Benchmark {data.next_number()}', 'date': data.period()['start_date'],
+        },
+        'format': 'json',
+        'headers': data.headers(),
+    }
+
+
+def bulk_create_request(data, rows):
+    day = date.fromisoformat(data.period()['start_date'])
+    return {
+        'path': reverse('api:expense-bulk-create'),
+        'data': {'expenses': [
+            {
+                'amount': f'{i + 1}.25', 'category': data.category.pk,
+                'description': f'Bulk {i}', 'date': (day + timedelta(days=i)).isoformat(),
+            }
+            for i in range(rows)
+        ]},
+        'format': 'json',
+        'headers': data.headers(),
+    }
+
+
+@scenario('api:expense-bulk-create', 'POST', 201)
+def expense_bulk_create(data):
+    return bulk_create_request(data, BULK_ROWS)
+
+
+@scenario('api:expense-bulk-create', 'POST', 201, variant=f'{SMALL_BATCH_ROWS} rows')
+def expense_bulk_create_small(data):
+    return bulk_create_request(data, SMALL_BATCH_ROWS)
+
+
+@scenario('api:expense-export-csv')
+def expense_export(data):
+    return {
+        'path': reverse('api:expense-export-csv'),
+        'data': {**data.period(), 'running_balance': 1},
+        'headers': data.headers(),
+    }
+
+
+@scenario('api:expense-breakdown')
+def expense_breakdown(data):
+    return {
+        'path': reverse('api:expense-breakdown'),
+        'data': {'period': 'month', 'by_category': 1},
+        'headers': data.headers(),
+    }
+
+
+def import_request(data, rows):
+    day = date.fromisoformat(data.period()['start_date'])
+    lines = ['date,amount,description,category,type'] + [
+        f'{(day + timedelta(days=i % 30)).isoformat()},{i + 1}.00,Imported {i},Food,expense'
+        for i in range(rows)
+    ]
+    upload = SimpleUploadedFile(f'import-{data.next_number()}.csv', '\n'.join(lines).encode())
+    return {
+        'path': reverse('api:expense-import'),
+        'data': {'file': upload},
+        'format': 'multipart',
+        'headers': data.headers(),
+    }
+
+
+@scenario('api:expense-import', 'POST', 201)
+def expense_import(data):
+    return import_request(data, IMPORT_ROWS)
+
+
+@scenario('api:expense-import', 'POST', 201, variant=f'{SMALL_BATCH_ROWS} rows')
+def expense_import_small(data):
+    return import_request(data, SMALL_BATCH_ROWS)
+
+
+@scenario('api:expense-import-status')
+def expense_import_status(data):
+    return {
+        'path': reverse('api:expense-import-status', kwargs={'pk': data.expense_import.pk}),
+        'headers': data.headers(),
+    }
+
+
+@scenario('api:expense-detail')
+def expense_detail(data):
+    return {'path': reverse('api:expense-detail', kwargs={'pk': data.expense.pk}), 'headers': data.headers()}
+
+
+@scenario('api:expense-detail', 'PUT')
+def expense_update(data):
+    return {
+        'path': reverse('api:expense-detail', kwargs={'pk': data.expense.pk}),
+        'data': {
+            'amount': str(data.expense.amount), 'category': data.expense.category_id,
+            'description': data.expense.description, 'date': data.expense.date.isoformat(),
+        },
+        'format': 'json',
+        'headers': data.headers(),
+    }
+
+
+@scenario('api:expense-detail', 'DELETE')
+def expense_delete(data):
+    expense = Expense.objects.create(
+        user=data.user, category=data.category, amount=Decimal('1.00'),
+        description='Doomed', date=date.fromisoformat(data.period()['start_date']),
+    )
+    return {'path': reverse('api:expense-detail', kwargs={'pk': expense.pk}), 'headers': data.headers()}
+
+
+@scenario('api:custom-period-balance')
+def custom_period_balance(data):
+    return {'path': reverse('api:custom-period-balance'), 'data': data.period(), 'headers': data.headers()}
+
+
+@scenario('api:async-category-list')
+def async_category_list(data):
+    return {'path': reverse('api:async-category-list'), 'headers': data.headers()}
+
+
+@scenario('api:async-expense-list')
+def async_expense_list(data):
+    return {'path': reverse('api:async-expense-list'), 'headers': data.headers()}
+
+
+@scenario('api:async-custom-period-balance')
+def async_custom_period_balance(data):
+    return {'path': reverse('api:async-custom-period-balance'), 'data': data.period(), 'headers': data.headers()}
+
+
+@scenario('api:request-profile-list')
+def request_profile_list(data):
+    return {'path': reverse('api:request-profile-list'), 'headers': {'Authorization': data.staff_authorization}}
+
+
+@scenario('api:request-profile-detail')
+def request_profile_detail(data):
+    profile_id = f'bench{data.next_number()}'
+    get_profile_buffer().add({'id': profile_id, 'functions': [], 'queries': []})
+    return {
+        'path': reverse('api:request-profile-detail', kwargs={'profile_id': profile_id}),
+        'headers': {'Authorization': data.staff_authorization},
+    }
+
+
+@scenario('api:request-profile-target-list')
+def request_profile_target_list(data):
+    return {'path': reverse('api:request-profile-target-list'), 'headers': {'Authorization': data.staff_authorization}}
+
+
+@scenario('api:request-profile-target-list', 'POST', 201)
+def request_profile_arm(data):
+    return {
+        'path': reverse('api:request-profile-target-list'),
+        'data': {'user': data.profiled_user.pk, 'requests': 5, 'seconds': 60},
+        'format': 'json',
+        'headers': {'Authorization': data.staff_authorization},
+    }
+
+
+@scenario('api:request-profile-target-detail', 'DELETE')
+def request_profile_disarm(data):
+    return {
+        'path': reverse('api:request-profile-target-detail', kwargs={'user_id': data.profiled_user.pk}),
+        'headers': {'Authorization': data.staff_authorization},
+    }
+
+
+@scenario('auth_info')
+def auth_info(data):
+    return {'path': reverse('auth_info')}
+
+
+@scenario('register', 'POST', 201)
+def register(data):
+    return {
+        'path': reverse('register'),
+        'data': {'username': f'bench-new-{data.next_number()}', 'password': PASSWORD},
+        'format': 'json',
+    }
+
+
+@scenario('login', 'POST')
+def login(data):
+    return {'path': reverse('login'), 'data': {'username': data.user.username, 'password': PASSWORD}, 'format': 'json'}
+
+
+@scenario('logout', 'POST')
+def logout(data):
+    Token.objects.filter(user=data.logout_user).delete()
+    token = Token.objects.create(user=data.logout_user)
+    return {'path': reverse('logout'), 'headers': {'Authorization': f'Token {token.key}'}}
+
+
+@scenario('profile')
+def profile(data):
+    return {'path': reverse('profile'), 'headers': data.headers()}
+
+
+@scenario('token_obtain', 'POST')
+def token_obtain(data):
+    return {
+        'path': reverse('token_obtain'),
+        'data': {'username': data.user.username, 'password': PASSWORD},
+        'format': 'json',
+    }
+
+
+@scenario('token_refresh', 'POST')
+def token_refresh(data):
+    return {'path': reverse('token_refresh'), 'data': {'refresh': issue_token_pair(data.user)['refresh']}, 'format': 'json'}
+
+
+@scenario('token_revoke', 'POST')
+def token_revoke(data):
+    return {'path': reverse('token_revoke'), 'data': {'refresh': issue_token_pair(data.user)['refresh']}, 'format': 'json'}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if fraction == 0.5:
+        return statistics.median(sorted_values)
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+# A metric only counts as regressed when it also grew by at least this much,
+# so sub-millisecond endpoints do not fail on scheduler noise
+MIN_REGRESSION = {'p50_ms': 1.0, 'p95_ms': 2.0, 'peak_kb': 64}
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Compare benchmark results with a baseline and return the regressions as messages.
+
+    Any extra query is a regression; latency and peak memory regress when
+    they grow by more than threshold (a fraction) and MIN_REGRESSION.
+    """
+    regressions = []
+    for key, current in results['endpoints'].items():
+        previous = baseline['endpoints'].get(key)
+        if previous is None:
+            continue
+        if current['queries'] > previous['queries']:
+            regressions.append(f'{key}: {previous["queries"]} -> {current["queries"]} queries')
+        for metric, floor in MIN_REGRESSION.items():
+            if current[metric] > previous[metric] * (1 + threshold) and current[metric] - previous[metric] >= floor:
+                regressions.append(f'{key}: {metric} {previous[metric]} -> {current[metric]}')
+    return regressions
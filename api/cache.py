@@ -0,0 +1,165 @@
+import functools
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+from budget_api.routers import primary_reads, reading_from_replica
+from budget_api.sharding import shard_for
+from .models import DataVersion
+
+
+DEFAULTS = {
+    'ENABLED': True,  # False turns off both caching and conditional GET
+    'ALIAS': 'default',
+    'TIMEOUT': 300,  # Seconds a cached response is kept
+}
+
+_counters = {'hits': 0, 'misses': 0}
+_counters_lock = threading.Lock()
+
+
+def cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {})}
+
+
+def get_cache():
+    return caches[cache_settings()['ALIAS']]
+
+
+def _version_rows(user_id):
+    # Always the primary: a lagging replica would hand out an old version
+    return DataVersion.objects.using(shard_for(user_id)).filter(user_id=user_id)
+
+
+def data_state(user_id):
+    """
+    (version, changed_at) of a user's data.
+
+    A missing row (user created before versions were stored, or an id
+    reused after the database was reset) starts from the current time in
+    nanoseconds, so it is always newer than any version that cached
+    responses may still be stored under.
+    """
+    state = _version_rows(user_id).values_list('version', 'changed_at').first()
+    if state is None:
+        row, _ = _version_rows(user_id).get_or_create(
+            user_id=user_id, defaults={'version': time.time_ns(), 'changed_at': timezone.now()}
+        )
+        state = row.version, row.changed_at
+    return state
+
+
+def data_version(user_id):
+    """Current data version of a user"""
+    return data_state(user_id)[0]
+
+
+def bump_data_version(user_id):
+    """
+    Invalidate every cached response of a user in O(1).
+
+    The version is stored in the database, so every worker process sees the
+    bump, and it is written in the transaction of the change: it moves
+    exactly when the new data becomes visible and is undone on rollback.
+    """
+    if not _version_rows(user_id).update(version=F('version') + 1, changed_at=timezone.now()):
+        data_state(user_id)
+
+
+def response_cache_key(request, namespace, version):
+    query = '&'.join(f'{key}={value}' for key, value in sorted(request.query_params.lists()))
+    digest = hashlib.md5(query.encode(), usedforsecurity=False).hexdigest()
+    return f'response:{namespace}:{request.user.pk}:{version}:{digest}'
+
+
+def _count(counter):
+    with _counters_lock:
+        _counters[counter] += 1
+
+
+def response_cache_stats():
+    """Hit and miss counts of the response cache in this process"""
+    with _counters_lock:
+        lookups = _counters['hits'] + _counters['misses']
+        return {**_counters, 'hit_rate': _counters['hits'] / lookups if lookups else 0.0}
+
+
+def reset_response_cache_stats():
+    with _counters_lock:
+        _counters.update(hits=0, misses=0)
+
+
+def response_etag(cache_key, media_type):
+    """Strong ETag of a cached response key rendered as media_type; it changes with the data version"""
+    return '"%s"' % hashlib.md5(f'{cache_key}:{media_type}'.encode(), usedforsecurity=False).hexdigest()
+
+
+def _set_validators(response, etag):
+    # No Last-Modified: second granularity would let a write in the same
+    # second as a client's copy answer If-Modified-Since with a wrong 304
+    response['ETag'] = etag
+    # Validators are per user: shared caches must not reuse them and clients revalidate
+    patch_vary_headers(response, ['Authorization'])
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def cache_user_response(namespace, skip_params=()):
+    """
+    Cache successful GET responses of a view per user, data version and query string.
+
+    Responses get a strong ETag derived from the stored data version, and
+    requests whose If-None-Match matches are answered with 304 before the
+    view runs, after one query reading the version. Decorates view
+    functions and, through method_decorator, view methods; it runs after
+    authentication and permission checks. Requests carrying one of skip_params (e.g.
+    streaming) are passed through untouched. Responses report X-Cache:
+    HIT or MISS.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            bypass = (
+                not cache_settings()['ENABLED']
+                or request.method != 'GET'
+                or not request.user.is_authenticated
+                or any(param in request.query_params for param in skip_params)
+            )
+            if bypass:
+                return view(request, *args, **kwargs)
+
+            version, changed_at = data_state(request.user.pk)
+            key = response_cache_key(request, namespace, version)
+            etag = response_etag(key, request.accepted_media_type)
+            run_view = view
+            if reading_from_replica() and time.time() - changed_at.timestamp() <= settings.REPLICA_PIN_SECONDS:
+                # Recent writes may not have reached the replica yet; this response
+                # is stored under the new version, so it must see them
+                run_view = primary_reads()(view)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return _set_validators(not_modified, etag)
+
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                _count('hits')
+                response = Response(data, status=status.HTTP_200_OK)
+                response['X-Cache'] = 'HIT'
+            else:
+                _count('misses')
+                response = run_view(request, *args, **kwargs)
+                response['X-Cache'] = 'MISS'
+                if not isinstance(response, Response) or response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data, cache_settings()['TIMEOUT'])
+
+            return _set_validators(response, etag)
+        return wrapper
+    return decorator
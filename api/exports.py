@@ -0,0 +1,35 @@
+from django.db.models import BooleanField, Case, Q, Value, When
+from .models import Category
+from .streaming import CHUNK_SIZE
+
+
+EXPORT_HEADER = ['id', 'date', 'description', 'category', 'type', 'amount']
+EXPORT_FIELDS = ['id', 'date', 'description', 'category__name', 'category__type', 'amount']
+
+
+def expense_export_rows(expenses):
+    """Iterate CSV rows of expenses with their category name and type, read with one joined query"""
+    return expenses.order_by('date', 'id').values_list(*EXPORT_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+
+
+def expense_export_rows_with_balance(expenses, row_filters, opening_balance):
+    """
+    Yield CSV rows with a trailing running balance column.
+
+    expenses must hold every transaction of the exported date range, since
+    each one moves the balance. Only rows matching row_filters (e.g. a
+    category or price filter) are written out; the match is computed by the
+    database in the same query.
+    """
+    if row_filters:
+        exported = Case(When(Q(**row_filters), then=Value(True)), default=Value(False), output_field=BooleanField())
+    else:
+        exported = Value(True, output_field=BooleanField())
+
+    rows = expenses.annotate(exported=exported).order_by('date', 'id').values_list(*EXPORT_FIELDS, 'exported')
+    balance = opening_balance
+    for *row, is_exported in rows.iterator(chunk_size=CHUNK_SIZE):
+        amount, category_type = row[5], row[4]
+        balance += amount if category_type == Category.CategoryType.INCOME else -amount
+        if is_exported:
+            yield row + [balance]
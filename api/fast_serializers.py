@@ -0,0 +1,143 @@
+import decimal
+from datetime import date
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+
+ISO_8601 = 'iso-8601'
+
+
+# Formatter builders take a field and return bind(tz) -> format(value), or
+# None when the field's settings need its own to_representation. Binding
+# resolves the current timezone once per serialization instead of per value.
+
+
+def _decimal_formatter(field):
+    """Precompile DecimalField.to_representation for the default (string) output"""
+    if (field.localize or field.normalize_output or field.decimal_places is None
+            or not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)):
+        return None
+
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def format_decimal(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return lambda tz: format_decimal
+
+
+def _datetime_formatter(field):
+    """Precompile DateTimeField.to_representation for ISO 8601 output of aware datetimes"""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601 or hasattr(field, 'timezone'):
+        return None
+
+    def bind(tz):
+        def format_datetime(value):
+            if value.tzinfo is None:
+                return field.to_representation(value)
+            value = value.astimezone(tz).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return format_datetime
+    return bind
+
+
+def _date_formatter(field):
+    """Precompile DateField.to_representation for ISO 8601 output"""
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return None
+    return lambda tz: date.isoformat
+
+
+def _identity_formatter(field):
+    """Values that DRF passes through unchanged"""
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is not None:
+        return None
+    return lambda tz: _identity
+
+
+def _identity(value):
+    return value
+
+
+FORMATTERS = {
+    serializers.DateTimeField: _datetime_formatter,
+    serializers.DateField: _date_formatter,
+    serializers.DecimalField: _decimal_formatter,
+    serializers.ChoiceField: _identity_formatter,
+    serializers.PrimaryKeyRelatedField: _identity_formatter,
+    serializers.IntegerField: _identity_formatter,
+    serializers.CharField: _identity_formatter,
+}
+
+
+def _formatter(field):
+    """Return a formatter binder for field, falling back to its own to_representation"""
+    for field_class in type(field).__mro__:
+        if field_class not in FORMATTERS:
+            continue
+        # Subclasses that change the representation keep their own
+        if type(field).to_representation is field_class.to_representation:
+            binder = FORMATTERS[field_class](field)
+            if binder is not None:
+                return binder
+        break
+    return lambda tz: field.to_representation
+
+
+class FastListSerializer:
+    """
+    Read-only serializer for list endpoints built on values_list() tuples.
+
+    It reads the readable fields of a ModelSerializer and precompiles one
+    formatter per field, skipping model instantiation and DRF's per-field
+    machinery. The output is identical to serializer_class(many=True).data
+    for plain model fields; fields it cannot reproduce cheaply fall back to
+    their own to_representation.
+    """
+
+    def __init__(self, serializer_class):
+        fields = [field for field in serializer_class().fields.values() if not field.write_only]
+        for field in fields:
+            if field.source == '*':
+                raise ValueError(f'Field "{field.field_name}" is not backed by a column')
+        self.field_names = [field.field_name for field in fields]
+        self.sources = [field.source.replace('.', '__') for field in fields]
+        self.binders = [_formatter(field) for field in fields]
+
+    def rows(self, queryset, named=False):
+        """
+        The values_list() queryset holding every field's source column.
+
+        Use named rows with aiterator(): plain values_list() querysets run
+        their query as soon as iteration starts, which aiterator() does in
+        the event loop.
+        """
+        return queryset.values_list(*self.sources, named=named)
+
+    def row_serializer(self):
+        """Return a function turning one values_list() tuple into the serialized dict"""
+        tz = timezone.get_current_timezone()
+        formatters = [bind(tz) for bind in self.binders]
+        field_names = self.field_names
+
+        def to_representation(row):
+            return {
+                name: None if value is None else formatter(value)
+                for name, formatter, value in zip(field_names, formatters, row)
+            }
+        return to_representation
+
+    def serialize(self, queryset):
+        """Serialize every row of queryset"""
+        to_representation = self.row_serializer()
+        return [to_representation(row) for row in self.rows(queryset)]
@@ -0,0 +1,159 @@
+import csv
+import json
+from itertools import islice
+from budget_api.sharding import atomic_for
+from .cache import bump_data_version
+from .ledger import record_expenses_created
+from .models import Category, Expense, ExpenseImport
+from .serializers import ExpenseImportRowSerializer
+
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_STORED_ERRORS = 100
+
+
+class ImportFileError(ValueError):
+    """Raised when an import file cannot be parsed"""
+
+
+def iter_rows(lines, file_format):
+    """
+    Yield one dict per transaction from a text stream.
+
+    CSV files need a header row; NDJSON files hold one JSON object per line.
+    Both use the columns date, amount, description, category and optionally
+    type (income or expense, defaulting to expense).
+    """
+    if file_format == ExpenseImport.Format.CSV:
+        for row in csv.DictReader(lines):
+            # Empty cells count as missing so optional columns fall back to defaults
+            yield {key: value for key, value in row.items() if key is not None and value not in ('', None)}
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            raise ImportFileError(f'Line {line_number} is not valid JSON')
+
+
+def detect_format(filename, requested=None):
+    """Return the import format from an explicit value or the file extension"""
+    if requested:
+        if requested not in ExpenseImport.Format.values:
+            raise ImportFileError('format must be either "csv" or "ndjson"')
+        return requested
+    if filename.lower().endswith('.csv'):
+        return ExpenseImport.Format.CSV
+    if filename.lower().endswith(('.ndjson', '.jsonl')):
+        return ExpenseImport.Format.NDJSON
+    raise ImportFileError('Cannot tell the file format, pass format=csv or format=ndjson')
+
+
+class ExpenseImporter:
+    """
+    Import transactions for one user in fixed-size chunks.
+
+    Every chunk is validated, its category names are resolved through a
+    per-import cache (missing categories are created in bulk), and its
+    expenses are inserted with bulk_create. The chunk and the import's
+    progress counters are committed together, so an interrupted import can
+    be resumed by skipping job.rows_processed input rows.
+    """
+
+    def __init__(self, job, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+        self.job = job
+        self.user = job.user
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.categories = {}  # (name, type) -> Category
+
+    def run(self, rows):
+        """Import rows, skipping the ones already committed by an earlier run"""
+        rows = iter(rows)
+        for _ in islice(rows, self.job.rows_processed):
+            pass
+
+        try:
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+                if self.progress:
+                    self.progress(self.job)
+        except Exception:
+            # Committed chunks stay, the import can be resumed from there
+            self.job.status = ExpenseImport.Status.FAILED
+            self.job.save(update_fields=['status', 'updated_at'])
+            raise
+
+        self.job.status = ExpenseImport.Status.COMPLETED
+        self.job.save(update_fields=['status', 'updated_at'])
+        return self.job
+
+    def import_chunk(self, chunk):
+        """Validate, resolve categories for and insert one chunk of rows"""
+        first_row = self.job.rows_processed + 1
+        valid_rows = []
+        errors = []
+        for offset, row in enumerate(chunk):
+            serializer = ExpenseImportRowSerializer(data=row)
+            if serializer.is_valid():
+                valid_rows.append(serializer.validated_data)
+            else:
+                errors.append({'row': first_row + offset, 'errors': serializer.errors})
+
+        with atomic_for(self.user):
+            categories_created = self.resolve_categories(valid_rows)
+            expenses = Expense.objects.bulk_create(
+                [
+                    Expense(
+                        user=self.user,
+                        category=self.categories[row['category'], row['type']],
+                        amount=row['amount'],
+                        description=row['description'],
+                        date=row['date'],
+                    )
+                    for row in valid_rows
+                ],
+                batch_size=self.chunk_size
+            )
+            record_expenses_created(expenses)
+            bump_data_version(self.user.pk)
+
+            self.job.rows_processed += len(chunk)
+            self.job.rows_created += len(expenses)
+            self.job.rows_failed += len(errors)
+            self.job.categories_created += categories_created
+            room = MAX_STORED_ERRORS - len(self.job.errors)
+            if room > 0:
+                self.job.errors = self.job.errors + errors[:room]
+            self.job.save()
+
+    def resolve_categories(self, rows):
+        """
+        Make sure every (name, type) used by rows is in the category cache.
+
+        Looks up unknown names with one query and creates the still missing
+        categories with one bulk insert. Returns the number created.
+        """
+        missing = {(row['category'], row['type']) for row in rows} - set(self.categories)
+        if not missing:
+            return 0
+
+        existing = Category.objects.for_user(self.user).filter(
+            name__in={name for name, _ in missing}
+        ).order_by('id')
+        for category in existing:
+            self.categories.setdefault((category.name, category.type), category)
+
+        to_create = [
+            Category(user=self.user, name=name, type=category_type)
+            for name, category_type in sorted(missing - set(self.categories))
+        ]
+        for category in Category.objects.bulk_create(to_create):
+            self.categories[category.name, category.type] = category
+        return len(to_create)
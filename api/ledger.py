@@ -0,0 +1,258 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, connections
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from budget_api.sharding import atomic_for, shard_for
+from .models import Category, DailyBalance, DataVersion, Expense, MonthlyBalance
+
+
+ZERO = Decimal('0.00')
+BATCH_SIZE = 1000
+ROLLUP_FIELDS = ['income_total', 'expense_total', 'income_count', 'expense_count']
+
+
+def _rollup_fields(category_type):
+    """Return the (total, count) DailyBalance fields for a category type"""
+    if category_type == Category.CategoryType.INCOME:
+        return 'income_total', 'income_count'
+    return 'expense_total', 'expense_count'
+
+
+def _normalize(values):
+    """Convert raw expense values (e.g. float amounts, string dates) to their DB types"""
+    if values is None:
+        return None
+    return {
+        'user_id': values['user_id'],
+        'date': Expense._meta.get_field('date').to_python(values['date']),
+        'amount': Expense._meta.get_field('amount').to_python(values['amount']),
+        'category__type': values['category__type'],
+    }
+
+
+def lock_checkpoints(user_id):
+    """
+    Lock the user's DataVersion row until the end of the transaction.
+
+    Writers take it before dropping checkpoints and checkpoint computation
+    before reading the rollups, so checkpoints computed from rollups that a
+    write is changing are never stored after the write dropped them. Skipped
+    where the database has no row locks (SQLite): its write transactions
+    exclude each other already.
+    """
+    db = shard_for(user_id)
+    if connections[db].features.has_select_for_update:
+        list(DataVersion.objects.using(db).select_for_update().filter(user_id=user_id).values_list('pk'))
+
+
+def invalidate_checkpoints(user_id, day=None):
+    """Drop a user's monthly checkpoints from the month of day onward (all when day is None)"""
+    lock_checkpoints(user_id)
+    checkpoints = MonthlyBalance.objects.for_user(user_id)
+    if day is not None:
+        checkpoints = checkpoints.filter(month__gte=day.replace(day=1))
+    checkpoints.delete()
+
+
+def apply_delta(user_id, day, category_type, amount, count, invalidate=True):
+    """Add amount and count to one day's rollup, creating the row if needed"""
+    if invalidate:
+        invalidate_checkpoints(user_id, day)
+    total_field, count_field = _rollup_fields(category_type)
+    updates = {
+        total_field: F(total_field) + Value(amount, output_field=DecimalField()),
+        count_field: F(count_field) + count,
+    }
+    rollups = DailyBalance.objects.for_user(user_id).filter(date=day)
+    if rollups.update(**updates) or count < 0:
+        # Nothing to subtract from when the row went away with its user
+        return
+    try:
+        with atomic_for(user_id):
+            DailyBalance.objects.create(
+                user_id=user_id, date=day, **{total_field: amount, count_field: count}
+            )
+    except IntegrityError:
+        # Another request created the row first
+        rollups.update(**updates)
+
+
+def record_expense_change(previous, expense):
+    """
+    Move an expense's contribution in the daily rollup.
+
+    previous holds the stored values before the change (None on create) and
+    expense is the saved instance (None on delete).
+    """
+    current = None
+    if expense is not None:
+        current = {
+            'user_id': expense.user_id,
+            'date': expense.date,
+            'amount': expense.amount,
+            'category__type': expense.category.type,
+        }
+    previous, current = _normalize(previous), _normalize(current)
+    if previous == current:
+        return
+
+    with atomic_for((current or previous)['user_id']):
+        if previous is not None:
+            apply_delta(previous['user_id'], previous['date'], previous['category__type'], -previous['amount'], -1)
+        if current is not None:
+            apply_delta(current['user_id'], current['date'], current['category__type'], current['amount'], 1)
+
+
+def _apply_day_deltas(user_id, day_deltas):
+    """
+    Add {date: {field: delta}} to a user's daily rollups in a few queries.
+
+    Existing rows are read (locked where the database supports it) in one
+    query per BATCH_SIZE days and written back with bulk_update; missing
+    rows are inserted with one bulk_create. Must run inside atomic_for(user_id).
+    """
+    days = sorted(day_deltas)
+    existing = {}
+    for offset in range(0, len(days), BATCH_SIZE):
+        rollups = DailyBalance.objects.for_user(user_id).select_for_update().filter(
+            date__in=days[offset:offset + BATCH_SIZE]
+        )
+        existing.update((rollup.date, rollup) for rollup in rollups)
+
+    changed, missing = [], []
+    for day in days:
+        rollup = existing.get(day)
+        if rollup is None:
+            rollup = DailyBalance(user_id=user_id, date=day)
+            missing.append(rollup)
+        else:
+            changed.append(rollup)
+        for field, delta in day_deltas[day].items():
+            setattr(rollup, field, getattr(rollup, field) + delta)
+
+    DailyBalance.objects.for_user(user_id).bulk_update(changed, ROLLUP_FIELDS, batch_size=BATCH_SIZE)
+    try:
+        with atomic_for(user_id):
+            DailyBalance.objects.bulk_create(missing, batch_size=BATCH_SIZE)
+    except IntegrityError:
+        # Another request created some of the rows first
+        for rollup in missing:
+            for field in ('income', 'expense'):
+                amount, count = getattr(rollup, f'{field}_total'), getattr(rollup, f'{field}_count')
+                if count:
+                    apply_delta(user_id, rollup.date, field, amount, count, invalidate=False)
+
+
+def record_expenses_created(expenses):
+    """
+    Add expenses inserted without signals (bulk_create) to the daily rollup.
+
+    Deltas are summed per user and day, checkpoints are invalidated once per
+    user from the earliest day, and each user's rollups are read and written
+    in bulk in a transaction on their shard, so the number of queries does
+    not grow with the number of days.
+    """
+    deltas = defaultdict(lambda: defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0)))
+    earliest = {}
+    for expense in expenses:
+        values = _normalize({
+            'user_id': expense.user_id,
+            'date': expense.date,
+            'amount': expense.amount,
+            'category__type': expense.category.type,
+        })
+        total_field, count_field = _rollup_fields(values['category__type'])
+        delta = deltas[values['user_id']][values['date']]
+        delta[total_field] += values['amount']
+        delta[count_field] += 1
+        earliest[values['user_id']] = min(values['date'], earliest.get(values['user_id'], values['date']))
+
+    for user_id, day in earliest.items():
+        with atomic_for(user_id):
+            invalidate_checkpoints(user_id, day)
+            _apply_day_deltas(user_id, deltas[user_id])
+
+
+def move_category_expenses(category, from_type, to_type):
+    """
+    Move all expenses of a category from one rollup type to another.
+
+    A to_type of None removes them from the rollup (category deletion).
+    """
+    per_day = category.expenses.values('date').annotate(total=Sum('amount'), count=Count('id'))
+    with atomic_for(category.user_id):
+        for row in per_day:
+            apply_delta(category.user_id, row['date'], from_type, -row['total'], -row['count'])
+            if to_type is not None:
+                apply_delta(category.user_id, row['date'], to_type, row['total'], row['count'])
+
+
+def sum_or_zero(field, condition=None, output_field=None):
+    """Sum of field over rows matching condition, 0 when no rows match"""
+    if output_field is None:
+        return Coalesce(
+            Sum(field, filter=condition),
+            Value(ZERO),
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        )
+    return Coalesce(Sum(field, filter=condition), Value(0), output_field=output_field)
+
+
+def expected_daily_balances(user_id):
+    """Compute a user's daily rollups from raw expenses, keyed by date"""
+    income = Q(category__type=Category.CategoryType.INCOME)
+    expense = Q(category__type=Category.CategoryType.EXPENSE)
+    rows = Expense.objects.for_user(user_id).values('date').annotate(
+        income_total=sum_or_zero('amount', income),
+        expense_total=sum_or_zero('amount', expense),
+        income_count=Count('id', filter=income),
+        expense_count=Count('id', filter=expense),
+    ).order_by('date')
+    return {
+        row['date']: (row['income_total'], row['expense_total'], row['income_count'], row['expense_count'])
+        for row in rows
+    }
+
+
+def stored_daily_balances(user_id):
+    """Return a user's stored non-empty daily rollups, keyed by date"""
+    rows = DailyBalance.objects.for_user(user_id).exclude(
+        income_count=0, expense_count=0
+    ).values_list('date', 'income_total', 'expense_total', 'income_count', 'expense_count')
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def rebuild_daily_balances(user_id):
+    """Replace a user's daily rollups with ones computed from raw expenses"""
+    expected = expected_daily_balances(user_id)
+    with atomic_for(user_id):
+        invalidate_checkpoints(user_id)
+        DailyBalance.objects.for_user(user_id).delete()
+        DailyBalance.objects.bulk_create(
+            [
+                DailyBalance(
+                    user_id=user_id,
+                    date=day,
+                    income_total=income_total,
+                    expense_total=expense_total,
+                    income_count=income_count,
+                    expense_count=expense_count,
+                )
+                for day, (income_total, expense_total, income_count, expense_count) in expected.items()
+            ],
+            batch_size=BATCH_SIZE
+        )
+    return len(expected)
+
+
+def verify_daily_balances(user_id):
+    """Return (date, expected, stored) for every day whose rollup is wrong"""
+    expected = expected_daily_balances(user_id)
+    stored = stored_daily_balances(user_id)
+    empty = (ZERO, ZERO, 0, 0)
+    return [
+        (day, expected.get(day, empty), stored.get(day, empty))
+        for day in sorted(set(expected) | set(stored))
+        if expected.get(day, empty) != stored.get(day, empty)
+    ]
@@ -0,0 +1,184 @@
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from api.ledger import record_expenses_created
+from api.models import Expense
+
+
+ENDPOINTS = [
+    ('categories', 'api:category-list-create', 'api:async-category-list', ''),
+    ('expenses', 'api:expense-list-create', 'api:async-expense-list', 'min_price=100'),
+    ('balance', 'api:custom-period-balance', 'api:async-custom-period-balance',
+     'start_date=2022-03-10&end_date=2023-06-20'),
+]
+
+
+def wsgi_get(application, path, query, authorization):
+    """Call a WSGI application like a server would and return the status code"""
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'HTTP_HOST': 'localhost',
+        'HTTP_AUTHORIZATION': authorization,
+        'wsgi.input': BytesIO(),
+    }
+    setup_testing_defaults(environ)
+    statuses = []
+    body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(body)
+    body.close()
+    return int(statuses[0].split()[0])
+
+
+async def asgi_get(application, path, query, authorization):
+    """Call an ASGI application like a server would and return the status code"""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'authorization', authorization.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Django listens for a disconnect until the response is sent, then cancels this
+        await asyncio.Event().wait()
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the WSGI deployment (budget_api.wsgi, sync views, threads) with the ASGI '
+        'deployment (budget_api.asgi, sync and async views) under concurrent load. Sample data is '
+        'written to the configured database and removed afterwards. The response cache is turned '
+        'off so every request reaches the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Requests per endpoint and deployment')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--rows', type=int, default=2000, help='Expenses of the sample user')
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['concurrency'], options['rows']) < 1:
+            raise CommandError('--requests, --concurrency and --rows must be positive')
+
+        from budget_api.asgi import application as asgi_application
+        from budget_api.wsgi import application as wsgi_application
+
+        user = self.create_sample(options['rows'])
+        authorization = f'Token {Token.objects.create(user=user).key}'
+        try:
+            with override_settings(RESPONSE_CACHE={'ENABLED': False}):
+                for name, sync_route, async_route, query in ENDPOINTS:
+                    sync_path, async_path = reverse(sync_route), reverse(async_route)
+                    runs = [
+                        ('WSGI, sync view', self.run_wsgi(wsgi_application, sync_path, query, authorization, options)),
+                        ('ASGI, sync view', self.run_asgi(asgi_application, sync_path, query, authorization, options)),
+                        ('ASGI, async view', self.run_asgi(asgi_application, async_path, query, authorization, options)),
+                    ]
+                    self.stdout.write(self.style.MIGRATE_HEADING(
+                        f"{name}: {options['requests']} requests, concurrency {options['concurrency']}"
+                    ))
+                    for label, (elapsed, latencies, errors) in runs:
+                        self.report(label, elapsed, latencies, errors)
+        finally:
+            user.delete()
+
+    def create_sample(self, rows):
+        """Create a throwaway user with rows expenses over a few years"""
+        user = User.objects.create_user(username=f'benchmark-{time.time_ns()}')
+        categories = list(user.categories.all())
+        generator = random.Random(42)
+        expenses = Expense.objects.bulk_create(
+            [
+                Expense(
+                    user=user,
+                    category=generator.choice(categories),
+                    amount=Decimal(generator.randint(1, 50000)) / 100,
+                    description=f'Sample expense {i}',
+                    date=date(2021, 1, 1) + timedelta(days=generator.randint(0, 1000)),
+                )
+                for i in range(rows)
+            ],
+            batch_size=1000
+        )
+        record_expenses_created(expenses)
+        return user
+
+    def run_wsgi(self, application, path, query, authorization, options):
+        """Serve requests from a thread pool like a threaded WSGI server"""
+        def timed_request(_):
+            start = time.perf_counter()
+            status_code = wsgi_get(application, path, query, authorization)
+            return time.perf_counter() - start, status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            results = list(executor.map(timed_request, range(options['requests'])))
+        return self.summarize(start, results)
+
+    def run_asgi(self, application, path, query, authorization, options):
+        """Serve requests concurrently on one event loop like an ASGI server"""
+        async def run():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+
+            async def timed_request():
+                async with semaphore:
+                    start = time.perf_counter()
+                    status_code = await asgi_get(application, path, query, authorization)
+                    return time.perf_counter() - start, status_code
+
+            return await asyncio.gather(*(timed_request() for _ in range(options['requests'])))
+
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        return self.summarize(start, results)
+
+    @staticmethod
+    def summarize(start, results):
+        elapsed = time.perf_counter() - start
+        latencies = sorted(latency for latency, status_code in results if status_code == 200)
+        errors = sum(1 for _, status_code in results if status_code != 200)
+        return elapsed, latencies, errors
+
+    def report(self, label, elapsed, latencies, errors):
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f'  {label:18} all requests failed'))
+            return
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f'  {label:18} {len(latencies) / elapsed:8.1f} req/s  '
+            f'p50 {statistics.median(latencies) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms  errors {errors}'
+        )
@@ -0,0 +1,168 @@
+import json
+import platform
+import time
+import tracemalloc
+from pathlib import Path
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases, setup_test_environment,
+    teardown_databases, teardown_test_environment,
+)
+from rest_framework.test import APIClient
+from api.benchmarks import SCENARIOS, BenchmarkData, compare_results, percentile, route_names, seed_dataset
+from budget_api.sharding import shard_databases
+
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every endpoint of api.urls and accounts.urls against a seeded dataset in a '
+        'throwaway test database, recording p50/p95 latency, query count and peak Python memory '
+        'per request. Results are compared with benchmarks/baseline.json and the command fails '
+        'on regressions. The response cache is turned off so every request reaches the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=3)
+        parser.add_argument('--expenses', type=int, default=2000, help='Expenses per user')
+        parser.add_argument('--years', type=float, default=3, help='Years the expenses are spread over')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--requests', type=int, default=30, help='Timed requests per scenario')
+        parser.add_argument(
+            '--only', action='append', default=[],
+            help='Only run scenarios whose name contains this text (can be repeated)'
+        )
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument(
+            '--threshold', type=float, default=0.25,
+            help='Allowed growth of latency and memory over the baseline, as a fraction'
+        )
+        parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['expenses'], options['requests']) < 1 or options['years'] <= 0:
+            raise CommandError('--users, --expenses, --requests and --years must be positive')
+        missing = set(route_names()) - {scenario.route for scenario in SCENARIOS}
+        if missing:
+            raise CommandError(f'Routes without a benchmark scenario: {", ".join(sorted(missing))}')
+
+        scenarios = [
+            scenario for scenario in SCENARIOS
+            if not options['only'] or any(text in scenario.key for text in options['only'])
+        ]
+        results = {
+            'dataset': {
+                'users': options['users'],
+                'expenses': options['expenses'],
+                'years': options['years'],
+                'seed': options['seed'],
+                'requests': options['requests'],
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'endpoints': self.run(scenarios, options),
+        }
+        self.report(results)
+
+        if options['output']:
+            self.write(options['output'], results)
+        if options['save_baseline']:
+            self.write(options['baseline'], results)
+            return
+        self.compare(results, options)
+
+    def run(self, scenarios, options):
+        """Seed a fresh test database and measure every scenario in it"""
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False, aliases=set(shard_databases()))
+        try:
+            with override_settings(RESPONSE_CACHE={'ENABLED': False}):
+                self.stdout.write(
+                    f"Seeding {options['users']} users with {options['expenses']} expenses each..."
+                )
+                users = seed_dataset(options['users'], options['expenses'], options['years'], options['seed'])
+                data = BenchmarkData(users[0], options['years'])
+                client = APIClient()
+                return {
+                    scenario.key: self.measure(client, scenario, data, options['requests'])
+                    for scenario in scenarios
+                }
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def measure(self, client, scenario, data, requests):
+        """Time requests runs after a warm-up, then count queries and memory in one more run"""
+        self.send(client, scenario, scenario.build(data))
+        latencies = []
+        for _ in range(requests):
+            request = scenario.build(data)
+            start = time.perf_counter()
+            self.send(client, scenario, request)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+
+        request = scenario.build(data)
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                self.send(client, scenario, request)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'queries': len(queries),
+            'peak_kb': round(peak / 1024),
+        }
+
+    @staticmethod
+    def send(client, scenario, request):
+        response = scenario.send(client, request)
+        if response.status_code != scenario.status_code:
+            raise CommandError(f'{scenario.key} answered {response.status_code}, expected {scenario.status_code}')
+        return response
+
+    def report(self, results):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{'Endpoint':58} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8} {'peak kB':>8}"
+        ))
+        for key, metrics in results['endpoints'].items():
+            self.stdout.write(
+                f"{key:58} {metrics['p50_ms']:8.2f} {metrics['p95_ms']:8.2f} "
+                f"{metrics['queries']:8} {metrics['peak_kb']:8}"
+            )
+
+    def write(self, path, results):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2) + '\n')
+        self.stdout.write(f'Wrote {path}')
+
+    def compare(self, results, options):
+        path = Path(options['baseline'])
+        if not path.exists():
+            self.stdout.write(self.style.WARNING(f'No baseline at {path}, run with --save-baseline to record one'))
+            return
+        baseline = json.loads(path.read_text())
+        if baseline['dataset'] != results['dataset']:
+            raise CommandError(
+                f'The baseline was recorded with {baseline["dataset"]}; '
+                'benchmark with the same options or record a new baseline'
+            )
+        regressions = compare_results(results, baseline, options['threshold'])
+        if regressions:
+            for message in regressions:
+                self.stdout.write(self.style.ERROR(f'  {message}'))
+            raise CommandError(f'{len(regressions)} regression(s) against {path}')
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}'))
@@ -0,0 +1,74 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from api.fast_serializers import FastListSerializer
+from api.models import Expense
+from api.serializers import ExpenseSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-row CPU time of the DRF ExpenseSerializer and the values_list() fast path. '
+        'Sample rows are created in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs is reported')
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError('--rows and --repeat must be positive')
+
+        with transaction.atomic():
+            expenses = self.create_sample(options['rows'])
+            fast = FastListSerializer(ExpenseSerializer)
+
+            drf_data = ExpenseSerializer(expenses, many=True).data
+            fast_data = fast.serialize(expenses)
+            if JSONRenderer().render(drf_data) != JSONRenderer().render(fast_data):
+                raise CommandError('Fast path output differs from ExpenseSerializer output')
+
+            drf_time = self.best_of(options['repeat'], lambda: ExpenseSerializer(expenses.all(), many=True).data)
+            fast_time = self.best_of(options['repeat'], lambda: fast.serialize(expenses.all()))
+            transaction.set_rollback(True)
+
+        rows = options['rows']
+        self.stdout.write(f'Rows: {rows} (output is byte-for-byte identical)')
+        self.stdout.write(f'ExpenseSerializer: {drf_time * 1e6 / rows:8.2f} us/row  ({drf_time:.3f}s)')
+        self.stdout.write(f'Fast path:         {fast_time * 1e6 / rows:8.2f} us/row  ({fast_time:.3f}s)')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {drf_time / fast_time:.1f}x'))
+
+    def create_sample(self, rows):
+        """Create a throwaway user with rows expenses and return their queryset"""
+        user = User.objects.create_user(username=f'benchmark-{time.time_ns()}')
+        categories = list(user.categories.all())
+        generator = random.Random(42)
+        Expense.objects.bulk_create(
+            [
+                Expense(
+                    user=user,
+                    category=generator.choice(categories),
+                    amount=Decimal(generator.randint(1, 500000)) / 100,
+                    description=f'Sample expense {i}',
+                    date=date(2020, 1, 1) + timedelta(days=generator.randint(0, 1500)),
+                )
+                for i in range(rows)
+            ],
+            batch_size=1000
+        )
+        return user.expenses.order_by('-created_at', '-id')
+
+    def best_of(self, repeat, run):
+        """Lowest CPU time of running run() repeat times, including the query"""
+        timings = []
+        for _ in range(repeat):
+            start = time.process_time()
+            run()
+            timings.append(time.process_time() - start)
+        return min(timings)
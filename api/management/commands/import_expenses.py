@@ -0,0 +1,60 @@
+import csv
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api.importers import DEFAULT_CHUNK_SIZE, ExpenseImporter, ImportFileError, detect_format, iter_rows
+from api.models import ExpenseImport
+
+
+class Command(BaseCommand):
+    help = 'Import expenses for a user from a CSV or NDJSON file in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file to import')
+        parser.add_argument('--user', required=True, help='Username to import the expenses for')
+        parser.add_argument('--format', choices=ExpenseImport.Format.values, help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--resume', type=int, metavar='IMPORT_ID', help='Resume an unfinished import')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        try:
+            file_format = detect_format(options['path'], options['format'])
+        except ImportFileError as e:
+            raise CommandError(str(e))
+
+        if options['resume']:
+            job = user.expense_imports.exclude(status=ExpenseImport.Status.COMPLETED).filter(
+                pk=options['resume']
+            ).first()
+            if job is None:
+                raise CommandError(f'No unfinished import {options["resume"]} for this user')
+            self.stdout.write(f'Resuming import {job.id} after row {job.rows_processed}')
+        else:
+            job = ExpenseImport.objects.create(user=user, source=options['path'], format=file_format)
+            self.stdout.write(f'Started import {job.id}')
+
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                ExpenseImporter(job, options['chunk_size'], progress=self.report).run(
+                    iter_rows(lines, job.format)
+                )
+        except (ImportFileError, UnicodeDecodeError, csv.Error, OSError) as e:
+            raise CommandError(f'Import {job.id} stopped, resume with --resume {job.id}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Import {job.id} completed: {job.rows_created} created, {job.rows_failed} failed, '
+            f'{job.categories_created} categories created'
+        ))
+        for error in job.errors:
+            self.stdout.write(f'Row {error["row"]}: {error["errors"]}')
+
+    def report(self, job):
+        self.stdout.write(
+            f'  {job.rows_processed} rows processed ({job.rows_created} created, {job.rows_failed} failed)'
+        )
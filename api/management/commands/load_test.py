@@ -0,0 +1,267 @@
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+from django.core.management.base import BaseCommand, CommandError
+from api.benchmarks import percentile
+
+
+OPERATIONS = ['list', 'create', 'update', 'delete', 'balance']
+DEFAULT_MIX = 'list=40,create=20,update=15,delete=10,balance=15'
+FIRST_DAY = date(2024, 1, 1)
+
+
+def parse_mix(text):
+    """Parse "list=40,create=20,..." into {operation: weight}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise CommandError(f'Unknown operation "{name}", use: {", ".join(OPERATIONS)}')
+        try:
+            mix[name] = int(weight)
+        except ValueError:
+            raise CommandError(f'Weight of "{name}" must be an integer')
+        if mix[name] < 0:
+            raise CommandError(f'Weight of "{name}" must not be negative')
+    if not any(mix.values()):
+        raise CommandError('The mix needs at least one operation with a positive weight')
+    return mix
+
+
+def classify_error(status_code, body):
+    """Group failed requests, singling out SQLite lock timeouts from the 500s"""
+    if b'database is locked' in body:
+        return 'database is locked'
+    return f'HTTP {status_code}'
+
+
+class RequestFailed(Exception):
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+class LoadClient:
+    """One synthetic user driving the API over HTTP"""
+
+    def __init__(self, base_url, username, password, rng, timeout, async_views):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.rng = rng
+        self.timeout = timeout
+        self.async_views = async_views
+        self.token = None
+        self.category_id = None
+        self.expense_ids = []
+
+    def request(self, method, path, data=None, query=None, expected=200):
+        """Send one request and return its JSON body; raises RequestFailed on errors"""
+        url = self.base_url + path + (f'?{urlencode(query)}' if query else '')
+        headers = {'Accept': 'application/json'}
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        try:
+            with urlopen(Request(url, data=body, headers=headers, method=method), timeout=self.timeout) as response:
+                status_code, content = response.status, response.read()
+        except HTTPError as e:
+            status_code, content = e.code, e.read()
+        except (URLError, OSError) as e:
+            raise RequestFailed(type(getattr(e, 'reason', e)).__name__)
+        if status_code != expected:
+            raise RequestFailed(classify_error(status_code, content))
+        return json.loads(content) if content else {}
+
+    def login(self):
+        """Log in through accounts.views.login, registering the user first if needed"""
+        credentials = {'username': self.username, 'password': self.password}
+        try:
+            self.token = self.request('POST', '/api/auth/login/', credentials)['token']
+        except RequestFailed as e:
+            if e.error != 'HTTP 401':
+                raise
+            self.token = self.request('POST', '/api/auth/register/', credentials, expected=201)['token']
+        categories = self.request('GET', '/api/categories/')['categories']
+        self.category_id = next(category['id'] for category in categories if category['type'] == 'expense')
+
+    def expense_data(self):
+        return {
+            'amount': f'{self.rng.randint(100, 20000) / 100:.2f}',
+            'category': self.category_id,
+            'description': 'Load test',
+            'date': (FIRST_DAY + timedelta(days=self.rng.randint(0, 364))).isoformat(),
+        }
+
+    def next_operation(self, operations, weights):
+        """Pick from the mix; update and delete fall back to create while the user has no expenses"""
+        operation = self.rng.choices(operations, weights)[0]
+        if operation in ('update', 'delete') and not self.expense_ids:
+            return 'create'
+        return operation
+
+    def run(self, operation):
+        """Send the requests of one operation"""
+        prefix = '/api/async' if self.async_views else '/api'
+        if operation == 'list':
+            self.request('GET', f'{prefix}/expenses/', query={'limit': 50})
+        elif operation == 'balance':
+            start = FIRST_DAY + timedelta(days=self.rng.randint(0, 300))
+            self.request('GET', f'{prefix}/expenses/balance/', query={
+                'start_date': start.isoformat(), 'end_date': (start + timedelta(days=60)).isoformat()
+            })
+        elif operation == 'create':
+            expense = self.request('POST', '/api/expenses/', self.expense_data(), expected=201)['expense']
+            self.expense_ids.append(expense['id'])
+        elif operation == 'update':
+            self.request('PUT', f'/api/expenses/{self.rng.choice(self.expense_ids)}/', self.expense_data())
+        else:
+            expense_id = self.expense_ids.pop(self.rng.randrange(len(self.expense_ids)))
+            self.request('DELETE', f'/api/expenses/{expense_id}/')
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive a running server (runserver, gunicorn, uvicorn, ...) with concurrent synthetic users. '
+        'Each user logs in (registering on first use) and then sends a weighted mix of expense list, '
+        'create, update, delete and balance requests. Reports throughput, latency percentiles and '
+        'errors, with SQLite "database is locked" failures counted separately.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server')
+        parser.add_argument('--users', type=int, default=10, help='Concurrent synthetic users, one thread each')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to send requests for')
+        parser.add_argument('--requests', type=int, help='Stop each user after this many requests instead')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Operation weights (default: {DEFAULT_MIX})')
+        parser.add_argument('--prefix', default='load', help='Usernames are <prefix>-<n>')
+        parser.add_argument('--password', default='load-test-password')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request fails')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--async-views', action='store_true',
+            help='Send list and balance reads to the /api/async/ endpoints (ASGI servers)'
+        )
+        parser.add_argument('--json', help='Also write the report to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['duration'] <= 0 or (options['requests'] or 1) < 1:
+            raise CommandError('--users, --duration and --requests must be positive')
+        mix = parse_mix(options['mix'])
+        operations, weights = zip(*mix.items())
+
+        results = []  # (operation, seconds, error or None)
+        lock = threading.Lock()
+        started = threading.Barrier(options['users'], action=lambda: mix_started.append(time.monotonic()))
+        mix_started = []
+
+        def record(operation, seconds, error=None):
+            with lock:
+                results.append((operation, seconds, error))
+
+        def user_session(index):
+            client = LoadClient(
+                options['url'], f"{options['prefix']}-{index}", options['password'],
+                random.Random(options['seed'] * 100003 + index), options['timeout'], options['async_views'],
+            )
+            start = time.perf_counter()
+            try:
+                client.login()
+                record('login', time.perf_counter() - start)
+            except RequestFailed as e:
+                record('login', time.perf_counter() - start, e.error)
+                return
+            finally:
+                # Logins are measured apart; the mix starts for everyone at once
+                started.wait()
+
+            deadline = time.monotonic() + options['duration']
+            sent = 0
+            while sent < options['requests'] if options['requests'] else time.monotonic() < deadline:
+                operation = client.next_operation(operations, weights)
+                start = time.perf_counter()
+                try:
+                    client.run(operation)
+                    record(operation, time.perf_counter() - start)
+                except RequestFailed as e:
+                    record(operation, time.perf_counter() - start, e.error)
+                sent += 1
+
+        self.stdout.write(f"Logging in {options['users']} users at {options['url']}...")
+        with ThreadPoolExecutor(options['users']) as executor:
+            for future in [executor.submit(user_session, index) for index in range(options['users'])]:
+                future.result()
+        elapsed = time.monotonic() - mix_started[0]
+
+        report = {
+            'url': options['url'],
+            'users': options['users'],
+            'mix': mix,
+            'seconds': round(elapsed, 2),
+            'operations': self.summarize(results, elapsed),
+        }
+        self.report(report)
+        if options['json']:
+            path = Path(options['json'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(report, indent=2) + '\n')
+            self.stdout.write(f'Wrote {path}')
+
+    @staticmethod
+    def summarize(results, elapsed):
+        """Per-operation throughput, latency percentiles and errors, plus a "total" row for the mix"""
+        latencies = defaultdict(list)
+        errors = defaultdict(Counter)
+        for operation, seconds, error in results:
+            for key in (operation, 'total') if operation != 'login' else (operation,):
+                latencies[key].append(seconds)
+                if error:
+                    errors[key][error] += 1
+        summary = {}
+        for operation in ['login', *OPERATIONS, 'total']:
+            values = sorted(latencies.get(operation, []))
+            if not values:
+                continue
+            failed = sum(errors[operation].values())
+            summary[operation] = {
+                'requests': len(values),
+                'per_second': round(len(values) / elapsed, 2) if operation != 'login' else None,
+                'p50_ms': round(percentile(values, 0.5) * 1000, 2),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+                'error_rate': round(failed / len(values), 4),
+                'errors': dict(errors[operation].most_common()),
+            }
+        return summary
+
+    def report(self, report):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{'Operation':10} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        ))
+        for operation, metrics in report['operations'].items():
+            per_second = '' if metrics['per_second'] is None else f"{metrics['per_second']:.2f}"
+            self.stdout.write(
+                f"{operation:10} {metrics['requests']:9} {per_second:>8} {metrics['p50_ms']:8.2f} "
+                f"{metrics['p95_ms']:8.2f} {metrics['p99_ms']:8.2f} {metrics['error_rate']:7.1%}"
+            )
+        for operation, metrics in report['operations'].items():
+            for error, count in metrics['errors'].items():
+                if operation != 'total':
+                    self.stdout.write(self.style.WARNING(f'  {operation}: {count} x {error}'))
+        locked = report['operations'].get('total', {}).get('errors', {}).get('database is locked', 0)
+        if locked:
+            self.stdout.write(self.style.ERROR(
+                f'{locked} request(s) failed with "database is locked"; the database is the concurrency ceiling'
+            ))
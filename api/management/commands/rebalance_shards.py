@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import ShardAssignment, UserProfile
+from budget_api.sharding import hashed_shard, move_user, shard_databases, shard_for
+
+
+class Command(BaseCommand):
+    help = (
+        'Move users between shards. With --user and --to, move one user and pin them there. '
+        'Otherwise move every user whose rows are not on the shard they belong to, e.g. after '
+        'adding a shard to SHARD_DATABASES. Users should be inactive while they are moved.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Id of the user to move')
+        parser.add_argument('--to', help='Shard to move --user to')
+        parser.add_argument(
+            '--drain', action='append', default=[],
+            help='Also move users off this database, which is no longer in SHARD_DATABASES (can be repeated)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only list the moves')
+
+    def handle(self, *args, **options):
+        shards = shard_databases()
+        for alias in options['drain']:
+            if alias not in settings.DATABASES:
+                raise CommandError(f'Database "{alias}" is not configured')
+            if alias in shards:
+                raise CommandError(f'Remove "{alias}" from SHARD_DATABASES before draining it')
+
+        if options['user'] is not None or options['to'] is not None:
+            if options['user'] is None or options['to'] is None:
+                raise CommandError('--user and --to go together')
+            if options['to'] not in shards:
+                raise CommandError(f'"{options["to"]}" is not one of SHARD_DATABASES: {", ".join(shards)}')
+            user = User.objects.filter(pk=options['user']).first()
+            if user is None:
+                raise CommandError(f'User {options["user"]} does not exist')
+            moves = [(user, self.locate(user.pk, shards + options['drain']), options['to'])]
+        else:
+            moves = self.planned_moves(shards, options['drain'])
+            if not moves:
+                self.stdout.write(self.style.SUCCESS('Every user is on their shard'))
+                return
+
+        moved_users = 0
+        for user, source, target in moves:
+            if source is None:
+                self.stdout.write(self.style.WARNING(f'User {user.pk}: no rows found, skipped'))
+                continue
+            if source == target:
+                self.stdout.write(f'User {user.pk} is already on {target}')
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'User {user.pk}: {source} -> {target}')
+                continue
+            rows = move_user(user, source, target)
+            moved_users += 1
+            self.stdout.write(f'User {user.pk}: moved {rows} rows from {source} to {target}')
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Moved {moved_users} user(s)'))
+
+    @staticmethod
+    def locate(user_id, databases):
+        """The database holding the user's profile, which every user has"""
+        for alias in databases:
+            if UserProfile._base_manager.using(alias).filter(user_id=user_id).exists():
+                return alias
+        return None
+
+    def planned_moves(self, shards, drain):
+        """(user, source, target) for every user whose rows are off their shard"""
+        # Pins to a drained database are dropped so the hash places the user again
+        stale_pins = dict(ShardAssignment.objects.exclude(database__in=shards).values_list('user_id', 'database'))
+        moves = []
+        for alias in shards + drain:
+            user_ids = UserProfile._base_manager.using(alias).values_list('user_id', flat=True)
+            for user in User.objects.filter(pk__in=list(user_ids)).order_by('pk'):
+                target = hashed_shard(user, shards) if user.pk in stale_pins else shard_for(user)
+                if target != alias:
+                    moves.append((user, alias, target))
+        return moves
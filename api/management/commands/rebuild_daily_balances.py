@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api.ledger import rebuild_daily_balances, verify_daily_balances
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the per-user daily balance rollups from raw expenses'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='Only process this user id (can be repeated)'
+        )
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report rollups that do not match raw expenses, without changing them'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+
+        mismatched_users = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            if not options['verify']:
+                days = rebuild_daily_balances(user_id)
+                self.stdout.write(f'User {user_id}: rebuilt {days} daily rollups')
+                continue
+
+            mismatches = verify_daily_balances(user_id)
+            if mismatches:
+                mismatched_users += 1
+            for day, expected, stored in mismatches:
+                self.stdout.write(
+                    f'User {user_id} {day}: expected {expected}, stored {stored}'
+                )
+
+        if options['verify']:
+            if mismatched_users:
+                raise CommandError(f'{mismatched_users} user(s) have mismatched daily rollups')
+            self.stdout.write(self.style.SUCCESS('All daily rollups match raw expenses'))
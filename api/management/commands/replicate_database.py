@@ -0,0 +1,50 @@
+import sqlite3
+import time
+from contextlib import closing
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Stand-in replication for local testing: copy the primary SQLite database into the '
+        'replica with SQLite\'s online backup API, once or every --interval seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Seconds between copies; 0 copies once')
+        parser.add_argument('--source', help='Primary database file (default: the "default" database)')
+        parser.add_argument('--target', help='Replica database file (default: the replica database)')
+
+    def handle(self, *args, **options):
+        source = options['source'] or self.sqlite_path('default')
+        target = options['target'] or self.sqlite_path(settings.REPLICA_DATABASE_ALIAS)
+        if str(source) == str(target):
+            raise CommandError('Source and target are the same database')
+
+        if not options['interval']:
+            self.copy(source, target)
+            self.stdout.write(self.style.SUCCESS(f'Copied {source} to {target}'))
+            return
+
+        self.stdout.write(f"Copying {source} to {target} every {options['interval']}s, Ctrl+C to stop")
+        try:
+            while True:
+                self.copy(source, target)
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def sqlite_path(self, alias):
+        database = settings.DATABASES.get(alias)
+        if database is None:
+            raise CommandError(f'Database "{alias}" is not configured (set REPLICA_DATABASE)')
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError(f'Database "{alias}" is not SQLite; use the database\'s own replication')
+        return database['NAME']
+
+    @staticmethod
+    def copy(source, target):
+        """Copy a consistent snapshot of source into target"""
+        with closing(sqlite3.connect(source)) as primary, closing(sqlite3.connect(target)) as replica:
+            primary.backup(replica)
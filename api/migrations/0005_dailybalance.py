@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-17 07:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_daily_balances(apps, schema_editor):
+    """Build rollups for expenses that existed before the ledger"""
+    Expense = apps.get_model('api', 'Expense')
+    DailyBalance = apps.get_model('api', 'DailyBalance')
+    income = Q(category__type='income')
+    expense = Q(category__type='expense')
+    rows = Expense.objects.values('user_id', 'date').annotate(
+        income_total=Sum('amount', filter=income),
+        expense_total=Sum('amount', filter=expense),
+        income_count=Count('id', filter=income),
+        expense_count=Count('id', filter=expense),
+    ).order_by()
+    DailyBalance.objects.bulk_create(
+        [
+            DailyBalance(
+                user_id=row['user_id'],
+                date=row['date'],
+                income_total=row['income_total'] or 0,
+                expense_total=row['expense_total'] or 0,
+                income_count=row['income_count'],
+                expense_count=row['expense_count'],
+            )
+            for row in rows
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_expense_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBalance',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('income_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('expense_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('income_count', models.IntegerField(default=0)),
+                ('expense_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Daily Balance',
+                'verbose_name_plural': 'Daily Balances',
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_balance_per_user')],
+            },
+        ),
+        migrations.RunPython(populate_daily_balances, migrations.RunPython.noop),
+    ]
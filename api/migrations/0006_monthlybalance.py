@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-17 07:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_dailybalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyBalance',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('month', models.DateField()),
+                ('closing_net', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Monthly Balance',
+                'verbose_name_plural': 'Monthly Balances',
+                'constraints': [models.UniqueConstraint(fields=('user', 'month'), name='unique_monthly_balance_per_user')],
+            },
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from budget_api.sharding import UserShardedManager
 
 # Create your models here.
 
@@ -25,6 +28,8 @@ class Category(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = UserShardedManager()
+    
     class Meta:
         verbose_name = "Category"
         verbose_name_plural = "Categories"
@@ -53,9 +58,19 @@ class Expense(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = UserShardedManager()
+    
     class Meta:
         verbose_name = "Expense"
         verbose_name_plural = "Expenses"
+        indexes = [
+            # Date range filters and per-day rollups
+            models.Index(fields=['user', 'date'], name='expense_user_date_idx'),
+            # Default listing order
+            models.Index(fields=['user', '-created_at'], name='expense_user_created_idx'),
+            # Category filter, optionally combined with a date range
+            models.Index(fields=['user', 'category', 'date'], name='expense_user_cat_date_idx'),
+        ]
     
     def __str__(self):
         return f"${self.amount} - {self.description} ({self.category.name}) - {self.date}"
@@ -64,4 +79,219 @@ class Expense(models.Model):
         """Ensure amount is always positive"""
         if self.amount < 0:
             self.amount = abs(self.amount)
-        super().save(*args, **kwargs)
+        # Keep the expense row and its daily rollup in step
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
+class DailyBalance(models.Model):
+    """Per-user, per-day rollup of income and expense totals"""
+    
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='daily_balances'
+    )
+    date = models.DateField()
+    income_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    expense_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    income_count = models.IntegerField(default=0)
+    expense_count = models.IntegerField(default=0)
+    
+    objects = UserShardedManager()
+    
+    class Meta:
+        verbose_name = "Daily Balance"
+        verbose_name_plural = "Daily Balances"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_balance_per_user')
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.date}: +${self.income_total} / -${self.expense_total}"
+
+
+class MonthlyBalance(models.Model):
+    """Cumulative net amount (income minus expenses) of a user at the end of a month"""
+    
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='monthly_balances'
+    )
+    month = models.DateField()  # First day of the month
+    closing_net = models.DecimalField(max_digits=16, decimal_places=2)
+    
+    objects = UserShardedManager()
+    
+    class Meta:
+        verbose_name = "Monthly Balance"
+        verbose_name_plural = "Monthly Balances"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='unique_monthly_balance_per_user')
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.month:%Y-%m}: ${self.closing_net}"
+
+
+class DataVersion(models.Model):
+    """Version of a user's data, bumped in the same transaction as every write; keys their cached responses"""
+    
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='data_version'
+    )
+    version = models.PositiveBigIntegerField()
+    changed_at = models.DateTimeField()
+    
+    objects = UserShardedManager()
+    
+    class Meta:
+        verbose_name = "Data Version"
+        verbose_name_plural = "Data Versions"
+    
+    def __str__(self):
+        return f"{self.user.username} - v{self.version}"
+
+
+class ExpenseImport(models.Model):
+    """Progress and resume checkpoint of a chunked expense import"""
+    
+    class Status(models.TextChoices):
+        RUNNING = 'running', 'Running'
+        COMPLETED = 'completed', 'Completed'
+        FAILED = 'failed', 'Failed'
+    
+    class Format(models.TextChoices):
+        CSV = 'csv', 'CSV'
+        NDJSON = 'ndjson', 'NDJSON'
+    
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='expense_imports'
+    )
+    source = models.CharField(max_length=255)
+    format = models.CharField(max_length=10, choices=Format.choices)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.RUNNING)
+    rows_processed = models.PositiveIntegerField(default=0)  # Input rows in committed chunks
+    rows_created = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    categories_created = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)  # First rejected rows
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = UserShardedManager()
+    
+    class Meta:
+        verbose_name = "Expense Import"
+        verbose_name_plural = "Expense Imports"
+    
+    def __str__(self):
+        return f"{self.source} ({self.status}) - {self.user.username}"
+
+
+def _deletion_started_from(origin, model):
+    """Whether a delete() call was made on model instances or a model queryset"""
+    origin_model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    return origin_model is model
+
+
+@receiver(pre_save, sender=Expense)
+def remember_previous_expense(sender, instance, raw=False, using=None, **kwargs):
+    """Keep the stored state of an expense so the rollup can be moved on update"""
+    instance._ledger_previous = None
+    if raw or instance.pk is None:
+        return
+    instance._ledger_previous = Expense.objects.using(using).filter(pk=instance.pk).values(
+        'user_id', 'date', 'amount', 'category__type'
+    ).first()
+
+
+@receiver(post_save, sender=Expense)
+def update_daily_balance_on_save(sender, instance, created, raw=False, **kwargs):
+    """Apply an expense create or update to the daily rollup"""
+    if raw:
+        return
+    from .ledger import record_expense_change
+    record_expense_change(getattr(instance, '_ledger_previous', None), instance)
+
+
+@receiver(post_delete, sender=Expense)
+def update_daily_balance_on_delete(sender, instance, origin=None, **kwargs):
+    """Remove a deleted expense from the daily rollup"""
+    # Category and user deletions are handled in bulk by their own receivers
+    if not _deletion_started_from(origin, Expense):
+        return
+    from .ledger import record_expense_change
+    record_expense_change(
+        {
+            'user_id': instance.user_id,
+            'date': instance.date,
+            'amount': instance.amount,
+            'category__type': instance.category.type,
+        },
+        None
+    )
+
+
+@receiver(pre_save, sender=Category)
+def remember_previous_category_type(sender, instance, raw=False, using=None, **kwargs):
+    """Keep the stored type of a category so a type change can be detected"""
+    instance._ledger_previous_type = None
+    if raw or instance.pk is None:
+        return
+    instance._ledger_previous_type = Category.objects.using(using).filter(pk=instance.pk).values_list(
+        'type', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=Category)
+def update_daily_balance_on_category_type(sender, instance, created, raw=False, **kwargs):
+    """Move a category's expenses between income and expense rollups when its type changes"""
+    previous_type = getattr(instance, '_ledger_previous_type', None)
+    if raw or created or previous_type is None or previous_type == instance.type:
+        return
+    from .ledger import move_category_expenses
+    move_category_expenses(instance, previous_type, instance.type)
+
+
+@receiver(pre_delete, sender=Category)
+def update_daily_balance_on_category_delete(sender, instance, origin=None, **kwargs):
+    """Remove all expenses of a deleted category from the daily rollup"""
+    # Rollups of a deleted user are removed by the cascade
+    if not _deletion_started_from(origin, Category):
+        return
+    from .ledger import move_category_expenses
+    move_category_expenses(instance, instance.type, None)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender='accounts.UserProfile')
+def bump_data_version_on_save(sender, instance, created=False, raw=False, **kwargs):
+    """Invalidate the owner's cached responses"""
+    # Raw saves copy rows between shards and the user's version row is copied along;
+    # a new profile comes with a new user, whose version is created at signup
+    if raw or (created and sender._meta.label_lower == 'accounts.userprofile'):
+        return
+    from .cache import bump_data_version
+    bump_data_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Category)
+def bump_data_version_on_delete(sender, instance, origin=None, **kwargs):
+    """Invalidate the owner's cached responses once per delete() call"""
+    if not _deletion_started_from(origin, sender):
+        return
+    from .cache import bump_data_version
+    bump_data_version(instance.user_id)
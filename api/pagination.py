@@ -0,0 +1,89 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor or limit query parameter cannot be used"""
+
+
+class KeysetPagination:
+    """
+    Opt-in keyset pagination over (created_at, id), newest first.
+
+    Pages are selected with a WHERE clause on the last row of the previous
+    page instead of an OFFSET, so every page costs the same as the first.
+    """
+    default_limit = 50
+    max_limit = 500
+
+    def __init__(self, request):
+        # DRF requests and plain Django requests (async views)
+        self.params = getattr(request, 'query_params', request.GET)
+
+    def is_requested(self):
+        """Pagination is used only when the client asks for it"""
+        return 'limit' in self.params or 'cursor' in self.params
+
+    def wants_total(self):
+        """The total count costs an extra query, so it is only computed on request"""
+        return self.params.get('include_total', '').lower() in ('1', 'true', 'yes')
+
+    def get_limit(self):
+        value = self.params.get('limit')
+        if value is None:
+            return self.default_limit
+        try:
+            limit = int(value)
+        except ValueError:
+            raise InvalidCursor('limit must be a positive integer')
+        if limit < 1:
+            raise InvalidCursor('limit must be a positive integer')
+        return min(limit, self.max_limit)
+
+    @staticmethod
+    def encode_cursor(row):
+        """Encode the position after row as an opaque string"""
+        position = f'{row.created_at.isoformat()}|{row.id}'
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Decode a cursor into a (created_at, id) position"""
+        try:
+            created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(created_at), int(row_id)
+        except (ValueError, UnicodeError):
+            raise InvalidCursor('Invalid cursor')
+
+    def page_queryset(self, queryset):
+        """
+        The rows of the requested page plus one more, which tells whether
+        another page exists without a COUNT.
+
+        queryset must be ordered by ('-created_at', '-id').
+        """
+        limit = self.get_limit()
+        cursor = self.params.get('cursor')
+        if cursor:
+            created_at, row_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=row_id)
+            )
+        return queryset[:limit + 1]
+
+    def paginate(self, queryset):
+        """
+        Return (rows, next_cursor, has_more) for the requested page.
+
+        queryset must be ordered by ('-created_at', '-id').
+        """
+        return self.finish_page(list(self.page_queryset(queryset)))
+
+    def finish_page(self, rows):
+        """Return (rows, next_cursor, has_more) from the rows of page_queryset()"""
+        limit = self.get_limit()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = self.encode_cursor(rows[-1]) if has_more else None
+        return rows, next_cursor, has_more
@@ -0,0 +1,73 @@
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import Trunc
+from .ledger import ZERO
+from .models import Category
+
+
+BREAKDOWN_PERIODS = ['day', 'week', 'month', 'year']
+
+
+def _new_bucket(period_start):
+    return {
+        'period_start': period_start.isoformat(),
+        'total_income': ZERO,
+        'total_expenses': ZERO,
+        'net_amount': ZERO,
+        'income_transactions': 0,
+        'expense_transactions': 0,
+    }
+
+
+def _to_float(bucket):
+    """Convert a bucket's Decimal totals to floats like the balance endpoint does"""
+    for key in ('total_income', 'total_expenses', 'net_amount'):
+        bucket[key] = float(bucket[key])
+    return bucket
+
+
+def period_breakdown(expenses, period, by_category=False):
+    """
+    Total income and expenses of expenses per day, week, month or year.
+
+    Computed with a single GROUP BY on the truncated date (and the category
+    when by_category is set). Weeks start on Monday. Returns one entry per
+    period that has transactions, oldest first.
+    """
+    group_by = ['period_start', 'category__type']
+    if by_category:
+        group_by += ['category_id', 'category__name']
+
+    rows = expenses.annotate(
+        period_start=Trunc('date', period, output_field=DateField())
+    ).values(*group_by).annotate(
+        total=Sum('amount'),
+        transactions=Count('id'),
+    ).order_by(*group_by)
+
+    buckets = {}
+    for row in rows:
+        bucket = buckets.get(row['period_start'])
+        if bucket is None:
+            bucket = buckets[row['period_start']] = _new_bucket(row['period_start'])
+            if by_category:
+                bucket['categories'] = []
+
+        total = row['total']
+        if row['category__type'] == Category.CategoryType.INCOME:
+            bucket['total_income'] += total
+            bucket['income_transactions'] += row['transactions']
+        else:
+            bucket['total_expenses'] += total
+            bucket['expense_transactions'] += row['transactions']
+        bucket['net_amount'] = bucket['total_income'] - bucket['total_expenses']
+
+        if by_category:
+            bucket['categories'].append({
+                'id': row['category_id'],
+                'name': row['category__name'],
+                'type': row['category__type'],
+                'total': float(total),
+                'transactions': row['transactions'],
+            })
+
+    return [_to_float(bucket) for bucket in buckets.values()]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Category, Expense
+from .models import Category, Expense, ExpenseImport
 
 class CategorySerializer(serializers.ModelSerializer):
     """Serializer for Category model"""
@@ -21,8 +21,52 @@ class CategorySerializer(serializers.ModelSerializer):
         return value.strip().title()
 
 
+def get_category_map(context):
+    """
+    Return the request user's categories keyed by id.
+
+    Loaded with one query the first time it is needed and kept in the
+    serializer context, so every item validated with the same context
+    (e.g. a bulk request) shares it.
+    """
+    if 'category_map' not in context:
+        context['category_map'] = Category.objects.for_user(context['request'].user).in_bulk()
+    return context['category_map']
+
+
+class UserCategoryField(serializers.PrimaryKeyRelatedField):
+    """Category field resolved against the request user's categories only"""
+    default_error_messages = {
+        'does_not_exist': 'Category {pk_value} does not exist or is not one of your categories',
+        'incorrect_type': 'Incorrect type. Expected pk value, received {data_type}.',
+    }
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', Category.objects.none())
+        super().__init__(**kwargs)
+    
+    def to_internal_value(self, data):
+        """Look the category up in the per-request category map instead of querying"""
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        category = get_category_map(self.context).get(pk)
+        if category is None:
+            self.fail('does_not_exist', pk_value=data)
+        return category
+
+
 class ExpenseSerializer(serializers.ModelSerializer):
-    """Serializer for Expense model"""
+    """
+    Serializer for Expense model.
+
+    Set expand_category in the context to add the category name and type,
+    the queryset should then use select_related('category').
+    """
+    category = UserCategoryField()
     
     class Meta:
         model = Expense
@@ -52,7 +96,7 @@ class ExpenseSerializer(serializers.ModelSerializer):
     def validate_category(self, value):
         """Validate that category belongs to the authenticated user"""
         user = self.context['request'].user
-        if value.user != user:
+        if value.user_id != user.id:
             raise serializers.ValidationError("You can only use your own categories")
         return value
     
@@ -61,4 +105,55 @@ class ExpenseSerializer(serializers.ModelSerializer):
         from datetime import date
         if value > date.today():
             raise serializers.ValidationError("Date cannot be in the future")
-        return value
\ No newline at end of file
+        return value
+    
+    def to_representation(self, instance):
+        """Include category name and type when requested"""
+        data = super().to_representation(instance)
+        if self.context.get('expand_category'):
+            data['category_detail'] = {
+                'id': instance.category.id,
+                'name': instance.category.name,
+                'type': instance.category.type
+            }
+        return data
+
+
+class ExpenseImportRowSerializer(serializers.Serializer):
+    """Serializer for validating one row of an imported transaction file"""
+    date = serializers.DateField()
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    description = serializers.CharField(max_length=255)
+    category = serializers.CharField(max_length=100)
+    type = serializers.ChoiceField(choices=Category.CategoryType.choices, default=Category.CategoryType.EXPENSE)
+    
+    def validate_amount(self, value):
+        """Validate that amount is positive"""
+        if value <= 0:
+            raise serializers.ValidationError("Amount must be positive")
+        return value
+    
+    def validate_date(self, value):
+        """Validate that date is not in the future"""
+        from datetime import date
+        if value > date.today():
+            raise serializers.ValidationError("Date cannot be in the future")
+        return value
+    
+    def validate_category(self, value):
+        """Normalize category names the same way CategorySerializer does"""
+        if not value.strip():
+            raise serializers.ValidationError("Category name cannot be empty")
+        return value.strip().title()
+
+
+class ExpenseImportSerializer(serializers.ModelSerializer):
+    """Serializer for the progress of an expense import"""
+    
+    class Meta:
+        model = ExpenseImport
+        fields = [
+            'id', 'source', 'format', 'status', 'rows_processed', 'rows_created', 'rows_failed',
+            'categories_created', 'errors', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
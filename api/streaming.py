@@ -0,0 +1,85 @@
+import csv
+import json
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+CHUNK_SIZE = 500
+
+STREAM_FORMATS = {
+    '1': 'json',
+    'true': 'json',
+    'json': 'json',
+    'ndjson': 'ndjson',
+}
+
+
+def _dumps(data):
+    """Encode data the same way DRF's JSONRenderer does"""
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def _json_array(queryset, serialize):
+    """Yield a JSON array, one buffered chunk of rows at a time"""
+    yield '['
+    separator = ''
+    buffer = []
+    for index, row in enumerate(queryset.iterator(chunk_size=CHUNK_SIZE), start=1):
+        buffer.append(separator + _dumps(serialize(row)))
+        separator = ','
+        if index % CHUNK_SIZE == 0:
+            yield ''.join(buffer)
+            buffer = []
+    buffer.append(']')
+    yield ''.join(buffer)
+
+
+def _ndjson(queryset, serialize):
+    """Yield newline-delimited JSON, one buffered chunk of rows at a time"""
+    buffer = []
+    for index, row in enumerate(queryset.iterator(chunk_size=CHUNK_SIZE), start=1):
+        buffer.append(_dumps(serialize(row)) + '\n')
+        if index % CHUNK_SIZE == 0:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def streaming_json_response(queryset, serialize, stream_format):
+    """
+    Stream every row of queryset serialized by serialize(row).
+
+    Rows are read from the database with a chunked iterator and written out
+    as they are serialized, so memory use does not grow with the row count.
+    """
+    if stream_format == 'ndjson':
+        return StreamingHttpResponse(_ndjson(queryset, serialize), content_type='application/x-ndjson')
+    return StreamingHttpResponse(_json_array(queryset, serialize), content_type='application/json')
+
+
+class _Echo:
+    """File-like object that hands back what csv.writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+def _csv(header, rows):
+    """Yield CSV text, one buffered chunk of rows at a time"""
+    writer = csv.writer(_Echo())
+    buffer = [writer.writerow(header)]
+    for index, row in enumerate(rows, start=1):
+        buffer.append(writer.writerow(row))
+        if index % CHUNK_SIZE == 0:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def streaming_csv_response(header, rows, filename):
+    """Stream rows (an iterable of sequences) as a CSV attachment"""
+    response = StreamingHttpResponse(_csv(header, rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
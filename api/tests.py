@@ -1,10 +1,48 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.handlers.asgi import ASGIHandler
+from django.http import HttpResponse
+from django.conf import settings
+from django.test import LiveServerTestCase, RequestFactory, TestCase, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from .models import Category, Expense
+from rest_framework.renderers import JSONRenderer
+from django.utils import timezone
+from django.utils.http import http_date
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipUnless
+from django.core.management.base import CommandError
+from .models import Category, DailyBalance, DataVersion, Expense, ExpenseImport, MonthlyBalance
+from .balance import _fill_checkpoints, compute_period_balance, month_start, net_before_month
+from .serializers import CategorySerializer, ExpenseSerializer
+from .fast_serializers import FastListSerializer
+from .ledger import record_expenses_created, verify_daily_balances
+from .management.commands.load_test import parse_mix
+from .benchmarks import SCENARIOS, BenchmarkData, compare_results, route_names, seed_dataset
+from budget_api.middleware import PIN_COOKIE, ReplicaRoutingMiddleware
+from budget_api.routers import PrimaryReplicaRouter, primary_reads, replica_alias, reading_from_replica, replica_reads
+from budget_api.profiling import get_profile_buffer
+from budget_api.sharding import SHARD_ID_SPACE, hashed_shard, shard_for
+from accounts.models import ProfilingTarget, ShardAssignment, UserProfile
+from .cache import bump_data_version, data_version, get_cache, reset_response_cache_stats, response_cache_stats
+from datetime import date, timedelta
+from decimal import Decimal
+from contextlib import closing
+from io import StringIO
+import cProfile
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
 
 
 class CategoryCRUDTestCase(APITestCase):
@@ -196,3 +234,1655 @@ class ExpenseFilterTestCase(APITestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['filters_applied']), 0)
+
+
+class CustomPeriodBalanceTestCase(APITestCase):
+    """Test the custom period balance endpoint and its query count"""
+
+    def setUp(self):
+        """Set up expenses before, inside and after the period"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.income = Category.objects.create(name='Bonus', type='income', user=self.user)
+        self.expense = Category.objects.create(name='Rent', type='expense', user=self.user)
+
+        rows = [
+            ('1000.00', self.income, '2024-07-15'),
+            ('200.10', self.expense, '2024-07-20'),
+            ('25.50', self.expense, '2024-08-01'),
+            ('500.00', self.income, '2024-08-05'),
+            ('10.25', self.expense, '2024-08-31'),
+            ('99.00', self.expense, '2024-09-02'),
+        ]
+        for amount, category, date in rows:
+            Expense.objects.create(
+                amount=Decimal(amount), category=category, description='Item', date=date, user=self.user
+            )
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api:custom-period-balance')
+
+    def test_balance_figures(self):
+        """Test that every figure in the response is correct"""
+        response = self.client.get(f'{self.url}?start_date=2024-08-01&end_date=2024-08-31')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['period']['days'], 31)
+        self.assertEqual(response.data['balance'], {
+            'balance_at_start_of_period': 10799.90,
+            'balance_at_end_of_period': 11264.15,
+            'change_during_period': 464.25,
+        })
+        self.assertEqual(response.data['period_summary'], {
+            'total_income': 500.00,
+            'total_expenses': 35.75,
+            'net_amount': 464.25,
+            'income_transactions': 1,
+            'expense_transactions': 2,
+            'total_transactions': 3,
+        })
+
+    def test_compute_period_balance_is_decimal(self):
+        """Test that the balance layer keeps exact Decimal values"""
+        compute_period_balance(self.user, date(2024, 8, 1), date(2024, 8, 31))
+        user = User.objects.get(pk=self.user.pk)
+        # Checkpoint, profile, and one aggregate for the partial month and period
+        with self.assertNumQueries(3):
+            totals = compute_period_balance(user, date(2024, 8, 1), date(2024, 8, 31))
+        self.assertEqual(totals['balance_at_start'], Decimal('10799.90'))
+        self.assertEqual(totals['period_expenses'], Decimal('35.75'))
+        self.assertIsInstance(totals['balance_at_end'], Decimal)
+
+    def test_empty_period(self):
+        """Test a period without transactions"""
+        user = User.objects.get(pk=self.user.pk)
+        totals = compute_period_balance(user, date(2023, 1, 1), date(2023, 1, 31))
+        self.assertEqual(totals['balance_at_start'], Decimal('10000.00'))
+        self.assertEqual(totals['period_net'], Decimal('0.00'))
+        self.assertEqual(totals['total_transactions'], 0)
+
+    def test_query_count(self):
+        """Test that the endpoint runs a fixed number of queries"""
+        self.client.get(f'{self.url}?start_date=2024-08-01&end_date=2024-08-30')
+        # Token and profile come from the auth cache: data version, checkpoint and one aggregate
+        with self.assertNumQueries(3):
+            response = self.client.get(f'{self.url}?start_date=2024-08-01&end_date=2024-08-31')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Repeating it is answered from the response cache after reading the data version
+        with self.assertNumQueries(1):
+            response = self.client.get(f'{self.url}?start_date=2024-08-01&end_date=2024-08-31')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+
+class DailyBalanceLedgerTestCase(TestCase):
+    """Test that daily rollups follow expense and category changes"""
+
+    def setUp(self):
+        """Set up a user with one income and one expense category"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.income = Category.objects.create(name='Bonus', type='income', user=self.user)
+        self.expense = Category.objects.create(name='Rent', type='expense', user=self.user)
+
+    def add_expense(self, amount, category, day):
+        return Expense.objects.create(
+            amount=Decimal(amount), category=category, description='Item', date=day, user=self.user
+        )
+
+    def assertLedgerMatches(self):
+        self.assertEqual(verify_daily_balances(self.user.id), [])
+
+    def rollup(self, day):
+        return DailyBalance.objects.get(user=self.user, date=day)
+
+    def test_create_update_delete(self):
+        """Test that creates, moves and deletes keep the rollup in sync"""
+        expense = self.add_expense('10.00', self.expense, date(2024, 8, 1))
+        self.add_expense('5.50', self.expense, date(2024, 8, 1))
+        self.assertEqual(self.rollup(date(2024, 8, 1)).expense_total, Decimal('15.50'))
+        self.assertEqual(self.rollup(date(2024, 8, 1)).expense_count, 2)
+
+        # Move the expense to another day, amount and category type
+        expense.date = date(2024, 8, 3)
+        expense.amount = Decimal('12.00')
+        expense.category = self.income
+        expense.save()
+        self.assertEqual(self.rollup(date(2024, 8, 1)).expense_total, Decimal('5.50'))
+        self.assertEqual(self.rollup(date(2024, 8, 3)).income_total, Decimal('12.00'))
+        self.assertLedgerMatches()
+
+        expense.delete()
+        self.assertEqual(self.rollup(date(2024, 8, 3)).income_count, 0)
+        self.assertLedgerMatches()
+
+    def test_category_type_change_and_delete(self):
+        """Test that category type changes and deletions move their expenses"""
+        self.add_expense('100.00', self.expense, date(2024, 8, 1))
+        self.add_expense('40.00', self.expense, date(2024, 8, 2))
+
+        self.expense.type = 'income'
+        self.expense.save()
+        self.assertEqual(self.rollup(date(2024, 8, 1)).income_total, Decimal('100.00'))
+        self.assertEqual(self.rollup(date(2024, 8, 1)).expense_total, Decimal('0.00'))
+        self.assertLedgerMatches()
+
+        self.expense.delete()
+        self.assertEqual(self.rollup(date(2024, 8, 2)).income_count, 0)
+        self.assertLedgerMatches()
+
+    def test_bulk_record_queries_do_not_grow_with_days(self):
+        """Test that bulk-created expenses update existing and new days in a fixed number of queries"""
+        self.add_expense('100.00', self.expense, date(2024, 8, 1))
+
+        def record(days, amount):
+            expenses = Expense.objects.bulk_create([
+                Expense(amount=Decimal(amount), category=category, description='Bulk', date=day, user=self.user)
+                for day in days for category in (self.income, self.expense)
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                record_expenses_created(expenses)
+            self.assertLedgerMatches()
+            return len(queries)
+
+        few = record([date(2024, 8, 1), date(2024, 8, 2)], '1.00')
+        many = record([date(2024, 8, 1) + timedelta(days=offset) for offset in range(60)], '2.00')
+        self.assertEqual(few, many)
+        self.assertEqual(self.rollup(date(2024, 8, 1)).expense_total, Decimal('103.00'))
+        self.assertEqual(self.rollup(date(2024, 8, 2)).income_count, 2)
+
+    def test_user_delete_removes_rollups(self):
+        """Test that deleting a user removes its rollups"""
+        self.add_expense('100.00', self.expense, date(2024, 8, 1))
+        self.user.delete()
+        self.assertFalse(DailyBalance.objects.exists())
+
+    def test_rebuild_command(self):
+        """Test that the command detects and repairs drifted rollups"""
+        self.add_expense('100.00', self.expense, date(2024, 8, 1))
+        DailyBalance.objects.filter(user=self.user).update(expense_total=Decimal('1.00'))
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_daily_balances', '--verify', stdout=StringIO())
+
+        call_command('rebuild_daily_balances', '--user', str(self.user.id), stdout=StringIO())
+        self.assertEqual(self.rollup(date(2024, 8, 1)).expense_total, Decimal('100.00'))
+        call_command('rebuild_daily_balances', '--verify', stdout=StringIO())
+
+
+class MonthlyCheckpointTestCase(TestCase):
+    """Test lazily computed monthly balance checkpoints"""
+
+    def setUp(self):
+        """Set up a year of transactions"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.income = Category.objects.create(name='Bonus', type='income', user=self.user)
+        self.expense = Category.objects.create(name='Rent', type='expense', user=self.user)
+        for month in range(1, 13):
+            Expense.objects.create(
+                amount=Decimal('100.00'), category=self.income, description='Pay',
+                date=date(2023, month, 5), user=self.user
+            )
+            Expense.objects.create(
+                amount=Decimal('30.25'), category=self.expense, description='Rent',
+                date=date(2023, month, 20), user=self.user
+            )
+
+    def raw_balance_before(self, day):
+        """Balance at the start of day computed from raw expenses"""
+        balance = User.objects.get(pk=self.user.pk).profile.starting_balance
+        for expense in self.user.expenses.filter(date__lt=day).select_related('category'):
+            balance += expense.amount if expense.category.type == 'income' else -expense.amount
+        return balance
+
+    def test_checkpoints_match_raw_history(self):
+        """Test that balances from checkpoints match a full history scan"""
+        for day in [date(2023, 1, 1), date(2023, 3, 10), date(2023, 12, 31), date(2024, 2, 1)]:
+            user = User.objects.get(pk=self.user.pk)
+            totals = compute_period_balance(user, day, day)
+            self.assertEqual(totals['balance_at_start'], self.raw_balance_before(day))
+
+        # Every month from December 2022 to January 2024 now has a checkpoint
+        self.assertEqual(MonthlyBalance.objects.filter(user=self.user).count(), 14)
+
+    def test_backdated_edit_invalidates_later_checkpoints(self):
+        """Test that editing an old expense drops checkpoints from its month onward"""
+        net_before_month(self.user, date(2024, 1, 1))
+        expense = self.user.expenses.get(date=date(2023, 6, 20))
+        expense.amount = Decimal('1000.00')
+        expense.save()
+
+        months = list(MonthlyBalance.objects.filter(user=self.user).values_list('month', flat=True))
+        self.assertEqual(max(months), date(2023, 5, 1))
+
+        user = User.objects.get(pk=self.user.pk)
+        totals = compute_period_balance(user, date(2023, 9, 15), date(2023, 9, 30))
+        self.assertEqual(totals['balance_at_start'], self.raw_balance_before(date(2023, 9, 15)))
+
+    def test_edit_before_the_fill_is_not_built_on(self):
+        """Test that a checkpoint dropped after it was looked up is re-read under the checkpoint lock"""
+        net_before_month(self.user, date(2023, 6, 1))
+
+        def edit_then_fill(*args):
+            # Lands between reading the May checkpoint and filling the months after it
+            expense = self.user.expenses.get(date=date(2023, 3, 20))
+            expense.amount = Decimal('1000.00')
+            expense.save()
+            return _fill_checkpoints(*args)
+
+        user = User.objects.get(pk=self.user.pk)
+        with mock.patch('api.balance._fill_checkpoints', edit_then_fill):
+            totals = compute_period_balance(user, date(2023, 10, 1), date(2023, 10, 1))
+        self.assertEqual(totals['balance_at_start'], self.raw_balance_before(date(2023, 10, 1)))
+        self.assertEqual(
+            MonthlyBalance.objects.get(user=self.user, month=date(2023, 9, 1)).closing_net,
+            self.raw_balance_before(date(2023, 10, 1)) - user.profile.starting_balance,
+        )
+
+
+    def test_far_future_period_stores_bounded_checkpoints(self):
+        """Test that months after the data and the current month get no stored checkpoint"""
+        day = date(9999, 12, 1)
+        totals = compute_period_balance(User.objects.get(pk=self.user.pk), day, day)
+        self.assertEqual(totals['balance_at_start'], self.raw_balance_before(day))
+        latest = MonthlyBalance.objects.filter(user=self.user).latest('month').month
+        self.assertEqual(latest, timezone.localdate().replace(day=1))
+
+        # Asking again reuses the stored months instead of adding any
+        count = MonthlyBalance.objects.filter(user=self.user).count()
+        compute_period_balance(User.objects.get(pk=self.user.pk), day, day)
+        self.assertEqual(MonthlyBalance.objects.filter(user=self.user).count(), count)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTestCase(APITestCase):
+    """Test that every endpoint query is served by an index"""
+
+    def setUp(self):
+        """Set up a user with a few expenses"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Food', type='expense', user=self.user)
+        self.expense = Expense.objects.create(
+            amount=Decimal('25.50'), category=self.category, description='Lunch',
+            date=date(2024, 8, 1), user=self.user
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def full_scans(self, queries):
+        """Return (sql, plan line) for every SELECT that scans a whole table"""
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    if detail.startswith('SCAN') and 'INDEX' not in detail:
+                        scans.append((sql, detail))
+        return scans
+
+    def test_endpoint_queries_use_indexes(self):
+        """Test list, detail, category and balance queries against their plans"""
+        expense_list = reverse('api:expense-list-create')
+        urls = [
+            expense_list,
+            f'{expense_list}?category={self.category.id}',
+            f'{expense_list}?min_price=10&max_price=30',
+            f'{expense_list}?start_date=2024-08-01&end_date=2024-08-31',
+            f'{expense_list}?category={self.category.id}&start_date=2024-08-01',
+            reverse('api:expense-detail', kwargs={'pk': self.expense.id}),
+            reverse('api:category-list-create'),
+            reverse('api:category-detail', kwargs={'pk': self.category.id}),
+            f"{reverse('api:custom-period-balance')}?start_date=2024-08-10&end_date=2024-08-31",
+        ]
+        for url in urls:
+            with self.subTest(url=url), CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(self.full_scans(context.captured_queries), [])
+
+
+class ExpensePaginationTestCase(APITestCase):
+    """Test keyset pagination of the expense list"""
+
+    def setUp(self):
+        """Set up five expenses, two of them sharing a timestamp"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Food', type='expense', user=self.user)
+        self.expenses = [
+            Expense.objects.create(
+                amount=Decimal('10.00') + i, category=self.category, description=f'Item {i}',
+                date=date(2024, 8, 1), user=self.user
+            )
+            for i in range(5)
+        ]
+        Expense.objects.filter(id__in=[self.expenses[1].id, self.expenses[2].id]).update(
+            created_at=self.expenses[1].created_at
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api:expense-list-create')
+
+    def test_pages_cover_all_expenses_in_order(self):
+        """Test that following cursors returns every expense once, newest first"""
+        seen = []
+        url = f'{self.url}?limit=2'
+        while True:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('total_count', response.data)
+            seen.extend(expense['id'] for expense in response.data['expenses'])
+            if not response.data['pagination']['has_more']:
+                self.assertIsNone(response.data['pagination']['next_cursor'])
+                break
+            url = f"{self.url}?limit=2&cursor={response.data['pagination']['next_cursor']}"
+
+        expected = list(self.user.expenses.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_deep_page_costs_same_as_first(self):
+        """Test that a later page runs the same queries as the first page"""
+        self.client.get(f'{self.url}?limit=3')
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(f'{self.url}?limit=2')
+        cursor = response.data['pagination']['next_cursor']
+        with CaptureQueriesContext(connection) as later:
+            self.client.get(f'{self.url}?limit=2&cursor={cursor}')
+        self.assertEqual(len(first), len(later))
+
+    def test_total_count_on_request(self):
+        """Test the optional total count"""
+        response = self.client.get(f'{self.url}?limit=2&include_total=1&min_price=11')
+        self.assertEqual(response.data['total_count'], 4)
+        self.assertEqual(len(response.data['expenses']), 2)
+
+    def test_invalid_cursor_and_limit(self):
+        """Test that malformed cursors and limits are rejected"""
+        self.assertEqual(self.client.get(f'{self.url}?cursor=not-a-cursor').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(f'{self.url}?limit=0').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExpenseStreamingTestCase(APITestCase):
+    """Test the streaming mode of the expense list"""
+
+    def setUp(self):
+        """Set up a few expenses"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Food', type='expense', user=self.user)
+        for i in range(3):
+            Expense.objects.create(
+                amount=Decimal('10.00') + i, category=self.category, description=f'Item {i}',
+                date=date(2024, 8, 1 + i), user=self.user
+            )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api:expense-list-create')
+
+    def test_stream_json_array(self):
+        """Test that the streamed array matches the regular response"""
+        expected = json.loads(self.client.get(f'{self.url}?min_price=11').content)['expenses']
+        response = self.client.get(f'{self.url}?min_price=11&stream=1')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+
+    def test_stream_ndjson(self):
+        """Test one JSON document per line"""
+        expected = json.loads(self.client.get(self.url).content)['expenses']
+        response = self.client.get(f'{self.url}?stream=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+    def test_stream_empty_and_invalid(self):
+        """Test an empty stream and an unknown format"""
+        response = self.client.get(f'{self.url}?min_price=1000&stream=json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+        response = self.client.get(f'{self.url}?stream=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExpenseBulkCreateTestCase(APITestCase):
+    """Test bulk expense creation"""
+
+    def setUp(self):
+        """Set up a user, their category and another user's category"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Food', type='expense', user=self.user)
+        other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.other_category = Category.objects.create(name='Food', type='expense', user=other_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api:expense-bulk-create')
+
+    def items(self, count, category=None):
+        return [
+            {
+                'amount': '12.50',
+                'category': (category or self.category).id,
+                'description': f'Card transaction {i}',
+                'date': '2024-08-01'
+            }
+            for i in range(count)
+        ]
+
+    def test_atomic_create(self):
+        """Test that all items are created and the rollup is updated"""
+        response = self.client.post(self.url, {'expenses': self.items(3)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created_count'], 3)
+        self.assertEqual(len(response.data['expenses']), 3)
+        self.assertEqual(self.user.expenses.count(), 3)
+        self.assertEqual(DailyBalance.objects.get(user=self.user).expense_total, Decimal('37.50'))
+        self.assertEqual(verify_daily_balances(self.user.id), [])
+
+    def test_query_count_does_not_grow_with_items(self):
+        """Test that validation and insertion run a constant number of queries"""
+        # The first batch also creates the day's rollup row
+        self.client.post(self.url, {'expenses': self.items(1)}, format='json')
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, {'expenses': self.items(5)}, format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(self.url, {'expenses': self.items(100)}, format='json')
+        self.assertEqual(len(small), len(large))
+
+    def test_atomic_mode_rejects_everything_on_error(self):
+        """Test that one invalid item blocks the whole batch"""
+        items = self.items(2) + self.items(1, self.other_category)
+        response = self.client.post(self.url, {'expenses': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['errors'][0]['index'], 2)
+        self.assertIn('category', response.data['errors'][0]['errors'])
+        self.assertFalse(self.user.expenses.exists())
+
+    def test_partial_mode(self):
+        """Test that valid items are created and invalid ones reported"""
+        items = self.items(2) + [{'amount': '-1', 'category': self.category.id, 'description': 'Bad', 'date': '2024-08-01'}]
+        response = self.client.post(self.url, {'expenses': items, 'mode': 'partial'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created_count'], 2)
+        self.assertEqual(response.data['failed_count'], 1)
+        self.assertIn('amount', response.data['errors'][0]['errors'])
+        self.assertEqual(self.user.expenses.count(), 2)
+
+    def test_invalid_payload(self):
+        """Test malformed requests"""
+        self.assertEqual(self.client.post(self.url, {'expenses': []}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'expenses': self.items(1), 'mode': 'some'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExpenseImportTestCase(APITestCase):
+    """Test chunked CSV and NDJSON imports"""
+
+    def setUp(self):
+        """Set up a user"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api:expense-import')
+
+    def upload(self, name, content, **data):
+        return self.client.post(
+            self.url, {'file': SimpleUploadedFile(name, content.encode()), **data}, format='multipart'
+        )
+
+    def test_csv_import(self):
+        """Test that rows are imported and missing categories are created once"""
+        content = (
+            'date,amount,description,category,type\n'
+            '2024-08-01,12.50,Lunch,food,\n'
+            '2024-08-02,1500.00,August pay,Salary,income\n'
+            '2024-08-03,40.00,Cinema,Movies,expense\n'
+            '2024-08-04,8.00,Popcorn,movies,\n'
+            '2024-08-05,-3,Refund,Movies,\n'
+        )
+        response = self.upload('bank.csv', content, chunk_size=2)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = response.data['import']
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual((job['rows_processed'], job['rows_created'], job['rows_failed']), (5, 4, 1))
+        self.assertEqual(job['categories_created'], 1)
+        self.assertEqual(job['errors'][0]['row'], 5)
+
+        self.assertEqual(Category.objects.filter(user=self.user, name='Movies').count(), 1)
+        self.assertEqual(self.user.expenses.filter(category__name='Food').count(), 1)
+        self.assertEqual(verify_daily_balances(self.user.id), [])
+
+        response = self.client.get(reverse('api:expense-import-status', kwargs={'pk': job['id']}))
+        self.assertEqual(response.data['import']['rows_created'], 4)
+
+    def test_resume_after_failure(self):
+        """Test that a failed NDJSON import resumes after its last committed chunk"""
+        rows = [
+            json.dumps({'date': '2024-08-01', 'amount': 10 + i, 'description': f'Item {i}', 'category': 'Food'})
+            for i in range(5)
+        ]
+        broken = '\n'.join(rows[:3] + ['{not json'] + rows[3:])
+        response = self.upload('bank.ndjson', broken, chunk_size=2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        job = response.data['import']
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['rows_processed'], 2)
+        self.assertEqual(self.user.expenses.count(), 2)
+
+        response = self.upload('bank.ndjson', '\n'.join(rows), chunk_size=2, import_id=job['id'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['import']['rows_created'], 5)
+        self.assertEqual(self.user.expenses.count(), 5)
+
+    def test_unknown_format(self):
+        """Test that files of unknown type are rejected"""
+        response = self.upload('bank.txt', 'date,amount\n')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_import_id(self):
+        """Test that a non-numeric import_id is rejected"""
+        response = self.upload('bank.csv', 'date,amount,description,category\n', import_id='abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'import_id must be an integer')
+        self.assertFalse(ExpenseImport.objects.exists())
+
+    def test_import_command(self):
+        """Test the management command"""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('date,amount,description,category\n2024-08-01,12.50,Lunch,Food\n')
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('import_expenses', f.name, '--user', 'testuser', stdout=out)
+        self.assertIn('1 created', out.getvalue())
+        self.assertEqual(self.user.expenses.count(), 1)
+
+
+class ExpenseExportTestCase(APITestCase):
+    """Test the streaming CSV export"""
+
+    def setUp(self):
+        """Set up income and expenses over two months"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.income = Category.objects.create(name='Bonus', type='income', user=self.user)
+        self.expense = Category.objects.create(name='Rent', type='expense', user=self.user)
+        rows = [
+            ('100.00', self.income, '2024-07-30'),
+            ('20.00', self.expense, '2024-08-01'),
+            ('5.50', self.expense, '2024-08-02'),
+            ('50.00', self.income, '2024-08-03'),
+        ]
+        for amount, category, day in rows:
+            Expense.objects.create(
+                amount=Decimal(amount), category=category, description='Item, "quoted"', date=day, user=self.user
+            )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api:expense-export-csv')
+
+    def read_csv(self, response):
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+    def test_export_with_filters(self):
+        """Test that the export applies the list filters and joins category data"""
+        rows = self.read_csv(self.client.get(f'{self.url}?start_date=2024-08-01&max_price=30'))
+        self.assertEqual(rows[0], ['id', 'date', 'description', 'category', 'type', 'amount'])
+        self.assertEqual([row[1:] for row in rows[1:]], [
+            ['2024-08-01', 'Item, "quoted"', 'Rent', 'expense', '20.00'],
+            ['2024-08-02', 'Item, "quoted"', 'Rent', 'expense', '5.50'],
+        ])
+
+    def test_running_balance(self):
+        """Test that the running balance starts at start_date and counts filtered-out rows"""
+        response = self.client.get(f'{self.url}?start_date=2024-08-01&category={self.expense.id}&running_balance=1')
+        # All rows, their category data and the filter match come from one query
+        with self.assertNumQueries(1):
+            rows = self.read_csv(response)
+        self.assertEqual(rows[0][-1], 'balance')
+        self.assertEqual([(row[1], row[-1]) for row in rows[1:]], [
+            ('2024-08-01', '10080.00'),
+            ('2024-08-02', '10074.50'),
+        ])
+
+    def test_running_balance_from_start(self):
+        """Test a running balance over the whole history"""
+        rows = self.read_csv(self.client.get(f'{self.url}?running_balance=1'))
+        self.assertEqual([row[-1] for row in rows[1:]], ['10100.00', '10080.00', '10074.50', '10124.50'])
+
+    def test_invalid_filters(self):
+        """Test that every malformed filter is rejected with a 400 before querying"""
+        for query, error in [
+            ('start_date=bad', 'Invalid date format. Use YYYY-MM-DD (e.g., 2024-01-15)'),
+            ('end_date=bad', 'Invalid date format. Use YYYY-MM-DD (e.g., 2024-01-15)'),
+            ('min_price=abc', 'min_price must be a number'),
+            ('max_price=nan', 'max_price must be a number'),
+            ('category=zz', 'category must be a category id'),
+        ]:
+            for running_balance in ('0', '1'):
+                with self.subTest(query=query, running_balance=running_balance):
+                    response = self.client.get(f'{self.url}?{query}&running_balance={running_balance}')
+                    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                    self.assertEqual(response.data, {'error': error})
+
+
+class ExpenseBreakdownTestCase(APITestCase):
+    """Test the grouped time-series breakdown"""
+
+    def setUp(self):
+        """Set up transactions in two months"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.income = Category.objects.create(name='Bonus', type='income', user=self.user)
+        self.food = Category.objects.create(name='Food', type='expense', user=self.user)
+        self.rent = Category.objects.create(name='Rent', type='expense', user=self.user)
+        rows = [
+            ('0.10', self.food, '2024-07-01'),
+            ('0.20', self.food, '2024-07-15'),
+            ('500.00', self.income, '2024-07-31'),
+            ('300.00', self.rent, '2024-08-01'),
+            ('12.00', self.food, '2024-08-05'),
+        ]
+        for amount, category, day in rows:
+            Expense.objects.create(
+                amount=Decimal(amount), category=category, description='Item', date=day, user=self.user
+            )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api:expense-breakdown')
+
+    def test_monthly_breakdown(self):
+        """Test monthly totals computed by one grouped query"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'{self.url}?period=month')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum('GROUP BY' in query['sql'] for query in context.captured_queries), 1)
+        self.assertEqual(response.data['results'], [
+            {
+                'period_start': '2024-07-01', 'total_income': 500.0, 'total_expenses': 0.3,
+                'net_amount': 499.7, 'income_transactions': 1, 'expense_transactions': 2,
+            },
+            {
+                'period_start': '2024-08-01', 'total_income': 0.0, 'total_expenses': 312.0,
+                'net_amount': -312.0, 'income_transactions': 0, 'expense_transactions': 2,
+            },
+        ])
+
+    def test_weekly_breakdown_by_category(self):
+        """Test weekly buckets with a per-category split inside a date range"""
+        response = self.client.get(f'{self.url}?period=week&by_category=1&start_date=2024-07-29')
+        results = response.data['results']
+        self.assertEqual([result['period_start'] for result in results], ['2024-07-29', '2024-08-05'])
+        self.assertEqual(
+            [(category['name'], category['total']) for category in results[0]['categories']],
+            [('Rent', 300.0), ('Bonus', 500.0)]
+        )
+
+    def test_invalid_parameters(self):
+        """Test unknown periods and malformed dates"""
+        self.assertEqual(self.client.get(f'{self.url}?period=hour').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(f'{self.url}?start_date=08-2024').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExpenseSerializerQueryTestCase(APITestCase):
+    """Test that expense validation and rendering do not query per item"""
+
+    def setUp(self):
+        """Set up a user with a few expenses and another user's category"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Food', type='expense', user=self.user)
+        other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.other_category = Category.objects.create(name='Food', type='expense', user=other_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api:expense-list-create')
+
+    def add_expenses(self, count):
+        for i in range(count):
+            Expense.objects.create(
+                amount=Decimal('10.00'), category=self.category, description=f'Item {i}',
+                date=date(2024, 8, 1), user=self.user
+            )
+
+    def test_other_users_category_is_rejected(self):
+        """Test that categories are resolved against the user's own categories only"""
+        for category_id in [self.other_category.id, 999999]:
+            response = self.client.post(self.url, {
+                'amount': '10.00', 'category': category_id, 'description': 'Lunch', 'date': '2024-08-01'
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('category', response.data)
+
+    def test_validation_does_not_load_category_user(self):
+        """Test that validating a category needs only the category map query"""
+        request = APIRequestFactory().post(self.url)
+        request.user = self.user
+        serializer = ExpenseSerializer(data={
+            'amount': '10.00', 'category': self.category.id, 'description': 'Lunch', 'date': '2024-08-01'
+        }, context={'request': request})
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+
+    def test_expanded_list_query_count_is_constant(self):
+        """Test that expanding categories joins them instead of loading each one"""
+        self.add_expenses(2)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(f'{self.url}?expand=category')
+        self.assertEqual(response.data['expenses'][0]['category_detail'], {
+            'id': self.category.id, 'name': 'Food', 'type': 'expense'
+        })
+        self.add_expenses(20)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(f'{self.url}?expand=category')
+        self.assertEqual(len(small), len(large))
+
+    def test_category_detail_is_optional(self):
+        """Test that the default representation is unchanged"""
+        self.add_expenses(1)
+        response = self.client.get(self.url)
+        self.assertNotIn('category_detail', response.data['expenses'][0])
+        self.assertEqual(response.data['expenses'][0]['category'], self.category.id)
+
+
+class FastListSerializerTestCase(APITestCase):
+    """Test that the values_list() fast path renders exactly like the DRF serializers"""
+
+    def setUp(self):
+        """Set up expenses with amounts that are easy to format wrongly"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Food', type='expense', user=self.user)
+        for i, amount in enumerate(['0.10', '1.00', '12345678.90', '7.5']):
+            Expense.objects.create(
+                amount=Decimal(amount), category=self.category, description=f'Çevapi {i}',
+                date=date(2024, 8, 1 + i), user=self.user
+            )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def assertSameJSON(self, serializer_class, queryset):
+        renderer = JSONRenderer()
+        expected = renderer.render(serializer_class(queryset, many=True).data)
+        self.assertEqual(renderer.render(FastListSerializer(serializer_class).serialize(queryset)), expected)
+
+    def test_byte_for_byte_output(self):
+        """Test expense and category output in UTC and another timezone"""
+        for tz in ['UTC', 'Europe/Zagreb']:
+            with self.subTest(tz=tz), timezone.override(tz):
+                self.assertSameJSON(ExpenseSerializer, self.user.expenses.order_by('-created_at', '-id'))
+                self.assertSameJSON(CategorySerializer, self.user.categories.all())
+
+    def test_list_endpoint_output_unchanged(self):
+        """Test that the list endpoint renders what ExpenseSerializer would"""
+        response = self.client.get(reverse('api:expense-list-create'))
+        expected = ExpenseSerializer(self.user.expenses.order_by('-created_at', '-id'), many=True).data
+        self.assertEqual(json.loads(response.content)['expenses'], json.loads(JSONRenderer().render(expected)))
+
+
+class ResponseCacheTestCase(APITestCase):
+    """Test the per-user versioned response cache"""
+
+    def setUp(self):
+        """Set up a user with one expense"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.category = self.user.categories.get(name='Food')
+        Expense.objects.create(
+            amount=Decimal('10.00'), category=self.category, description='Lunch',
+            date=date(2024, 8, 1), user=self.user
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api:expense-list-create')
+        self.balance_url = f"{reverse('api:custom-period-balance')}?start_date=2024-08-01&end_date=2024-08-31"
+        reset_response_cache_stats()
+
+    def test_repeated_get_is_a_hit(self):
+        """Test that an unchanged response is served from the cache"""
+        first = self.client.get(self.url)
+        # Only the data version is read
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(response_cache_stats()['hits'], 1)
+        self.assertEqual(response_cache_stats()['misses'], 1)
+
+    def test_filter_sets_are_cached_separately(self):
+        """Test that the query string is part of the key"""
+        self.client.get(self.url)
+        response = self.client.get(f'{self.url}?min_price=100')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['total_count'], 0)
+
+    def test_writes_invalidate(self):
+        """Test that expense, category, profile and bulk writes change the response"""
+        self.client.get(self.url)
+        self.client.post(self.url, {
+            'amount': '5.00', 'category': self.category.id, 'description': 'Coffee', 'date': '2024-08-02'
+        }, format='json')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['total_count'], 2)
+
+        self.client.get(self.balance_url)
+        self.user.profile.starting_balance = Decimal('100.00')
+        self.user.profile.save()
+        response = self.client.get(self.balance_url)
+        self.assertEqual(response.data['balance']['balance_at_start_of_period'], 100.0)
+
+        self.client.get(reverse('api:category-list-create'))
+        self.category.name = 'Groceries'
+        self.category.save()
+        response = self.client.get(reverse('api:category-list-create'))
+        self.assertIn('Groceries', [category['name'] for category in response.data['categories']])
+
+        self.client.post(reverse('api:expense-bulk-create'), {'expenses': [
+            {'amount': '1.00', 'category': self.category.id, 'description': 'Gum', 'date': '2024-08-03'}
+        ]}, format='json')
+        self.assertEqual(self.client.get(self.url).data['total_count'], 3)
+
+    def test_version_is_shared_through_the_database(self):
+        """Test that the data version survives the cache and a bump from another worker is seen"""
+        self.client.get(self.url)
+        version = data_version(self.user.pk)
+        get_cache().clear()
+        self.assertEqual(data_version(self.user.pk), version)
+
+        self.client.get(self.url)
+        # Another worker's write only reaches this one through the database row
+        DataVersion.objects.for_user(self.user).filter(user=self.user).update(version=F('version') + 1)
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+
+    def test_users_do_not_share_entries(self):
+        """Test that responses are cached per user"""
+        self.client.get(self.url)
+        other = User.objects.create_user(username='otheruser', password='testpass123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=other).key}')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['total_count'], 0)
+
+    def test_streams_are_not_cached(self):
+        """Test that streaming responses bypass the cache"""
+        self.client.get(f'{self.url}?stream=ndjson')
+        self.assertEqual(response_cache_stats()['misses'], 0)
+
+    def test_bump_does_not_touch_entries(self):
+        """Test that invalidation only changes the version"""
+        version = data_version(self.user.pk)
+        bump_data_version(self.user.pk)
+        self.assertGreater(data_version(self.user.pk), version)
+
+
+class ConditionalGetTestCase(APITestCase):
+    """Test ETag handling of the collection endpoints"""
+
+    def setUp(self):
+        """Set up a user with one expense"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.category = self.user.categories.get(name='Food')
+        Expense.objects.create(
+            amount=Decimal('10.00'), category=self.category, description='Lunch',
+            date=date(2024, 8, 1), user=self.user
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.urls = [
+            reverse('api:expense-list-create'),
+            reverse('api:category-list-create'),
+            f"{reverse('api:custom-period-balance')}?start_date=2024-08-01&end_date=2024-08-31",
+        ]
+
+    def test_matching_etag_returns_304_after_version_read(self):
+        """Test that an unchanged resource is answered with 304 after reading only the data version"""
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response['ETag'].startswith('"'))
+            self.assertNotIn('Last-Modified', response)
+
+            with self.assertNumQueries(1):
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(not_modified['ETag'], response['ETag'])
+            self.assertEqual(not_modified.content, b'')
+
+    def test_etag_changes_after_write(self):
+        """Test that a write makes the old ETag stale"""
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+        Expense.objects.create(
+            amount=Decimal('3.00'), category=self.category, description='Snack',
+            date=date(2024, 8, 2), user=self.user
+        )
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['total_count'], 2)
+
+    def test_etag_depends_on_query_and_user(self):
+        """Test that different filter sets and users get different ETags"""
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(f'{url}?min_price=5')['ETag'], etag)
+
+        other = User.objects.create_user(username='otheruser', password='testpass123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=other).key}')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since_is_ignored(self):
+        """Test that a write in the same second as the client's copy is never answered with 304"""
+        url = self.urls[1]
+        self.client.get(url)
+        self.client.post(url, {'name': 'Travel', 'type': 'expense'}, format='json')
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Travel', [category['name'] for category in response.data['categories']])
+
+
+class AsyncViewsTestCase(APITestCase):
+    """Test that the async endpoints match their sync counterparts"""
+
+    def setUp(self):
+        """Set up a user with income and expenses over two months"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        food = self.user.categories.get(name='Food')
+        salary = self.user.categories.get(name='Salary')
+        for i, (category, amount, day) in enumerate([
+            (salary, '1000.00', date(2024, 7, 1)),
+            (food, '25.50', date(2024, 7, 20)),
+            (food, '12.00', date(2024, 8, 3)),
+            (salary, '500.00', date(2024, 8, 15)),
+        ]):
+            Expense.objects.create(
+                amount=Decimal(amount), category=category, description=f'Item {i}', date=day, user=self.user
+            )
+        self.auth = f'Token {self.token.key}'
+        self.client.credentials(HTTP_AUTHORIZATION=self.auth)
+
+    def aget(self, url, authorization=None):
+        headers = {'Authorization': authorization or self.auth} if authorization != '' else {}
+        return async_to_sync(self.async_client.get)(url, headers=headers)
+
+    def test_responses_match_sync_views(self):
+        """Test that the async endpoints return the same bytes as the DRF views"""
+        expenses, categories = reverse('api:expense-list-create'), reverse('api:category-list-create')
+        balance = reverse('api:custom-period-balance')
+        pairs = [
+            (categories, reverse('api:async-category-list')),
+            (expenses, reverse('api:async-expense-list')),
+            (f'{expenses}?min_price=20&expand=category', f"{reverse('api:async-expense-list')}?min_price=20&expand=category"),
+            (f'{expenses}?limit=2&include_total=1', f"{reverse('api:async-expense-list')}?limit=2&include_total=1"),
+            (f'{balance}?start_date=2024-08-02&end_date=2024-08-31',
+             f"{reverse('api:async-custom-period-balance')}?start_date=2024-08-02&end_date=2024-08-31"),
+            (f'{balance}?start_date=2024-08-31&end_date=2024-08-01',
+             f"{reverse('api:async-custom-period-balance')}?start_date=2024-08-31&end_date=2024-08-01"),
+        ]
+        for sync_url, async_url in pairs:
+            expected = self.client.get(sync_url)
+            response = self.aget(async_url)
+            self.assertEqual(response.status_code, expected.status_code, async_url)
+            self.assertEqual(response.content, expected.content, async_url)
+
+    def test_next_page(self):
+        """Test that cursors from the async endpoint lead to the next page"""
+        url = reverse('api:async-expense-list')
+        first = json.loads(self.aget(f'{url}?limit=3').content)
+        second = json.loads(self.aget(f"{url}?limit=3&cursor={first['pagination']['next_cursor']}").content)
+        self.assertEqual(len(first['expenses']) + len(second['expenses']), 4)
+        self.assertFalse(second['pagination']['has_more'])
+
+    def test_authentication_is_required(self):
+        """Test that missing and invalid tokens are rejected like the DRF views do"""
+        url = reverse('api:async-category-list')
+        for authorization in ['', 'Token invalid']:
+            response = self.aget(url, authorization)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(response['WWW-Authenticate'], 'Token')
+            self.assertIn('detail', json.loads(response.content))
+
+    def test_signed_access_token(self):
+        """Test that signed access tokens work on the async endpoints"""
+        access = self.client.post(reverse('token_obtain'), {
+            'username': 'testuser', 'password': 'testpass123'
+        }, format='json').data['access']
+        response = self.aget(reverse('api:async-expense-list'), f'Bearer {access}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['total_count'], 4)
+
+
+class ReplicaRoutingTestCase(APITestCase):
+    """Test read replica routing and read-your-writes pinning"""
+
+    def send(self, method, path, authorization, cookies=None):
+        """Run a request through the middleware; return the response and whether the view used the replica"""
+        seen = []
+
+        def get_response(request):
+            seen.append(reading_from_replica())
+            return HttpResponse(status=status.HTTP_200_OK)
+
+        request = getattr(RequestFactory(), method)(path, HTTP_AUTHORIZATION=authorization)
+        request.COOKIES.update(cookies or {})
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        return response, seen[0]
+
+    def route(self, method, path, authorization, cookies=None):
+        """Whether the view of the request read from the replica"""
+        return self.send(method, path, authorization, cookies)[1]
+
+    def test_router(self):
+        """Test that only reads inside replica_reads() go to the replica"""
+        router = PrimaryReplicaRouter(replica='replica')
+        self.assertEqual(router.db_for_read(Expense), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Expense), 'replica')
+            self.assertEqual(router.db_for_read(Token), 'default')
+            self.assertEqual(router.db_for_write(Expense), 'default')
+            with primary_reads():
+                self.assertEqual(router.db_for_read(Expense), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'api'))
+        self.assertTrue(router.allow_migrate('default', 'api'))
+
+    def test_no_replica_configured(self):
+        """Test that nothing is routed to a replica that does not exist"""
+        self.assertIsNone(replica_alias())
+        self.assertFalse(self.route('get', reverse('api:expense-list-create'), 'Token a'))
+
+    @override_settings(REPLICA_DATABASE_ALIAS='default')
+    def test_listed_get_requests_read_from_replica(self):
+        """Test that GETs of the listed views use the replica and others do not"""
+        authorization = f'Token {uuid.uuid4().hex}'
+        self.assertTrue(self.route('get', reverse('api:expense-list-create'), authorization))
+        self.assertTrue(self.route('get', reverse('api:custom-period-balance'), authorization))
+        self.assertFalse(self.route('get', reverse('api:expense-import-status', kwargs={'pk': 1}), authorization))
+        self.assertFalse(self.route('get', reverse('profile'), authorization))
+        self.assertFalse(self.route('post', reverse('api:expense-list-create'), authorization))
+
+    @override_settings(REPLICA_DATABASE_ALIAS='default', REPLICA_PIN_SECONDS=60)
+    def test_writes_pin_the_caller_to_the_primary(self):
+        """Test that a caller reads from the primary after writing, on any worker"""
+        authorization, other = f'Token {uuid.uuid4().hex}', f'Token {uuid.uuid4().hex}'
+        url = reverse('api:expense-list-create')
+        response, _ = self.send('post', url, authorization)
+        pin = response.cookies[PIN_COOKIE]
+        self.assertEqual(pin['max-age'], 60)
+        # The pin comes back with the caller, whichever process serves them
+        self.assertFalse(self.route('get', url, authorization, {PIN_COOKIE: pin.value}))
+        self.assertTrue(self.route('get', url, other))
+
+        expired = str(int(time.time()) - 1)
+        self.assertTrue(self.route('get', url, authorization, {PIN_COOKIE: expired}))
+        self.assertTrue(self.route('get', url, authorization, {PIN_COOKIE: 'garbage'}))
+
+    @override_settings(REPLICA_DATABASE_ALIAS='default', REPLICA_PIN_SECONDS=60)
+    def test_async_chain(self):
+        """Test that under ASGI the middleware stays async and routes and pins like the sync path"""
+        seen = []
+
+        async def get_response(request):
+            seen.append(reading_from_replica())
+            return HttpResponse(status=status.HTTP_200_OK)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        url = reverse('api:expense-list-create')
+        response = async_to_sync(middleware)(RequestFactory().post(url))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        request = RequestFactory().get(url)
+        async_to_sync(middleware)(request)
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        async_to_sync(middleware)(request)
+        self.assertEqual(seen, [False, True, False])
+
+    @override_settings(REPLICA_DATABASE_ALIAS='default')
+    def test_api_works_through_the_router(self):
+        """Test the API end to end with the replica pointing at the primary"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        url = reverse('api:expense-list-create')
+        response = self.client.post(url, {
+            'amount': '5.00', 'category': user.categories.get(name='Food').id,
+            'description': 'Coffee', 'date': '2024-08-02'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.get(url).data['total_count'], 1)
+
+    def test_replicate_database(self):
+        """Test that the stand-in replication copies the primary file"""
+        with tempfile.TemporaryDirectory() as directory:
+            source, target = os.path.join(directory, 'primary.sqlite3'), os.path.join(directory, 'replica.sqlite3')
+            with closing(sqlite3.connect(source)) as primary:
+                primary.execute('CREATE TABLE item (name TEXT)')
+                primary.execute("INSERT INTO item VALUES ('copied')")
+                primary.commit()
+
+            call_command('replicate_database', source=source, target=target, stdout=StringIO())
+
+            with closing(sqlite3.connect(target)) as replica:
+                self.assertEqual(replica.execute('SELECT name FROM item').fetchall(), [('copied',)])
+
+
+# Defined by budget_api.test_settings, which manage.py uses for `test`, or by SHARDS=3
+SHARD_TEST_DATABASES = {'default', 'shard_1', 'shard_2'} & set(settings.DATABASES)
+
+
+@skipUnless(len(SHARD_TEST_DATABASES) == 3, 'The shard_1 and shard_2 databases are not configured')
+@override_settings(SHARD_DATABASES=['default', 'shard_1', 'shard_2'])
+class ShardingTestCase(APITestCase):
+    """Test user-sharded storage over three SQLite databases"""
+    databases = SHARD_TEST_DATABASES
+
+    def create_user(self, shard, shards=None):
+        """Create users until one is placed on shard by the hash over shards"""
+        while True:
+            user = User.objects.create_user(username=f'user-{uuid.uuid4().hex[:8]}', password='testpass123')
+            if hashed_shard(user, shards) == shard:
+                return user
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+    def add_expense(self, user, amount='25.00', day='2024-03-05'):
+        response = self.client.post(reverse('api:expense-list-create'), {
+            'amount': amount, 'category': user.categories.get(name='Food').id,
+            'description': 'Groceries', 'date': day
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['expense']['id']
+
+    def test_hash_placement(self):
+        """Test that the hash is stable and spreads users over every shard"""
+        shards = ['default', 'shard_1', 'shard_2']
+        self.assertEqual(hashed_shard(42, shards), hashed_shard(42, list(shards)))
+        placements = [hashed_shard(user_id, shards) for user_id in range(1, 301)]
+        for shard in shards:
+            self.assertGreater(placements.count(shard), 60)
+        self.assertEqual(shard_for(42), hashed_shard(42))
+
+    def test_user_rows_live_on_their_shard(self):
+        """Test that a sharded user's profile, categories, expenses and rollups stay on their shard"""
+        # Ids are sequential, so this makes the next user land off the default database
+        while hashed_shard(User.objects.create_user(username=f'user-{uuid.uuid4().hex[:8]}').pk + 1) == 'default':
+            pass
+        response = self.client.post(reverse('register'), {
+            'username': 'sharded', 'password': 'testpass123', 'email': 'sharded@example.com'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user = User.objects.get(username='sharded')
+        shard = shard_for(user)
+        self.assertNotEqual(shard, 'default')
+        other_shards = {'default', 'shard_1', 'shard_2'} - {shard}
+
+        authorization = f'Token {response.data["token"]}'
+        self.client.credentials(HTTP_AUTHORIZATION=authorization)
+        expense_id = self.add_expense(user)
+        response = self.client.get(reverse('api:expense-list-create'))
+        self.assertEqual([expense['id'] for expense in response.data['expenses']], [expense_id])
+        response = self.client.get(reverse('api:custom-period-balance'), {
+            'start_date': '2024-03-01', 'end_date': '2024-03-31'
+        })
+        self.assertEqual(response.data['balance']['balance_at_end_of_period'], 9975.0)
+        response = async_to_sync(self.async_client.get)(
+            reverse('api:async-custom-period-balance'),
+            {'start_date': '2024-03-01', 'end_date': '2024-03-31'},
+            headers={'Authorization': authorization}
+        )
+        self.assertEqual(response.json()['balance']['balance_at_end_of_period'], 9975.0)
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.data['user']['starting_balance'], Decimal('10000.00'))
+
+        for model, count in [(UserProfile, 1), (Category, 4), (Expense, 1), (DailyBalance, 1)]:
+            self.assertEqual(model.objects.using(shard).filter(user_id=user.pk).count(), count)
+            for other in other_shards:
+                self.assertFalse(model.objects.using(other).filter(user_id=user.pk).exists())
+
+    def test_shard_user_stub(self):
+        """Test that a shard keeps an unusable id-only copy of its users"""
+        user = self.create_user('shard_1')
+        stub = User.objects.using('shard_1').get(pk=user.pk)
+        self.assertEqual(stub.username, f'user-{user.pk}')
+        self.assertFalse(stub.has_usable_password())
+        self.assertGreater(user.categories.first().pk, SHARD_ID_SPACE)
+
+    def test_move_user(self):
+        """Test that moving a user keeps their ids, pins them to the new shard and frees the old one"""
+        user = self.create_user('shard_1')
+        self.authenticate(user)
+        expense_id = self.add_expense(user)
+        category_ids = set(user.categories.values_list('id', flat=True))
+
+        out = StringIO()
+        call_command('rebalance_shards', user=user.pk, to='shard_2', stdout=out)
+        self.assertIn('Moved 1 user(s)', out.getvalue())
+        self.assertEqual(shard_for(user), 'shard_2')
+        self.assertTrue(ShardAssignment.objects.filter(user=user, database='shard_2').exists())
+        self.assertFalse(User.objects.using('shard_1').filter(pk=user.pk).exists())
+        self.assertFalse(Expense.objects.using('shard_1').filter(user_id=user.pk).exists())
+        self.assertEqual(set(Category.objects.using('shard_2').filter(user_id=user.pk).values_list('id', flat=True)), category_ids)
+
+        response = self.client.get(reverse('api:expense-detail', kwargs={'pk': expense_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.add_expense(user, amount='5.00')
+        self.assertEqual(verify_daily_balances(user.pk), [])
+
+        call_command('rebalance_shards', user=user.pk, to='shard_1', stdout=StringIO())
+        self.assertFalse(ShardAssignment.objects.filter(user=user).exists())
+        self.assertEqual(user.expenses.count(), 2)
+
+    def test_move_user_off_default(self):
+        """Test that a user moved off the default database leaves no rows or rollup changes behind"""
+        user = self.create_user('default')
+        self.authenticate(user)
+        self.add_expense(user)
+        call_command('rebalance_shards', user=user.pk, to='shard_1', stdout=StringIO())
+
+        for model in [UserProfile, Category, Expense, DailyBalance]:
+            self.assertFalse(model.objects.using('default').filter(user_id=user.pk).exists())
+        self.assertEqual(user.daily_balances.get().expense_total, Decimal('25.00'))
+        self.assertEqual(verify_daily_balances(user.pk), [])
+
+    def test_rebalance_after_adding_shards(self):
+        """Test that users created before shards were added are moved to their hashed shard"""
+        shards = ['default', 'shard_1', 'shard_2']
+        with override_settings(SHARD_DATABASES=['default']):
+            user = self.create_user('shard_2', shards)
+            self.authenticate(user)
+            self.add_expense(user)
+
+        out = StringIO()
+        call_command('rebalance_shards', dry_run=True, stdout=out)
+        self.assertIn(f'User {user.pk}: default -> shard_2', out.getvalue())
+        self.assertTrue(user.categories.using('default').exists())
+
+        call_command('rebalance_shards', stdout=StringIO())
+        self.assertFalse(ShardAssignment.objects.exists())
+        self.assertEqual(Expense.objects.using('shard_2').filter(user_id=user.pk).count(), 1)
+        response = self.client.get(reverse('api:expense-list-create'))
+        self.assertEqual(response.data['total_count'], 1)
+
+    def test_rebalance_rejects_unknown_shard(self):
+        """Test that users can only be moved to configured shards"""
+        user = self.create_user('default')
+        with self.assertRaises(CommandError):
+            call_command('rebalance_shards', user=user.pk, to='replica', stdout=StringIO())
+
+    def test_deleting_user_deletes_shard_rows(self):
+        """Test that deleting a user removes their rows and stub from their shard"""
+        user = self.create_user('shard_2')
+        self.authenticate(user)
+        self.add_expense(user)
+        user.delete()
+        self.assertFalse(User.objects.using('shard_2').filter(pk=user.pk).exists())
+        for model in [UserProfile, Category, Expense, DailyBalance]:
+            self.assertFalse(model.objects.using('shard_2').filter(user_id=user.pk).exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BenchmarkSuiteTestCase(APITestCase):
+    """Test the seeded dataset and endpoint scenarios of benchmark_endpoints"""
+
+    def test_scenarios_cover_every_route(self):
+        """Test that every route of api.urls and accounts.urls has a scenario"""
+        self.assertEqual(set(route_names()) - {scenario.route for scenario in SCENARIOS}, set())
+
+    def test_seed_dataset_is_deterministic(self):
+        """Test that the same seed produces the same expenses"""
+        def seeded():
+            user, = seed_dataset(1, 50, 1, seed=7)
+            rows = list(user.expenses.order_by('id').values_list('amount', 'date', 'category__name'))
+            self.assertEqual(verify_daily_balances(user.pk), [])
+            user.delete()
+            return rows
+
+        self.assertEqual(seeded(), seeded())
+
+    def test_every_scenario_answers(self):
+        """Test that every scenario gets its expected status code"""
+        user, = seed_dataset(1, 50, 1)
+        data = BenchmarkData(user, 1)
+        for scenario in SCENARIOS:
+            with self.subTest(scenario=scenario.key):
+                response = scenario.send(self.client, scenario.build(data))
+                self.assertEqual(response.status_code, scenario.status_code)
+
+    def test_compare_results(self):
+        """Test that extra queries and large slowdowns are reported, noise is not"""
+        baseline = {'endpoints': {
+            'GET a': {'p50_ms': 10.0, 'p95_ms': 12.0, 'queries': 2, 'peak_kb': 100},
+            'GET b': {'p50_ms': 0.5, 'p95_ms': 0.7, 'queries': 1, 'peak_kb': 10},
+        }}
+        results = {'endpoints': {
+            'GET a': {'p50_ms': 15.0, 'p95_ms': 13.0, 'queries': 3, 'peak_kb': 100},
+            'GET b': {'p50_ms': 0.9, 'p95_ms': 1.2, 'queries': 1, 'peak_kb': 20},
+            'GET c': {'p50_ms': 50.0, 'p95_ms': 60.0, 'queries': 9, 'peak_kb': 900},
+        }}
+        self.assertEqual(compare_results(results, baseline, 0.25), [
+            'GET a: 2 -> 3 queries',
+            'GET a: p50_ms 10.0 -> 15.0',
+        ])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoadTestCommandTestCase(LiveServerTestCase):
+    """Test the load_test command against a live server"""
+
+    def test_load_test_reports_every_operation(self):
+        """Test that synthetic users are registered and every operation of the mix is sent"""
+        report_path = os.path.join(tempfile.mkdtemp(), 'load.json')
+        out = StringIO()
+        call_command(
+            'load_test', url=self.live_server_url, users=1, requests=40, prefix='load',
+            json=report_path, stdout=out
+        )
+        with open(report_path) as f:
+            report = json.load(f)
+
+        operations = report['operations']
+        self.assertEqual(operations['total']['requests'], 40)
+        self.assertEqual(set(operations), {'login', 'list', 'create', 'update', 'delete', 'balance', 'total'})
+        self.assertEqual(operations['total']['errors'], {})
+        user = User.objects.get(username='load-0')
+        self.assertEqual(
+            user.expenses.count(),
+            operations['create']['requests'] - operations['delete']['requests']
+        )
+
+        # The second run logs the existing user in
+        call_command('load_test', url=self.live_server_url, users=1, requests=5, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='load-').count(), 1)
+
+    def test_unreachable_server_counts_errors(self):
+        """Test that connection failures are reported instead of raised"""
+        out = StringIO()
+        call_command('load_test', url='http://127.0.0.1:9', users=2, requests=1, stdout=out)
+        self.assertIn('login: 2 x ConnectionRefusedError', out.getvalue())
+
+    def test_parse_mix(self):
+        """Test that the operation mix is validated"""
+        self.assertEqual(parse_mix('list=3, create=1'), {'list': 3, 'create': 1})
+        for mix in ['list=0', 'browse=1', 'list=x', 'list=-1']:
+            with self.subTest(mix=mix), self.assertRaises(CommandError):
+                parse_mix(mix)
+
+
+@override_settings(REQUEST_TIMING={'SAMPLE_RATE': 1}, RESPONSE_CACHE={'ENABLED': False})
+class RequestTimingTestCase(APITestCase):
+    """Test the Server-Timing header and log line of RequestTimingMiddleware"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def timings(self, response):
+        return {
+            metric.split(';')[0]: metric for metric in response['Server-Timing'].split(', ')
+        }
+
+    def test_function_and_class_based_views_are_timed(self):
+        """Test that every kind of view gets db, view, render and total timings"""
+        urls = [
+            reverse('api:category-list-create'),
+            reverse('api:category-types'),
+            reverse('api:custom-period-balance') + '?start_date=2024-01-01&end_date=2024-01-31',
+            reverse('profile'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                timings = self.timings(response)
+                self.assertEqual(list(timings), ['db', 'view', 'render', 'total'])
+                self.assertIn(f'desc="{len(queries)} queries"', timings['db'])
+
+    async def test_async_views_are_timed(self):
+        """Test that requests through the ASGI handler are measured too"""
+        url = reverse('api:async-custom-period-balance') + '?start_date=2024-01-01&end_date=2024-01-31'
+        response = await self.async_client.get(url, headers={'Authorization': 'Token ' + self.token.key})
+        self.assertEqual(response.status_code, 200)
+        timings = self.timings(response)
+        self.assertEqual(list(timings)[0], 'db')
+        self.assertIn('view', timings)
+        self.assertNotIn('desc="0 queries"', timings['db'])
+
+    def test_log_line(self):
+        """Test that a sampled request is logged as one JSON line"""
+        with self.assertLogs('budget_api.timing', 'INFO') as logs:
+            self.client.get(reverse('api:expense-list-create'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'api:expense-list-create')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertEqual(
+            set(record) - {'method', 'path', 'view', 'status', 'queries'},
+            {'db_ms', 'view_ms', 'render_ms', 'total_ms'}
+        )
+
+    def test_sampling(self):
+        """Test that requests outside the sample are not measured"""
+        with override_settings(REQUEST_TIMING={'SAMPLE_RATE': 0}):
+            response = self.client.get(reverse('api:category-types'))
+        self.assertNotIn('Server-Timing', response)
+
+
+# Queries of the first balance request of a user, which stores their monthly checkpoints
+# and re-reads the latest one under the checkpoint lock first
+CHECKPOINT_FILL_QUERIES = 8
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    RESPONSE_CACHE={'ENABLED': False},
+    REQUEST_TIMING={'SAMPLE_RATE': 0},
+)
+class QueryBudgetTestCase(APITestCase):
+    """Test every route against its settings.QUERY_BUDGETS entry at a small and a large data size"""
+
+    def assert_within_budgets(self, expenses, years):
+        user, = seed_dataset(1, expenses, years)
+        data = BenchmarkData(user, years)
+        # Checkpoints are filled once per user, which test_checkpoint_fill covers
+        net_before_month(user, month_start(date.fromisoformat(data.period()['start_date'])))
+        for scenario in SCENARIOS:
+            budget = settings.QUERY_BUDGETS[scenario.budget_key]
+            # The first request also fills per-process caches, e.g. of tokens
+            for attempt in ('first', 'repeated'):
+                with self.subTest(scenario=scenario.key, request=attempt, expenses=expenses):
+                    self.assertLessEqual(scenario.queries(self.client, data), budget)
+
+    def test_every_route_has_a_budget(self):
+        """Test that QUERY_BUDGETS covers every scenario"""
+        self.assertEqual({scenario.budget_key for scenario in SCENARIOS} - set(settings.QUERY_BUDGETS), set())
+
+    def test_small_dataset(self):
+        """Test the budgets with a handful of expenses"""
+        self.assert_within_budgets(10, 1)
+
+    def test_large_dataset(self):
+        """Test the budgets with enough expenses to fill pages, months and checkpoints"""
+        self.assert_within_budgets(1500, 3)
+
+    def test_checkpoint_fill(self):
+        """Test that the balance request filling a user's checkpoints runs a fixed number of queries"""
+        user, = seed_dataset(1, 1500, 3)
+        data = BenchmarkData(user, 3)
+        for key in ('GET api:custom-period-balance', 'GET api:async-custom-period-balance'):
+            scenario = next(scenario for scenario in SCENARIOS if scenario.key == key)
+            MonthlyBalance.objects.filter(user=user).delete()
+            with self.subTest(scenario=key):
+                # Also reads the rollups grouped by month and inserts every checkpoint at once
+                self.assertLessEqual(scenario.queries(self.client, data), CHECKPOINT_FILL_QUERIES)
+                self.assertEqual(MonthlyBalance.objects.filter(user=user).count(), 18)
+                self.assertLessEqual(scenario.queries(self.client, data), settings.QUERY_BUDGETS[key])
+
+    def test_runtime_warning(self):
+        """Test that QUERY_BUDGET_WARNINGS logs requests over budget"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user)
+        url = reverse('api:category-list-create')
+        with self.settings(QUERY_BUDGET_WARNINGS=True, QUERY_BUDGETS={'GET api:category-list-create': 0}):
+            with self.assertLogs('budget_api.query_budget', 'WARNING') as logs:
+                self.client.get(url)
+        self.assertIn('over its budget of 0', logs.output[0])
+        with self.settings(QUERY_BUDGET_WARNINGS=True), self.assertNoLogs('budget_api.query_budget'):
+            self.client.get(url)
+
+
+@override_settings(REQUEST_PROFILING={'TOP_FUNCTIONS': 5})
+class RequestProfilingTestCase(APITestCase):
+    """Test on-demand request profiling and the staff-only profile endpoints"""
+
+    def setUp(self):
+        get_profile_buffer().clear()
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.staff_token = Token.objects.create(user=self.staff)
+        self.user_token = Token.objects.create(user=self.user)
+        self.balance_url = reverse('api:custom-period-balance') + '?start_date=2024-01-01&end_date=2024-01-31'
+
+    def authenticate(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_staff_request_is_profiled(self):
+        """Test that ?profile=1 stores the hottest functions and the SQL of a staff request"""
+        self.authenticate(self.staff_token)
+        response = self.client.get(self.balance_url + '&profile=1')
+        self.assertEqual(response.status_code, 200)
+        profile_id = response['X-Profile-Id']
+
+        response = self.client.get(reverse('api:request-profile-list'))
+        summary, = response.data['profiles']
+        self.assertEqual(summary['id'], profile_id)
+        self.assertEqual(summary['view'], 'api:custom-period-balance')
+        self.assertEqual(summary['user'], 'staff')
+
+        response = self.client.get(reverse('api:request-profile-detail', kwargs={'profile_id': profile_id}))
+        profile = response.data['profile']
+        self.assertEqual(len(profile['functions']), 5)
+        self.assertEqual(len(profile['queries']), profile['query_count'])
+        self.assertTrue(any('api_dailybalance' in query['sql'] for query in profile['queries']))
+
+    def test_header_flag(self):
+        """Test that the X-Profile header also asks for a profile"""
+        self.authenticate(self.staff_token)
+        response = self.client.get(reverse('api:category-list-create'), headers={'X-Profile': '1'})
+        self.assertIn('X-Profile-Id', response)
+
+    def test_non_staff_is_not_profiled(self):
+        """Test that the flag is ignored for other users, who cannot read profiles either"""
+        self.authenticate(self.user_token)
+        response = self.client.get(self.balance_url + '&profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(get_profile_buffer().latest(), [])
+        response = self.client.get(reverse('api:request-profile-list'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_buffer_is_bounded(self):
+        """Test that only the latest BUFFER_SIZE profiles are kept"""
+        self.authenticate(self.staff_token)
+        with self.settings(REQUEST_PROFILING={'BUFFER_SIZE': 2}):
+            ids = [self.client.get(self.balance_url + '&profile=1')['X-Profile-Id'] for _ in range(3)]
+            response = self.client.get(reverse('api:request-profile-list'))
+            self.assertEqual([profile['id'] for profile in response.data['profiles']], ids[:0:-1])
+            response = self.client.get(reverse('api:request-profile-detail', kwargs={'profile_id': ids[0]}))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_asgi_request_is_profiled(self):
+        """Test that a sync view served through the ASGI handler is profiled"""
+        response = await self.async_client.get(
+            self.balance_url + '&profile=1', headers={'Authorization': 'Token ' + self.staff_token.key}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(get_profile_buffer().get(response['X-Profile-Id']))
+
+    def test_asgi_handler_is_not_adapted(self):
+        """Test that no middleware makes Django adapt the ASGI handler chain to sync"""
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    def arm(self, user, **data):
+        self.authenticate(self.staff_token)
+        return self.client.post(reverse('api:request-profile-target-list'), {'user': user.pk, **data}, format='json')
+
+    def test_armed_user_is_profiled(self):
+        """Test that the next requests of an armed user are profiled and record who asked for them"""
+        response = self.arm(self.user, requests=2, seconds=60)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['target']['remaining'], 2)
+        targets = self.client.get(reverse('api:request-profile-target-list')).data['targets']
+        self.assertEqual([target['user'] for target in targets], ['testuser'])
+
+        self.authenticate(self.user_token)
+        responses = [self.client.get(self.balance_url) for _ in range(3)]
+        self.assertEqual(['X-Profile-Id' in response for response in responses], [True, True, False])
+
+        self.authenticate(self.staff_token)
+        profiles = self.client.get(reverse('api:request-profile-list')).data['profiles']
+        self.assertEqual(
+            [(profile['user'], profile['requested_by']) for profile in profiles], [('testuser', 'staff')] * 2
+        )
+        self.assertEqual(self.client.get(reverse('api:request-profile-target-list')).data['targets'], [])
+
+    def test_arming_reaches_other_processes(self):
+        """Test that a target armed through another process is picked up from the database"""
+        ProfilingTarget.objects.create(
+            user=self.user, remaining=1, expires_at=timezone.now() + timedelta(minutes=1), armed_by=self.staff
+        )
+        self.authenticate(self.user_token)
+        with self.settings(REQUEST_PROFILING={'ARM_REFRESH': 0}):
+            self.assertIn('X-Profile-Id', self.client.get(self.balance_url))
+            self.assertNotIn('X-Profile-Id', self.client.get(self.balance_url))
+        self.assertEqual(ProfilingTarget.objects.get(user=self.user).remaining, 0)
+
+    def test_busy_profiler_keeps_the_armed_request(self):
+        """Test that a request left unprofiled because cProfile is busy does not use up the target"""
+        self.arm(self.user, requests=1)
+        self.authenticate(self.user_token)
+        with mock.patch.object(cProfile.Profile, 'enable', side_effect=ValueError):
+            response = self.client.get(self.balance_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(ProfilingTarget.objects.get(user=self.user).remaining, 1)
+        self.assertIn('X-Profile-Id', self.client.get(self.balance_url))
+
+    def test_expired_target_is_not_profiled(self):
+        """Test that a target past its expiry time is ignored"""
+        ProfilingTarget.objects.create(
+            user=self.user, remaining=5, expires_at=timezone.now() - timedelta(seconds=1), armed_by=self.staff
+        )
+        self.authenticate(self.user_token)
+        with self.settings(REQUEST_PROFILING={'ARM_REFRESH': 0}):
+            self.assertNotIn('X-Profile-Id', self.client.get(self.balance_url))
+
+    def test_disarm(self):
+        """Test that disarming stops profiling the user's requests"""
+        self.arm(self.user)
+        response = self.client.delete(reverse('api:request-profile-target-detail', kwargs={'user_id': self.user.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.authenticate(self.user_token)
+        self.assertNotIn('X-Profile-Id', self.client.get(self.balance_url))
+        self.assertFalse(ProfilingTarget.objects.exists())
+
+    def test_arm_validation(self):
+        """Test that arming needs staff, an existing user and positive integers"""
+        self.authenticate(self.user_token)
+        url = reverse('api:request-profile-target-list')
+        self.assertEqual(self.client.post(url, {'user': self.user.pk}).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.arm(self.user, requests='many').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.arm(self.user, seconds=0).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.post(url, {'user': self.user.pk + 100}, format='json').status_code, status.HTTP_404_NOT_FOUND
+        )
+
+    def test_busy_profiler_serves_the_request_unprofiled(self):
+        """Test that a request is served without a profile when another profiler is already active"""
+        self.authenticate(self.staff_token)
+        with mock.patch.object(cProfile.Profile, 'enable', side_effect=ValueError('Another profiling tool is active')):
+            response = self.client.get(self.balance_url + '&profile=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(get_profile_buffer().latest(), [])
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'api'
 
@@ -11,8 +11,24 @@ urlpatterns = [
     
     # Expense endpoints
     path('expenses/', views.ExpenseListCreateView.as_view(), name='expense-list-create'),
+    path('expenses/bulk/', views.bulk_create_expenses, name='expense-bulk-create'),
+    path('expenses/export.csv', views.export_expenses_csv, name='expense-export-csv'),
+    path('expenses/breakdown/', views.expense_breakdown, name='expense-breakdown'),
+    path('expenses/import/', views.import_expenses, name='expense-import'),
+    path('expenses/import/<int:pk>/', views.import_status, name='expense-import-status'),
     path('expenses/<int:pk>/', views.ExpenseDetailView.as_view(), name='expense-detail'),
     
     # Balance endpoint
     path('expenses/balance/', views.custom_period_balance, name='custom-period-balance'),
+    
+    # Async read endpoints for ASGI deployments
+    path('async/categories/', async_views.category_list, name='async-category-list'),
+    path('async/expenses/', async_views.expense_list, name='async-expense-list'),
+    path('async/expenses/balance/', async_views.custom_period_balance, name='async-custom-period-balance'),
+    
+    # Staff-only request profiles
+    path('profiles/', views.request_profiles, name='request-profile-list'),
+    path('profiles/targets/', views.profiling_targets, name='request-profile-target-list'),
+    path('profiles/targets/<int:user_id>/', views.profiling_target_detail, name='request-profile-target-detail'),
+    path('profiles/<str:profile_id>/', views.request_profile_detail, name='request-profile-detail'),
 ] 
\ No newline at end of file
@@ -1,16 +1,43 @@
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from django.shortcuts import get_object_or_404
-from .models import Category
-from .serializers import CategorySerializer, ExpenseSerializer
+from django.utils.decorators import method_decorator
+from django.contrib.auth.models import User
+from budget_api.profiling import (
+    arm_profiling, armed_targets, disarm_profiling, get_profile_buffer, profile_summary, profiling_settings,
+    target_summary,
+)
+from budget_api.sharding import atomic_for
+from .models import Category, Expense, ExpenseImport
+from .serializers import CategorySerializer, ExpenseImportSerializer, ExpenseSerializer
+from .importers import DEFAULT_CHUNK_SIZE, ExpenseImporter, ImportFileError, detect_format, iter_rows
+from .ledger import record_expenses_created
+from .cache import bump_data_version, cache_user_response
+from .balance import balance_before, compute_period_balance, starting_balance
+from .fast_serializers import FastListSerializer
+from .exports import EXPORT_HEADER, expense_export_rows, expense_export_rows_with_balance
+from .pagination import InvalidCursor, KeysetPagination
+from .reports import BREAKDOWN_PERIODS, period_breakdown
+from .streaming import STREAM_FORMATS, streaming_csv_response, streaming_json_response
 from datetime import datetime
-from django.db.models import Sum
+from decimal import Decimal, InvalidOperation
 from django.utils import timezone
 from datetime import timedelta
+import csv
+import io
+
+
+BULK_CREATE_MAX_ITEMS = 1000
+BULK_CREATE_BATCH_SIZE = 500
+IMPORT_MAX_CHUNK_SIZE = 5000
+
+# Read-only list serialization over values_list() rows
+fast_category_serializer = FastListSerializer(CategorySerializer)
+fast_expense_serializer = FastListSerializer(ExpenseSerializer)
 
 
 class CategoryListCreateView(ListCreateAPIView):
@@ -20,15 +47,15 @@ class CategoryListCreateView(ListCreateAPIView):
     
     def get_queryset(self):
         """Return categories for the authenticated user"""
-        return Category.objects.filter(user=self.request.user)
+        return Category.objects.for_user(self.request.user)
     
+    @method_decorator(cache_user_response('categories'))
     def get(self, request, *args, **kwargs):
         """Get all categories for the authenticated user"""
         categories = self.get_queryset()
-        serializer = self.get_serializer(categories, many=True)
         return Response({
             'message': 'Categories retrieved successfully',
-            'categories': serializer.data
+            'categories': fast_category_serializer.serialize(categories)
         }, status=status.HTTP_200_OK)
     
     def post(self, request, *args, **kwargs):
@@ -50,7 +77,7 @@ class CategoryDetailView(RetrieveUpdateDestroyAPIView):
     
     def get_queryset(self):
         """Return categories for the authenticated user"""
-        return Category.objects.filter(user=self.request.user)
+        return Category.objects.for_user(self.request.user)
     
     def get(self, request, *args, **kwargs):
         """Get a specific category"""
@@ -98,53 +125,139 @@ def category_types(request):
     }, status=status.HTTP_200_OK)
 
 
-class ExpenseListCreateView(ListCreateAPIView):
+EXPENSE_FILTER_PARAMS = ['category', 'min_price', 'max_price', 'start_date', 'end_date']
+
+
+def expense_filters(query_params, include=EXPENSE_FILTER_PARAMS):
+    """Build queryset filters from the expense list query parameters"""
+    # Build filters dictionary
+    filters = {}
+    
+    # Category filter
+    if 'category' in include and query_params.get('category'):
+        filters['category_id'] = query_params.get('category')
+    
+    # Price filters
+    if 'min_price' in include and query_params.get('min_price'):
+        filters['amount__gte'] = query_params.get('min_price')
+    if 'max_price' in include and query_params.get('max_price'):
+        filters['amount__lte'] = query_params.get('max_price')
+    
+    # Date filters - using date field
+    if 'start_date' in include and query_params.get('start_date'):
+        filters['date__gte'] = query_params.get('start_date')
+    if 'end_date' in include and query_params.get('end_date'):
+        filters['date__lte'] = query_params.get('end_date')
+    
+    return filters
+
+
+def wants_expanded_category(query_params):
+    """Whether ?expand=category was passed"""
+    return 'category' in query_params.get('expand', '').split(',')
+
+
+def filters_applied(query_params):
+    """The expense filters present in the query string, echoed back in list responses"""
+    return {k: v for k, v in query_params.items() if k in EXPENSE_FILTER_PARAMS}
+
+
+class ExpandCategoryMixin:
+    """Add category name and type to expenses when ?expand=category is passed"""
+    
+    def expand_category(self):
+        return wants_expanded_category(self.request.query_params)
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand_category'] = self.expand_category()
+        return context
+    
+    def get_expense_queryset(self):
+        """Return the user's expenses, joining categories when they are expanded"""
+        queryset = self.request.user.expenses.all()
+        if self.expand_category():
+            queryset = queryset.select_related('category')
+        return queryset
+
+
+class ExpenseListCreateView(ExpandCategoryMixin, ListCreateAPIView):
     """View for listing and creating expenses with filtering"""
     serializer_class = ExpenseSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         """Return filtered expenses for the authenticated user"""
-        queryset = self.request.user.expenses.all()
+        queryset = self.get_expense_queryset()
         
-        # Build filters dictionary
-        filters = {}
-        
-        # Category filter
-        if self.request.query_params.get('category'):
-            filters['category_id'] = self.request.query_params.get('category')
-        
-        # Price filters
-        if self.request.query_params.get('min_price'):
-            filters['amount__gte'] = self.request.query_params.get('min_price')
-        if self.request.query_params.get('max_price'):
-            filters['amount__lte'] = self.request.query_params.get('max_price')
-        
-        # Date filters - using date field
-        if self.request.query_params.get('start_date'):
-            filters['date__gte'] = self.request.query_params.get('start_date')
-        if self.request.query_params.get('end_date'):
-            filters['date__lte'] = self.request.query_params.get('end_date')
-        
-        # Apply allfilters at once
-        return queryset.filter(**filters).order_by('-created_at')
+        # Apply all filters at once, id breaks ties between equal timestamps
+        return queryset.filter(**expense_filters(self.request.query_params)).order_by('-created_at', '-id')
     
+    @method_decorator(cache_user_response('expenses', skip_params=['stream']))
     def get(self, request, *args, **kwargs):
         """Get filtered expenses for the authenticated user"""
         expenses = self.get_queryset()
-        serializer = self.get_serializer(expenses, many=True)
         
-        # Get applied filters
-        filters_applied = {k: v for k, v in request.query_params.items() 
-                          if k in ['category', 'min_price', 'max_price', 'start_date', 'end_date']}
+        stream = request.query_params.get('stream')
+        if stream:
+            return self.get_stream(expenses, stream)
+        
+        paginator = KeysetPagination(request)
+        if paginator.is_requested():
+            return self.get_page(paginator, expenses)
         
+        if self.expand_category():
+            data = self.get_serializer(expenses, many=True).data
+        else:
+            data = fast_expense_serializer.serialize(expenses)
         return Response({
             'message': 'Expenses retrieved successfully',
-            'filters_applied': filters_applied,
-            'total_count': expenses.count(),
-            'expenses': serializer.data
+            'filters_applied': filters_applied(request.query_params),
+            'total_count': len(data),
+            'expenses': data
         }, status=status.HTTP_200_OK)
     
+    def get_stream(self, expenses, stream):
+        """Stream filtered expenses as a JSON array or NDJSON"""
+        stream_format = STREAM_FORMATS.get(stream.lower())
+        if stream_format is None:
+            return Response({
+                'error': 'Invalid stream format. Use stream=1, stream=json or stream=ndjson'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not self.expand_category():
+            return streaming_json_response(
+                fast_expense_serializer.rows(expenses), fast_expense_serializer.row_serializer(), stream_format
+            )
+        
+        context = self.get_serializer_context()
+        return streaming_json_response(
+            expenses,
+            lambda expense: ExpenseSerializer(expense, context=context).data,
+            stream_format
+        )
+    
+    def get_page(self, paginator, expenses):
+        """Get one keyset-paginated page of filtered expenses"""
+        try:
+            page, next_cursor, has_more = paginator.paginate(expenses)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response_data = {
+            'message': 'Expenses retrieved successfully',
+            'filters_applied': filters_applied(self.request.query_params),
+            'pagination': {
+                'limit': paginator.get_limit(),
+                'next_cursor': next_cursor,
+                'has_more': has_more
+            },
+            'expenses': self.get_serializer(page, many=True).data
+        }
+        if paginator.wants_total():
+            response_data['total_count'] = expenses.count()
+        return Response(response_data, status=status.HTTP_200_OK)
+    
     def post(self, request, *args, **kwargs):
         """Create a new expense for the authenticated user"""
         serializer = self.get_serializer(data=request.data)
@@ -157,14 +270,249 @@ class ExpenseListCreateView(ListCreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ExpenseDetailView(RetrieveUpdateDestroyAPIView):
+def parse_export_filters(query_params):
+    """
+    Validate the expense filters of the CSV export and return start_date as a date, or None.
+
+    Raises ValueError with the error message of the 400 response, so a bad
+    filter never reaches the query.
+    """
+    dates = {}
+    for param in ('start_date', 'end_date'):
+        if query_params.get(param):
+            try:
+                dates[param] = datetime.strptime(query_params[param], '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError('Invalid date format. Use YYYY-MM-DD (e.g., 2024-01-15)')
+    
+    for param in ('min_price', 'max_price'):
+        if query_params.get(param):
+            try:
+                valid = Decimal(query_params[param]).is_finite()
+            except InvalidOperation:
+                valid = False
+            if not valid:
+                raise ValueError(f'{param} must be a number')
+    
+    if query_params.get('category'):
+        try:
+            int(query_params['category'])
+        except ValueError:
+            raise ValueError('category must be a category id')
+    return dates.get('start_date')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_expenses_csv(request):
+    """
+    Stream filtered expenses as CSV, oldest first.
+
+    Accepts the expense list filters. With running_balance=1 a balance
+    column is added, starting from the balance at start_date (or the
+    starting balance) and moved by every transaction in the date range,
+    including ones hidden by the category or price filters.
+    """
+    user = request.user
+    params = request.query_params
+    
+    try:
+        start_date = parse_export_filters(params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if params.get('running_balance', '').lower() not in ('1', 'true', 'yes'):
+        expenses = user.expenses.filter(**expense_filters(params))
+        return streaming_csv_response(EXPORT_HEADER, expense_export_rows(expenses), 'expenses.csv')
+    
+    expenses = user.expenses.filter(**expense_filters(params, include=['start_date', 'end_date']))
+    row_filters = expense_filters(params, include=['category', 'min_price', 'max_price'])
+    opening_balance = balance_before(user, start_date) if start_date else starting_balance(user)
+    return streaming_csv_response(
+        EXPORT_HEADER + ['balance'],
+        expense_export_rows_with_balance(expenses, row_filters, opening_balance),
+        'expenses.csv'
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def expense_breakdown(request):
+    """Get income and expense totals grouped by day, week, month or year"""
+    period = request.query_params.get('period', 'month')
+    by_category = request.query_params.get('by_category', '').lower() in ('1', 'true', 'yes')
+    
+    if period not in BREAKDOWN_PERIODS:
+        return Response({
+            'error': f'period must be one of: {", ".join(BREAKDOWN_PERIODS)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Optional date range
+    filters = {}
+    try:
+        if request.query_params.get('start_date'):
+            filters['date__gte'] = datetime.strptime(request.query_params['start_date'], '%Y-%m-%d').date()
+        if request.query_params.get('end_date'):
+            filters['date__lte'] = datetime.strptime(request.query_params['end_date'], '%Y-%m-%d').date()
+    except ValueError:
+        return Response({
+            'error': 'Invalid date format. Use YYYY-MM-DD (e.g., 2024-01-15)'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = period_breakdown(request.user.expenses.filter(**filters), period, by_category)
+    
+    return Response({
+        'message': 'Breakdown calculated successfully',
+        'period': period,
+        'start_date': request.query_params.get('start_date'),
+        'end_date': request.query_params.get('end_date'),
+        'by_category': by_category,
+        'results': results
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_create_expenses(request):
+    """
+    Create many expenses at once.
+
+    Expects {"expenses": [...], "mode": "atomic" | "partial"}. In atomic mode
+    (the default) nothing is created if any item is invalid; in partial mode
+    valid items are created and invalid ones are reported.
+    """
+    items = request.data.get('expenses') if isinstance(request.data, dict) else None
+    mode = request.data.get('mode', 'atomic') if isinstance(request.data, dict) else 'atomic'
+    
+    # Validate request shape
+    if not isinstance(items, list) or not items:
+        return Response({
+            'error': 'expenses must be a non-empty list'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > BULK_CREATE_MAX_ITEMS:
+        return Response({
+            'error': f'At most {BULK_CREATE_MAX_ITEMS} expenses can be created at once'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if mode not in ('atomic', 'partial'):
+        return Response({
+            'error': 'mode must be either "atomic" or "partial"'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Load every referenced category owned by the user in one query
+    category_ids = set()
+    for item in items:
+        try:
+            category_ids.add(int(item.get('category')))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    category_map = Category.objects.for_user(request.user).filter(id__in=category_ids).in_bulk()
+    
+    # Validate every item
+    context = {'request': request, 'category_map': category_map}
+    expenses = []
+    errors = []
+    for index, item in enumerate(items):
+        serializer = ExpenseSerializer(data=item, context=context)
+        if serializer.is_valid():
+            expenses.append(Expense(user=request.user, **serializer.validated_data))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+    
+    if errors and (mode == 'atomic' or not expenses):
+        return Response({
+            'error': 'No expenses were created',
+            'errors': errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # bulk_create skips signals, so the rollup is updated explicitly
+    with atomic_for(request.user):
+        created = Expense.objects.bulk_create(expenses, batch_size=BULK_CREATE_BATCH_SIZE)
+        record_expenses_created(created)
+        bump_data_version(request.user.pk)
+    
+    return Response({
+        'message': f'{len(created)} expenses created successfully',
+        'created_count': len(created),
+        'failed_count': len(errors),
+        'errors': errors,
+        'expenses': ExpenseSerializer(created, many=True).data
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_expenses(request):
+    """
+    Import expenses from an uploaded CSV or NDJSON file.
+
+    The file is read as a stream and imported in chunks. Pass import_id to
+    resume an interrupted import with the same file.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({
+            'error': 'A file upload named "file" is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        file_format = detect_format(upload.name, request.data.get('format'))
+        chunk_size = int(request.data.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        if not 1 <= chunk_size <= IMPORT_MAX_CHUNK_SIZE:
+            raise ValueError
+    except ImportFileError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError:
+        return Response({
+            'error': f'chunk_size must be between 1 and {IMPORT_MAX_CHUNK_SIZE}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Resume an unfinished import or start a new one
+    import_id = request.data.get('import_id')
+    if import_id:
+        try:
+            import_id = int(import_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'import_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        job = get_object_or_404(
+            request.user.expense_imports.exclude(status=ExpenseImport.Status.COMPLETED), pk=import_id
+        )
+    else:
+        job = ExpenseImport.objects.create(user=request.user, source=upload.name, format=file_format)
+    
+    lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    try:
+        ExpenseImporter(job, chunk_size=chunk_size).run(iter_rows(lines, job.format))
+    except (ImportFileError, UnicodeDecodeError, csv.Error) as e:
+        return Response({
+            'error': f'Import stopped: {e}',
+            'import': ExpenseImportSerializer(job).data
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'message': f'{job.rows_created} expenses imported successfully',
+        'import': ExpenseImportSerializer(job).data
+    }, status=status.HTTP_200_OK if import_id else status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def import_status(request, pk):
+    """Get the progress of an expense import"""
+    job = get_object_or_404(request.user.expense_imports.all(), pk=pk)
+    return Response({
+        'message': 'Import retrieved successfully',
+        'import': ExpenseImportSerializer(job).data
+    }, status=status.HTTP_200_OK)
+
+
+class ExpenseDetailView(ExpandCategoryMixin, RetrieveUpdateDestroyAPIView):
     """View for retrieving, updating, and deleting a specific expense"""
     serializer_class = ExpenseSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         """Return expenses for the authenticated user"""
-        return self.request.user.expenses.all()
+        return self.get_expense_queryset()
     
     def get(self, request, *args, **kwargs):
         """Get a specific expense"""
@@ -197,84 +545,139 @@ class ExpenseDetailView(RetrieveUpdateDestroyAPIView):
         }, status=status.HTTP_200_OK)
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def custom_period_balance(request):
-    """Get balance and expenses for a custom date range"""
-    user = request.user
-    start_date_str = request.query_params.get('start_date')
-    end_date_str = request.query_params.get('end_date')
+def parse_period(query_params):
+    """
+    Read start_date and end_date (YYYY-MM-DD, inclusive) from the query string.
+
+    Returns (start_date, end_date) as dates; raises ValueError with the
+    message for the client.
+    """
+    start_date_str = query_params.get('start_date')
+    end_date_str = query_params.get('end_date')
     
     # Validate required parameters
     if not start_date_str or not end_date_str:
-        return Response({
-            'error': 'Both start_date and end_date parameters are required (YYYY-MM-DD format)'
-        }, status=status.HTTP_400_BAD_REQUEST)
+        raise ValueError('Both start_date and end_date parameters are required (YYYY-MM-DD format)')
     
     try:
-        # Parse dates
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-        
-        # Make them timezone-aware
-        start_date = timezone.make_aware(start_date)
-        end_date = timezone.make_aware(end_date)
-        
-        # Validate date order
-        if start_date > end_date:
-            return Response({
-                'error': 'start_date must be before or equal to end_date'
-            }, status=status.HTTP_400_BAD_REQUEST)
-            
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
     except ValueError:
-        return Response({
-            'error': 'Invalid date format. Use YYYY-MM-DD (e.g., 2024-01-15)'
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Get user's starting balance
-    starting_balance = user.profile.starting_balance
-    
-    # Calculate balance at start of period
-    expenses_before_period = user.expenses.filter(date__lt=start_date.date())
-    income_before = expenses_before_period.filter(category__type='income').aggregate(total=Sum('amount'))['total'] or 0
-    expenses_before = expenses_before_period.filter(category__type='expense').aggregate(total=Sum('amount'))['total'] or 0
-    balance_at_start = starting_balance + income_before - expenses_before
-    
-    # Calculate period expenses
-    period_expenses = user.expenses.filter(
-        date__gte=start_date.date(),
-        date__lte=end_date.date()
-    )
-    
-    period_income = period_expenses.filter(category__type='income').aggregate(total=Sum('amount'))['total'] or 0
-    period_expenses_amount = period_expenses.filter(category__type='expense').aggregate(total=Sum('amount'))['total'] or 0
-    period_net = period_income - period_expenses_amount
+        raise ValueError('Invalid date format. Use YYYY-MM-DD (e.g., 2024-01-15)')
     
-    # Calculate balance at end of period
-    balance_at_end = balance_at_start + period_net
-    
-    # Get transaction details for the period
-    income_transactions = period_expenses.filter(category__type='income').count()
-    expense_transactions = period_expenses.filter(category__type='expense').count()
-    
-    return Response({
+    # Validate date order
+    if start_date > end_date:
+        raise ValueError('start_date must be before or equal to end_date')
+    return start_date, end_date
+
+
+def period_balance_data(query_params, start_date, end_date, totals):
+    """Response body of the custom period balance from compute_period_balance() totals"""
+    return {
         'message': 'Custom period balance calculated successfully',
         'period': {
-            'start_date': start_date_str,
-            'end_date': end_date_str,
+            'start_date': query_params.get('start_date'),
+            'end_date': query_params.get('end_date'),
             'days': (end_date - start_date).days + 1
         },
         'balance': {
-            'balance_at_start_of_period': float(balance_at_start),
-            'balance_at_end_of_period': float(balance_at_end),
-            'change_during_period': float(period_net)
+            'balance_at_start_of_period': float(totals['balance_at_start']),
+            'balance_at_end_of_period': float(totals['balance_at_end']),
+            'change_during_period': float(totals['period_net'])
         },
         'period_summary': {
-            'total_income': float(period_income),
-            'total_expenses': float(period_expenses_amount),
-            'net_amount': float(period_net),
-            'income_transactions': income_transactions,
-            'expense_transactions': expense_transactions,
-            'total_transactions': period_expenses.count()
+            'total_income': float(totals['period_income']),
+            'total_expenses': float(totals['period_expenses']),
+            'net_amount': float(totals['period_net']),
+            'income_transactions': totals['income_transactions'],
+            'expense_transactions': totals['expense_transactions'],
+            'total_transactions': totals['total_transactions']
         }
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cache_user_response('balance')
+def custom_period_balance(request):
+    """Get balance and expenses for a custom date range"""
+    try:
+        start_date, end_date = parse_period(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    totals = compute_period_balance(request.user, start_date, end_date)
+    return Response(
+        period_balance_data(request.query_params, start_date, end_date, totals),
+        status=status.HTTP_200_OK
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def request_profiles(request):
+    """List the request profiles kept by this process, newest first"""
+    profiles = get_profile_buffer().latest()
+    return Response({
+        'message': 'Profiles retrieved successfully',
+        'profiles': [profile_summary(profile) for profile in profiles]
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def request_profile_detail(request, profile_id):
+    """Get a request profile with its hottest functions and queries"""
+    profile = get_profile_buffer().get(profile_id)
+    if profile is None:
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'message': 'Profile retrieved successfully',
+        'profile': profile
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def profiling_targets(request):
+    """
+    List the users whose next requests are profiled, or arm profiling for a user.
+
+    POST takes the user's id and optionally how many requests to profile
+    and for how many seconds; arming a user again replaces their target.
+    """
+    if request.method == 'GET':
+        targets = armed_targets().select_related('user', 'armed_by').order_by('expires_at')
+        return Response({
+            'message': 'Profiling targets retrieved successfully',
+            'targets': [target_summary(target) for target in targets]
+        }, status=status.HTTP_200_OK)
+
+    options = profiling_settings()
+    try:
+        user_id = int(request.data.get('user'))
+        requests = int(request.data.get('requests', options['ARM_REQUESTS']))
+        seconds = int(request.data.get('seconds', options['ARM_SECONDS']))
+    except (TypeError, ValueError):
+        return Response({'error': 'user, requests and seconds must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if requests < 1 or seconds < 1:
+        return Response({'error': 'requests and seconds must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    target = arm_profiling(user, request.user, requests, seconds)
+    return Response({
+        'message': 'Profiling armed successfully',
+        'target': target_summary(target)
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['DELETE'])
+@permission_classes([IsAdminUser])
+def profiling_target_detail(request, user_id):
+    """Stop profiling the requests of a user"""
+    disarm_profiling(user_id)
+    return Response({
+        'message': 'Profiling disarmed successfully'
     }, status=status.HTTP_200_OK)
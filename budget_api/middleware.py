@@ -0,0 +1,327 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+from .profiling import (
+    aarmed_users, armed_users, authenticated_user, claim_profile, profile_view, release_profile, staff_user,
+    wants_profile,
+)
+from .routers import replica_alias, replica_reads
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+PIN_COOKIE = 'primary_reads_until'
+
+REQUEST_TIMING_DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.1,  # Fraction of requests that are measured
+}
+
+timing_logger = logging.getLogger('budget_api.timing')
+budget_logger = logging.getLogger('budget_api.query_budget')
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve GET requests of settings.REPLICA_READ_VIEWS from the read replica.
+
+    After a successful write the caller is pinned to the primary for
+    REPLICA_PIN_SECONDS, so they always read their own writes while the
+    replica catches up. The pin is a cookie holding its expiry time: it
+    travels with the caller to whichever worker serves them next, and a
+    forged one only moves reads to the primary. The cached views also read
+    from the primary after any write of the user (see api.cache), which
+    covers clients that do not keep cookies.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if replica_alias() is None:
+            return self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            return self.pin(self.get_response(request))
+
+        if self.reads_from_replica(request):
+            with replica_reads():
+                return self.get_response(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if replica_alias() is None:
+            return await self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            return self.pin(await self.get_response(request))
+
+        if self.reads_from_replica(request):
+            with replica_reads():
+                return await self.get_response(request)
+        return await self.get_response(request)
+
+    @staticmethod
+    def pin(response):
+        """Pin the caller of a successful write to the primary"""
+        if response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time()) + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+    @staticmethod
+    def pinned(request):
+        """Whether the caller wrote less than REPLICA_PIN_SECONDS ago"""
+        try:
+            return int(request.COOKIES.get(PIN_COOKIE, 0)) >= time.time()
+        except ValueError:
+            return False
+
+    def reads_from_replica(self, request):
+        if request.method != 'GET' or self.pinned(request):
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return match.view_name in settings.REPLICA_READ_VIEWS
+
+
+def request_timing_settings():
+    return {**REQUEST_TIMING_DEFAULTS, **getattr(settings, 'REQUEST_TIMING', {})}
+
+
+class QueryTimer:
+    """Database execute wrapper counting queries and the time spent in them"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+@contextmanager
+def count_queries():
+    """Yield a QueryTimer counting the queries run on every database in the block"""
+    queries = QueryTimer()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(queries))
+        yield queries
+
+
+@asynccontextmanager
+async def acount_queries():
+    """
+    count_queries() for async code.
+
+    Connections are per thread and the ORM calls of async code run in a
+    worker thread, the same one for every thread-sensitive call of a
+    request, so the wrapper is installed there.
+    """
+    block = count_queries()
+    queries = await sync_to_async(block.__enter__)()
+    try:
+        yield queries
+    finally:
+        await sync_to_async(block.__exit__)(None, None, None)
+
+
+def query_budget(method, view_name):
+    """The most queries a request may run according to settings.QUERY_BUDGETS, or None"""
+    method = 'GET' if method == 'HEAD' else method
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(f'{method} {view_name}')
+
+
+class RequestTimingMiddleware:
+    """
+    Measure a sample of requests and report them in a Server-Timing header
+    and one JSON line on the budget_api.timing logger (at INFO level).
+
+    Reports the number of SQL queries on every database and their time, the
+    view time and, for DRF and template responses, the time spent rendering
+    (serializing) the response. Keep it last in MIDDLEWARE so the view time
+    does not include other middleware.
+
+    With settings.QUERY_BUDGET_WARNINGS, every request is counted and one
+    running more queries than its QUERY_BUDGETS entry logs a warning on the
+    budget_api.query_budget logger.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django calls the hooks in the handler's mode; sync ones would cost a thread hop
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    @staticmethod
+    def measured(request):
+        """Whether request is sampled or counted against its budget; marks it for the view hooks"""
+        options = request_timing_settings()
+        request._timing_sampled = options['ENABLED'] and random.random() < options['SAMPLE_RATE']
+        return request._timing_sampled or getattr(settings, 'QUERY_BUDGET_WARNINGS', False)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.measured(request):
+            return self.get_response(request)
+        start = time.perf_counter()
+        with count_queries() as queries:
+            response = self.get_response(request)
+        return self.report(request, response, queries, start)
+
+    async def __acall__(self, request):
+        if not self.measured(request):
+            return await self.get_response(request)
+        start = time.perf_counter()
+        async with acount_queries() as queries:
+            response = await self.get_response(request)
+        return self.report(request, response, queries, start)
+
+    def report(self, request, response, queries, start):
+        """Check the query budget and, for sampled requests, add the timings to the response and log"""
+        end = time.perf_counter()
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        budget = query_budget(request.method, view_name) if getattr(settings, 'QUERY_BUDGET_WARNINGS', False) else None
+        if budget is not None and queries.count > budget:
+            budget_logger.warning(
+                '%s %s (%s) ran %d queries, over its budget of %d',
+                request.method, request.path, view_name, queries.count, budget,
+            )
+        if not request._timing_sampled:
+            return response
+
+        timings = {'db': queries.seconds}
+        view_start = getattr(request, '_timing_view_start', None)
+        render_start = getattr(request, '_timing_render_start', None)
+        if view_start is not None:
+            timings['view'] = (render_start or end) - view_start
+        if getattr(request, '_timing_render_end', None) is not None:
+            timings['render'] = request._timing_render_end - render_start
+        timings['total'] = end - start
+
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={seconds * 1000:.2f}' + (f';desc="{queries.count} queries"' if name == 'db' else '')
+            for name, seconds in timings.items()
+        )
+        timing_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'queries': queries.count,
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in timings.items()},
+        }))
+        return response
+
+    @staticmethod
+    def view_started(request):
+        if getattr(request, '_timing_sampled', False):
+            request._timing_view_start = time.perf_counter()
+
+    def render_starts(self, request, response):
+        # Rendering follows right away; a DRF Response renders its data here
+        if hasattr(request, '_timing_view_start'):
+            request._timing_render_start = time.perf_counter()
+            response.add_post_render_callback(lambda response: self.rendered(request))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.view_started(request)
+
+    def process_template_response(self, request, response):
+        return self.render_starts(request, response)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.view_started(request)
+
+    async def aprocess_template_response(self, request, response):
+        return self.render_starts(request, response)
+
+    @staticmethod
+    def rendered(request):
+        request._timing_render_end = time.perf_counter()
+
+
+class RequestProfilingMiddleware:
+    """
+    Run the view of a request under cProfile when a staff user asks for it,
+    or when the request's user was armed for profiling by staff (see
+    budget_api.profiling). Keep it last in MIDDLEWARE; async views are not
+    profiled.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django calls process_view in the handler's mode; a sync one would cost a thread hop
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if iscoroutinefunction(view_func) or not (wants_profile(request) or await aarmed_users()):
+            return None
+        # Authenticating, claiming and the sync view itself all run in a worker thread anyway
+        return await sync_to_async(self.profile)(request, view_func, view_args, view_kwargs)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if iscoroutinefunction(view_func):
+            return None
+        return self.profile(request, view_func, view_args, view_kwargs)
+
+    @staticmethod
+    def profile(request, view_func, view_args, view_kwargs):
+        """The profiled response of a sync view, or None when the request is not profiled"""
+        if wants_profile(request):
+            user = staff_user(request)
+            if user is not None:
+                return profile_view(request, user, user.username, view_func, view_args, view_kwargs)
+        armed = armed_users()
+        # Only authenticate here while somebody is armed
+        if armed:
+            user = authenticated_user(request)
+            if user is not None and user.pk in armed and claim_profile(user.pk):
+                response = profile_view(request, user, armed[user.pk], view_func, view_args, view_kwargs)
+                if response is None:
+                    # cProfile was busy, so the claimed request goes back to the target
+                    release_profile(user.pk)
+                return response
+        return None
@@ -0,0 +1,324 @@
+"""
+On-demand profiling of single requests.
+
+A request carrying ?profile=1 or an "X-Profile: 1" header from an active
+staff user (authenticated like the DRF views) runs its view and rendering
+under cProfile. Staff can also arm profiling for another user through
+api:request-profile-target-list: the next requests that user makes are
+profiled wherever they land, and the profile records who asked for it.
+The hottest functions and the SQL of every query are kept in a bounded
+in-memory ring buffer per process, read through the
+api:request-profile-list and api:request-profile-detail endpoints. Query
+parameters are not stored, only the SQL with its placeholders.
+"""
+import cProfile
+import pstats
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import timedelta
+from contextlib import ExitStack
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+DEFAULTS = {
+    'ENABLED': True,
+    'QUERY_PARAM': 'profile',
+    'HEADER': 'X-Profile',
+    'BUFFER_SIZE': 50,  # Profiles kept, the oldest is dropped first
+    'TOP_FUNCTIONS': 30,
+    'MAX_QUERIES': 500,  # Queries listed per profile; all are counted
+    'ARM_REQUESTS': 10,  # Requests of an armed user that are profiled by default
+    'ARM_SECONDS': 600,  # How long an arming lasts by default
+    'ARM_REFRESH': 5,  # Seconds each process keeps its copy of the armed users; None: until armed locally
+}
+
+SUMMARY_FIELDS = [
+    'id', 'created_at', 'user', 'requested_by', 'method', 'path', 'view', 'status', 'duration_ms', 'query_count',
+]
+
+
+def profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_PROFILING', {})}
+
+
+class ProfileBuffer:
+    """Thread-safe ring buffer of the latest request profiles"""
+
+    def __init__(self, size):
+        self.profiles = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, profile):
+        with self.lock:
+            self.profiles.append(profile)
+
+    def latest(self):
+        """Profiles newest first"""
+        with self.lock:
+            return list(reversed(self.profiles))
+
+    def get(self, profile_id):
+        with self.lock:
+            return next((profile for profile in self.profiles if profile['id'] == profile_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.profiles.clear()
+
+
+_profile_buffer = None
+
+
+def get_profile_buffer():
+    """The process-wide profile buffer, sized by settings.REQUEST_PROFILING"""
+    global _profile_buffer
+    if _profile_buffer is None:
+        _profile_buffer = ProfileBuffer(profiling_settings()['BUFFER_SIZE'])
+    return _profile_buffer
+
+
+class ProfilingTargets:
+    """
+    In-process copy of the armed ProfilingTarget rows.
+
+    Like budget_api.sharding.ShardAssignments, the few armed rows are
+    loaded at once and reloaded every ARM_REFRESH seconds, so requests of
+    users nobody armed run no query. Local arming and disarming update the
+    copy right away. A new process starts out empty and sees armings
+    within ARM_REFRESH.
+    """
+
+    def __init__(self):
+        self.requested_by = {}
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def due(self):
+        """Whether the next get() reloads from the database"""
+        refresh = profiling_settings()['ARM_REFRESH']
+        return refresh is not None and time.monotonic() - self.loaded_at >= refresh
+
+    def get(self, reload=True):
+        """{user id: username of the staff user who armed it} of the armed users"""
+        with self.lock:
+            if reload and self.due():
+                self.requested_by = dict(armed_targets().values_list('user_id', 'armed_by__username'))
+                self.loaded_at = time.monotonic()
+            return self.requested_by
+
+    def set(self, user_id, requested_by):
+        with self.lock:
+            self.requested_by = {**self.requested_by, user_id: requested_by}
+
+    def discard(self, user_id):
+        with self.lock:
+            self.requested_by = {key: value for key, value in self.requested_by.items() if key != user_id}
+
+    def reset(self):
+        """Forget every armed user until the next reload"""
+        with self.lock:
+            self.requested_by = {}
+            self.loaded_at = time.monotonic()
+
+
+_profiling_targets = ProfilingTargets()
+
+
+@receiver(setting_changed)
+def reset_profile_buffer(setting, **kwargs):
+    global _profile_buffer
+    if setting == 'REQUEST_PROFILING':
+        _profile_buffer = None
+        _profiling_targets.reset()
+
+
+def armed_targets():
+    """ProfilingTarget rows with requests left to profile"""
+    from accounts.models import ProfilingTarget
+    return ProfilingTarget.objects.using(DEFAULT_DB_ALIAS).filter(remaining__gt=0, expires_at__gt=timezone.now())
+
+
+def armed_users():
+    """{user id: username of the staff user who armed it} of the users whose requests are profiled"""
+    return _profiling_targets.get() if profiling_settings()['ENABLED'] else {}
+
+
+async def aarmed_users():
+    """Async armed_users(); only a due reload goes to a worker thread"""
+    if not profiling_settings()['ENABLED']:
+        return {}
+    if _profiling_targets.due():
+        return await sync_to_async(_profiling_targets.get)()
+    return _profiling_targets.get(reload=False)
+
+
+def arm_profiling(user, requested_by, requests, seconds):
+    """Profile the next `requests` requests user makes within `seconds`; returns the ProfilingTarget"""
+    from accounts.models import ProfilingTarget
+    target, _ = ProfilingTarget.objects.update_or_create(user=user, defaults={
+        'remaining': requests,
+        'expires_at': timezone.now() + timedelta(seconds=seconds),
+        'armed_by': requested_by,
+    })
+    _profiling_targets.set(user.pk, requested_by.username)
+    return target
+
+
+def disarm_profiling(user_id):
+    from accounts.models import ProfilingTarget
+    ProfilingTarget.objects.filter(user_id=user_id).delete()
+    _profiling_targets.discard(user_id)
+
+
+def claim_profile(user_id):
+    """
+    Take one of the requests armed for a user; False when none is left.
+
+    The count goes down in one conditional UPDATE, so all the processes
+    together profile at most the armed number of requests.
+    """
+    claimed = armed_targets().filter(user_id=user_id).update(remaining=F('remaining') - 1)
+    if not claimed:
+        # Used up or expired, possibly through another process
+        _profiling_targets.discard(user_id)
+    return bool(claimed)
+
+
+def release_profile(user_id):
+    """Give back a request taken with claim_profile() that was not profiled after all"""
+    from accounts.models import ProfilingTarget
+    ProfilingTarget.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).update(remaining=F('remaining') + 1)
+
+
+def target_summary(target):
+    return {
+        'user': target.user.username,
+        'remaining': target.remaining,
+        'expires_at': target.expires_at.isoformat(),
+        'requested_by': target.armed_by.username if target.armed_by else None,
+    }
+
+
+def profile_summary(profile):
+    return {field: profile.get(field) for field in SUMMARY_FIELDS}
+
+
+def wants_profile(request):
+    options = profiling_settings()
+    return options['ENABLED'] and (
+        request.GET.get(options['QUERY_PARAM']) == '1' or request.headers.get(options['HEADER']) == '1'
+    )
+
+
+def authenticated_user(request):
+    """The request's active user, authenticated the way the DRF views do, or None"""
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = drf_request.user
+    except exceptions.APIException:
+        return None
+    return user if user.is_active else None
+
+
+def staff_user(request):
+    """The request's user if they are active staff"""
+    user = authenticated_user(request)
+    return user if user is not None and user.is_staff else None
+
+
+class QueryLog:
+    """Database execute wrapper listing the queries of a request with their time"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            if len(self.queries) < self.limit:
+                self.queries.append({
+                    'database': context['connection'].alias,
+                    'sql': sql,
+                    'many': many,
+                    'time_ms': round((time.perf_counter() - start) * 1000, 3),
+                })
+
+
+def top_functions(profiler, limit):
+    """The functions with the most own time, with their calls and cumulative time"""
+    functions = [
+        {
+            'function': pstats.func_std_string(function),
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        }
+        for function, (primitive_calls, calls, own, cumulative, callers) in pstats.Stats(profiler).stats.items()
+    ]
+    functions.sort(key=lambda function: function['own_ms'], reverse=True)
+    return functions[:limit]
+
+
+def profile_view(request, user, requested_by, view_func, view_args, view_kwargs):
+    """
+    Call and render the view of user's request under cProfile, store its profile and return the response.
+
+    requested_by is the username of the staff user who asked for the
+    profile. Returns None, leaving the request to run unprofiled, when
+    another profiler is already active: from Python 3.12 on only one can
+    run per process.
+    """
+    options = profiling_settings()
+    profiler = cProfile.Profile()
+    queries = QueryLog(options['MAX_QUERIES'])
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(queries))
+            response = view_func(request, *view_args, **view_kwargs)
+            # DRF renders after the view returns; count that as part of the request
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+    finally:
+        profiler.disable()
+    duration = time.perf_counter() - start
+
+    match = request.resolver_match
+    profile = {
+        'id': uuid.uuid4().hex,
+        'created_at': timezone.now().isoformat(),
+        'user': user.username,
+        'requested_by': requested_by,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match else None,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 2),
+        'query_count': queries.count,
+        'functions': top_functions(profiler, options['TOP_FUNCTIONS']),
+        'queries': queries.queries,
+    }
+    get_profile_buffer().add(profile)
+    response['X-Profile-Id'] = profile['id']
+    return response
@@ -0,0 +1,101 @@
+"""
+Database routing.
+
+ShardRouter sends the per-user models to their user's shard (see
+budget_api.sharding) and leaves everything else to PrimaryReplicaRouter,
+so it has to come first in DATABASE_ROUTERS.
+
+Reads go to the replica only inside replica_reads(), which the
+ReplicaRoutingMiddleware enters for GET requests to the views listed in
+settings.REPLICA_READ_VIEWS. Everything else, including every write, goes
+to the primary. With sharding enabled the sharded models are always read
+from their shard.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from .sharding import is_sharded, shard_for, sharding_enabled
+
+
+# Authentication reads must see tokens and users created moments ago
+PRIMARY_ONLY_APPS = {'admin', 'auth', 'authtoken', 'accounts', 'contenttypes', 'sessions'}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_alias():
+    """The configured replica alias, or None when no replica is set up"""
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def replica_reads():
+    """Send reads of the enclosed code to the replica"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Send reads of the enclosed code to the primary, even inside replica_reads()"""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reading_from_replica():
+    return _replica_reads.get() and replica_alias() is not None
+
+
+class PrimaryReplicaRouter:
+    """Route reads inside replica_reads() to the replica and everything else to the primary"""
+
+    def __init__(self, replica=None):
+        self.replica = replica
+
+    def get_replica(self):
+        return self.replica or replica_alias()
+
+    def db_for_read(self, model, **hints):
+        replica = self.get_replica()
+        if replica and _replica_reads.get() and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            return replica
+        # Explicit so related lookups on replica-loaded instances do not stay on the replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds a copy of the primary's data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives its schema through replication
+        return db != self.get_replica()
+
+
+class ShardRouter:
+    """Route the per-user models by the user of the instance in the hints"""
+
+    def shard(self, model, **hints):
+        if not sharding_enabled() or not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, get_user_model()):
+            # Related managers of a user, e.g. user.expenses
+            return shard_for(instance.pk)
+        user_id = getattr(instance, 'user_id', None)
+        # Querysets without a user (e.g. the admin) fall through to the default database
+        return None if user_id is None else shard_for(user_id)
+
+    db_for_read = shard
+    db_for_write = shard
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,6 +52,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'budget_api.middleware.ReplicaRoutingMiddleware',
+    'budget_api.middleware.RequestTimingMiddleware',
+    'budget_api.middleware.RequestProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'budget_api.urls'
@@ -83,6 +87,128 @@ DATABASES = {
     }
 }
 
+# Optional read replica, e.g. REPLICA_DATABASE=db-replica.sqlite3 kept in sync
+# by `manage.py replicate_database --interval 1` for local testing
+if os.environ.get('REPLICA_DATABASE'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / os.environ['REPLICA_DATABASE'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# User-sharded storage: the per-user tables are spread over SHARD_DATABASES by
+# a stable hash of the user id (see budget_api/sharding.py). SHARDS=3 uses
+# default, shard_1 and shard_2; migrate each one with `migrate --database`.
+SHARD_COUNT = max(int(os.environ.get('SHARDS', '1')), 1)
+for index in range(1, SHARD_COUNT):
+    DATABASES[f'shard_{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db-shard-{index}.sqlite3',
+    }
+
+SHARD_DATABASES = ['default'] + [f'shard_{index}' for index in range(1, SHARD_COUNT)]
+
+# The shard router only handles the sharded models and must come first
+DATABASE_ROUTERS = ['budget_api.routers.ShardRouter', 'budget_api.routers.PrimaryReplicaRouter']
+
+REPLICA_DATABASE_ALIAS = 'replica'
+
+# GET requests to these views read from the replica when one is configured
+REPLICA_READ_VIEWS = [
+    'api:category-list-create',
+    'api:category-detail',
+    'api:expense-list-create',
+    'api:expense-detail',
+    'api:expense-breakdown',
+    'api:custom-period-balance',
+    'api:async-category-list',
+    'api:async-expense-list',
+    'api:async-custom-period-balance',
+]
+
+# Seconds a caller reads from the primary after writing; must exceed the replica lag
+REPLICA_PIN_SECONDS = 5
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'budget-api',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Per-user GET response cache, invalidated by bumping a per-user data version.
+# The version lives in the database (api.DataVersion), so every worker sees a
+# bump; a per-process cache only costs hits, never serves stale responses.
+RESPONSE_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+# Server-Timing header and budget_api.timing log line for a sample of requests
+REQUEST_TIMING = {
+    'ENABLED': True,
+    'SAMPLE_RATE': float(os.environ.get('REQUEST_TIMING_SAMPLE_RATE', 0.1)),
+}
+
+# Staff can profile a request with ?profile=1 or an "X-Profile: 1" header, or
+# arm profiling for the next requests of a user (api:request-profile-target-list);
+# the latest BUFFER_SIZE profiles are kept in memory per process
+REQUEST_PROFILING = {
+    'ENABLED': True,
+    'QUERY_PARAM': 'profile',
+    'HEADER': 'X-Profile',
+    'BUFFER_SIZE': 50,
+    'TOP_FUNCTIONS': 30,
+}
+
+# Most SQL queries a request may run, keyed by "<METHOD> <view name>". Checked
+# for every route at two data sizes by api.tests.QueryBudgetTestCase; with
+# QUERY_BUDGET_WARNINGS a request over budget logs a warning at runtime.
+# Bulk create and import run a fixed number of queries whatever the number of
+# rows, and are checked with 5 rows and with 50 and 100. Balances are checked
+# with the user's monthly checkpoints in place; filling them in is tested apart.
+QUERY_BUDGETS = {
+    'GET api:category-list-create': 2,
+    'POST api:category-list-create': 2,
+    'GET api:category-detail': 1,
+    'PUT api:category-detail': 4,
+    'DELETE api:category-detail': 9,
+    'GET api:category-types': 0,
+    'GET api:expense-list-create': 1,
+    'POST api:expense-list-create': 12,
+    'POST api:expense-bulk-create': 13,
+    'GET api:expense-export-csv': 7,
+    'GET api:expense-breakdown': 1,
+    'POST api:expense-import': 15,
+    'GET api:expense-import-status': 1,
+    'GET api:expense-detail': 1,
+    'PUT api:expense-detail': 9,
+    'DELETE api:expense-detail': 10,
+    'GET api:custom-period-balance': 2,
+    'GET api:async-category-list': 1,
+    'GET api:async-expense-list': 1,
+    'GET api:async-custom-period-balance': 2,
+    'GET auth_info': 0,
+    'POST register': 12,
+    'POST login': 3,
+    'POST logout': 4,
+    'GET profile': 0,
+    'POST token_obtain': 1,
+    'POST token_refresh': 7,
+    'POST token_revoke': 4,
+    'GET api:request-profile-list': 1,
+    'GET api:request-profile-detail': 1,
+    'GET api:request-profile-target-list': 1,
+    'POST api:request-profile-target-list': 7,
+    'DELETE api:request-profile-target-detail': 3,
+}
+QUERY_BUDGET_WARNINGS = os.environ.get('QUERY_BUDGET_WARNINGS') == '1'
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,6 +254,25 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
+        'accounts.authentication.SignedTokenAuthentication',
     ],
 }
+
+# Token -> user cache used by CachedTokenAuthentication. Entries are dropped
+# on logout and on User/UserProfile saves; changes that bypass signals
+# (queryset.update()) or happen in another process are seen after TTL seconds.
+AUTH_TOKEN_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 60,
+    'SHARED_CACHE_ALIAS': None,
+    'SHARED_TTL': 300,
+}
+
+# Signed access/refresh tokens (lifetimes in seconds). Revoked token ids are
+# reloaded from the database every DENYLIST_REFRESH seconds.
+SIGNED_TOKENS = {
+    'ACCESS_LIFETIME': 300,
+    'REFRESH_LIFETIME': 7 * 24 * 3600,
+    'DENYLIST_REFRESH': 5,
+}
@@ -0,0 +1,235 @@
+"""
+User-sharded storage.
+
+The per-user tables (SHARDED_MODELS) are partitioned across
+settings.SHARD_DATABASES. A user's rows live on shard_for(user): the
+database of their ShardAssignment when there is one, otherwise the one
+picked by a stable hash of the user id. Users, tokens and every other
+table stay on the default database, and each shard keeps an id-only stub
+of its users so foreign keys hold.
+
+Every query of a sharded model is scoped to one user, which ShardRouter
+uses to pick the database: related managers (user.expenses) and instances
+carry their user, unscoped querysets go through UserShardedManager's
+for_user(). With a single database in SHARD_DATABASES nothing changes.
+"""
+import hashlib
+import threading
+import time
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models.deletion import Collector
+from django.dispatch import receiver
+
+
+# Copied in this order when a user moves, so foreign keys resolve on the target
+SHARDED_MODELS = [
+    'accounts.userprofile',
+    'api.category',
+    'api.expenseimport',
+    'api.expense',
+    'api.dailybalance',
+    'api.monthlybalance',
+    'api.dataversion',
+]
+
+# Ids handed out by the n-th database of settings.DATABASES (not counting the
+# replica) start at n * SHARD_ID_SPACE, so rows keep their ids when their
+# user moves to another shard
+SHARD_ID_SPACE = 10 ** 12
+
+# Seconds another process may keep routing a moved user to their old shard
+ASSIGNMENT_REFRESH = 5
+
+
+def shard_databases():
+    return list(getattr(settings, 'SHARD_DATABASES', None) or [DEFAULT_DB_ALIAS])
+
+
+def sharding_enabled():
+    return len(shard_databases()) > 1
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def _user_id(user):
+    return getattr(user, 'pk', user)
+
+
+def hashed_shard(user, shards=None):
+    """The database a stable hash of the user id picks out of shards"""
+    shards = shards or shard_databases()
+    digest = hashlib.sha256(str(_user_id(user)).encode()).digest()
+    return shards[int.from_bytes(digest[:8], 'big') % len(shards)]
+
+
+class ShardAssignments:
+    """
+    In-process copy of the ShardAssignment table.
+
+    Assignments only exist for moved users, so the whole table is loaded
+    at once and reloaded every `refresh` seconds, or right away after a
+    local change.
+    """
+
+    def __init__(self, refresh=ASSIGNMENT_REFRESH):
+        self.refresh = refresh
+        self.databases = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.refresh:
+                from accounts.models import ShardAssignment
+                self.databases = dict(
+                    ShardAssignment.objects.using(DEFAULT_DB_ALIAS).values_list('user_id', 'database')
+                )
+                self.loaded_at = time.monotonic()
+            return self.databases.get(user_id)
+
+    def clear(self):
+        with self.lock:
+            self.loaded_at = None
+
+
+_assignments = ShardAssignments()
+
+
+def clear_shard_assignments():
+    _assignments.clear()
+
+
+@receiver(setting_changed)
+def reset_shard_assignments(setting, **kwargs):
+    if setting == 'SHARD_DATABASES':
+        clear_shard_assignments()
+
+
+def shard_for(user):
+    """Database holding the sharded rows of user (a User or a user id)"""
+    shards = shard_databases()
+    if len(shards) == 1:
+        return shards[0]
+    user_id = _user_id(user)
+    return _assignments.get(user_id) or hashed_shard(user_id, shards)
+
+
+def atomic_for(user):
+    """transaction.atomic() on the shard of user"""
+    return transaction.atomic(using=shard_for(user))
+
+
+class UserShardedQuerySet(models.QuerySet):
+    """QuerySet of a per-user model that sends single-user writes to the user's shard"""
+
+    def for_user(self, user):
+        """The rows of user, read from their shard"""
+        queryset = self.filter(user_id=_user_id(user))
+        if sharding_enabled() and self._db is None:
+            queryset = queryset.using(shard_for(user))
+        return queryset
+
+    def _routed(self, user_ids):
+        if self._db is None and sharding_enabled() and len(user_ids) == 1:
+            return self.using(shard_for(next(iter(user_ids))))
+        return self
+
+    def create(self, **kwargs):
+        user = kwargs.get('user', kwargs.get('user_id'))
+        queryset = self._routed({_user_id(user)} if user is not None else set())
+        return super(UserShardedQuerySet, queryset).create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        queryset = self._routed({obj.user_id for obj in objs})
+        return super(UserShardedQuerySet, queryset).bulk_create(objs, *args, **kwargs)
+
+
+UserShardedManager = models.Manager.from_queryset(UserShardedQuerySet)
+
+
+def ensure_user_stub(user, database=None):
+    """
+    Insert an id-only copy of user on their shard so the sharded tables' foreign keys hold.
+
+    The stub never authenticates anybody: the real user row stays on the
+    default database and is what every User query reads.
+    """
+    database = database or shard_for(user)
+    if database == DEFAULT_DB_ALIAS:
+        return
+    stub = type(user)(pk=user.pk, username=f'user-{user.pk}', date_joined=user.date_joined)
+    stub.set_unusable_password()
+    # bulk_create skips the User signals, which would provision the stub like a new user
+    type(user).objects.using(database).bulk_create([stub], ignore_conflicts=True)
+
+
+def reserve_id_range(database):
+    """
+    Start the sharded tables' ids on database at its SHARD_ID_SPACE offset.
+
+    Only SQLite is handled; elsewhere the sequences have to be set up by hand.
+    """
+    connection = connections[database]
+    replica = getattr(settings, 'REPLICA_DATABASE_ALIAS', None)
+    offset = [alias for alias in settings.DATABASES if alias != replica].index(database) * SHARD_ID_SPACE
+    if not offset or connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for label in SHARDED_MODELS:
+            table = apps.get_model(label)._meta.db_table
+            cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s', [offset, table, offset])
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                [table, offset, table]
+            )
+
+
+def assign_shard(user, database):
+    """Record where user's rows live, dropping the override when the hash agrees"""
+    from accounts.models import ShardAssignment
+    if database == hashed_shard(user):
+        ShardAssignment.objects.filter(user_id=_user_id(user)).delete()
+    else:
+        ShardAssignment.objects.update_or_create(user_id=_user_id(user), defaults={'database': database})
+    clear_shard_assignments()
+
+
+def move_user(user, source, target):
+    """
+    Move every sharded row of user from source to target and return how many were moved.
+
+    Rows are copied as they are (ids and timestamps included, like loaddata)
+    in one transaction on target, then the user is assigned to target and
+    the rows are deleted from source. Writes the user makes while the move
+    runs can be lost, so move users while they are inactive.
+    """
+    if source == target:
+        return 0
+    ensure_user_stub(user, target)
+    moved = 0
+    with transaction.atomic(using=target):
+        for label in SHARDED_MODELS:
+            model = apps.get_model(label)
+            for row in model._base_manager.using(source).filter(user_id=user.pk).order_by('pk').iterator():
+                row.save_base(using=target, raw=True, force_insert=True)
+                moved += 1
+
+    assign_shard(user, target)
+
+    if source != DEFAULT_DB_ALIAS:
+        # Deleting the stub cascades to every row of the user
+        type(user).objects.using(source).filter(pk=user.pk).delete()
+    else:
+        # Started from the user, so the ledger and cache receivers leave the rows alone
+        collector = Collector(using=source, origin=user)
+        for label in SHARDED_MODELS:
+            collector.collect(apps.get_model(label)._base_manager.using(source).filter(user_id=user.pk))
+        collector.delete()
+    return moved
@@ -0,0 +1,17 @@
+"""
+Settings for `manage.py test`: the project settings plus the shard databases
+api.tests.ShardingTestCase spreads users over, whatever SHARDS is set to,
+and no periodic reload of the users armed for profiling.
+"""
+from .settings import *
+from .settings import BASE_DIR, DATABASES, REQUEST_PROFILING
+
+for index in (1, 2):
+    DATABASES.setdefault(f'shard_{index}', {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db-shard-{index}.sqlite3',
+    })
+
+# Arming in the test process still applies right away; a reload from the
+# database would otherwise land in whichever test is counting queries
+REQUEST_PROFILING = {**REQUEST_PROFILING, 'ARM_REFRESH': None}
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'budget_api.settings')
+    # The test suite also needs the shard databases the sharding tests spread users over
+    default_settings = 'budget_api.test_settings' if sys.argv[1:2] == ['test'] else 'budget_api.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default_settings)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: